@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import asyncio
+import threading
+import os
+
+
+class PayloadCache:
+    # (user_id, project_id) -> (version, serialized payload), LRU-bounded by
+    # entry count and total payload bytes. An entry only answers requests that
+    # read the same project version, so writes from other workers are never
+    # served stale; local writes also drop the entry right away.
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[int, int], tuple[int, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._inflight: dict[tuple[tuple[int, int], int], asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    async def get_or_load(self, key: tuple[int, int], version: int, load) -> bytes:
+        # load() is awaited at most once per (key, version) at a time; other
+        # misses for it wait on the same task instead of querying again
+        if not self.enabled:
+            return await load()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+            self._stats["misses"] += 1
+            if entry is not None:
+                self._stats["stale"] += 1
+
+        flight = (key, version)
+        task = self._inflight.get(flight)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, version, load))
+            self._inflight[flight] = task
+            task.add_done_callback(lambda t: self._landed(flight, t))
+        else:
+            self._stats["coalesced"] += 1
+        # shielded: one caller giving up does not cancel the load for the rest
+        return await asyncio.shield(task)
+
+    async def _load(self, key: tuple[int, int], version: int, load) -> bytes:
+        payload = await load()
+        self.put(key, version, payload)
+        return payload
+
+    def _landed(self, flight, task: asyncio.Task) -> None:
+        self._inflight.pop(flight, None)
+        # retrieve the outcome so a load nobody waits for anymore is not
+        # reported as an unhandled exception
+        if not task.cancelled():
+            task.exception()
+
+    def put(self, key: tuple[int, int], version: int, payload: bytes) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                if previous[0] > version:
+                    # a newer version landed first
+                    self._entries[key] = previous
+                    return
+                self._bytes -= len(previous[1])
+            self._entries[key] = (version, payload)
+            self._bytes += len(payload)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key: tuple[int, int]) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= len(entry[1])
+                self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "inflight": len(self._inflight),
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else None,
+            }
+
+
+project_cache = PayloadCache(
+    max_entries=int(os.getenv("PROJECT_CACHE_SIZE", "1000")),
+    max_bytes=int(os.getenv("PROJECT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+)
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import sqlite3
+import os
+
+from app.labels import labels_for_tasks
+from app.writer import run_write
+
+
+logger = logging.getLogger(__name__)
+
+CHANGE_LOG_RETENTION = timedelta(days=float(os.getenv("CHANGE_LOG_RETENTION_DAYS", "7")))
+CHANGE_LOG_COMPACT_INTERVAL = float(os.getenv("CHANGE_LOG_COMPACT_INTERVAL", "600"))
+CHANGE_LOG_COMPACT_BATCH = int(os.getenv("CHANGE_LOG_COMPACT_BATCH", "1000"))
+
+
+# -------- Feed --------
+def change_horizon(con: sqlite3.Connection) -> int:
+    (seq,) = con.execute("SELECT seq FROM change_log_horizon WHERE id = 1").fetchone()
+    return seq
+
+
+def latest_seq(con: sqlite3.Connection) -> int:
+    # the horizon counts too: after expiry the log may be empty
+    (seq,) = con.execute(
+        """
+        SELECT MAX(
+            COALESCE((SELECT MAX(seq) FROM change_log), 0),
+            (SELECT seq FROM change_log_horizon WHERE id = 1)
+        )
+        """
+    ).fetchone()
+    return seq
+
+
+def hydrate(con: sqlite3.Connection, user_id: int, entity: str, ids: list[int]) -> dict[int, dict]:
+    if not ids:
+        return {}
+    q_marks = ",".join("?" for _ in ids)
+    cur = con.cursor()
+    if entity == "project":
+        cur.execute(
+            f"""
+            SELECT id, title, short_description, description, github, website, status
+              FROM project WHERE id IN ({q_marks}) AND user_id = ?
+            """,
+            (*ids, user_id),
+        )
+        return {row["id"]: dict(row) for row in cur.fetchall()}
+    if entity == "task":
+        cur.execute(f"SELECT id, project_id, title, desc, status FROM task WHERE id IN ({q_marks})", ids)
+        rows = cur.fetchall()
+        labels = labels_for_tasks(con, [row["id"] for row in rows])
+        return {row["id"]: {**dict(row), "labels": labels[row["id"]]} for row in rows}
+    cur.execute(f"SELECT id, project_id, body FROM note WHERE id IN ({q_marks})", ids)
+    return {row["id"]: {"id": row["id"], "project_id": row["project_id"], "desc": row["body"]} for row in cur.fetchall()}
+
+
+def read_changes(con: sqlite3.Connection, user_id: int, since: int, limit: int) -> dict:
+    if since < change_horizon(con):
+        # the history after this cursor has been compacted away
+        return {"resync": True, "cursor": latest_seq(con), "has_more": False, "changes": []}
+
+    # only the latest entry per entity matters; older ones are superseded
+    cur = con.cursor()
+    cur.execute(
+        """
+        SELECT seq, entity, entity_id, project_id, op
+          FROM change_log
+         WHERE seq IN (
+            SELECT MAX(seq) FROM change_log
+             WHERE user_id = ? AND seq > ?
+             GROUP BY entity, entity_id
+         )
+         ORDER BY seq ASC
+         LIMIT ?
+        """,
+        (user_id, since, limit + 1),
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    current = {
+        entity: hydrate(con, user_id, entity, [r["entity_id"] for r in rows if r["entity"] == entity and r["op"] == "upsert"])
+        for entity in ("project", "task", "note")
+    }
+
+    changes = []
+    for row in rows:
+        data = current[row["entity"]].get(row["entity_id"]) if row["op"] == "upsert" else None
+        change = {
+            "op": "upsert" if data is not None else "delete",
+            "entity": row["entity"],
+            "id": row["entity_id"],
+            "project_id": row["project_id"],
+        }
+        if data is not None:
+            change["data"] = data
+        changes.append(change)
+
+    return {
+        "resync": False,
+        "cursor": rows[-1]["seq"] if rows else since,
+        "has_more": has_more,
+        "changes": changes,
+    }
+
+
+# -------- Compaction --------
+def drop_superseded(con: sqlite3.Connection, after: int, batch_size: int) -> tuple[int, int | None]:
+    # an entry with a newer entry for the same entity is never returned, so
+    # removing it leaves every cursor valid. Walks the log in seq order,
+    # batch_size entries per call, so a full pass is linear in its size;
+    # returns the rows deleted and the seq to continue after (None at the end).
+    # Like expire_changes it does not commit: compact_once runs both through
+    # run_write, compact_shard commits on the shard's own connection.
+    cur = con.cursor()
+    cur.execute(
+        "SELECT MAX(seq) FROM (SELECT seq FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?)",
+        (after, batch_size),
+    )
+    (upto,) = cur.fetchone()
+    if upto is None:
+        return 0, None
+    cur.execute(
+        """
+        DELETE FROM change_log AS c
+         WHERE c.seq > ? AND c.seq <= ?
+           AND EXISTS (
+            SELECT 1 FROM change_log AS d
+             WHERE d.entity = c.entity AND d.entity_id = c.entity_id AND d.seq > c.seq
+         )
+        """,
+        (after, upto),
+    )
+    return cur.rowcount, upto
+
+
+def expire_changes(con: sqlite3.Connection, cutoff: datetime, batch_size: int) -> int:
+    # dropping old entries moves the horizon; older cursors must resync
+    cur = con.cursor()
+    cur.execute(
+        """
+        SELECT MAX(seq) FROM (
+            SELECT seq FROM change_log WHERE changed_at < ? ORDER BY changed_at ASC, seq ASC LIMIT ?
+        )
+        """,
+        (cutoff.isoformat(), batch_size),
+    )
+    (upto,) = cur.fetchone()
+    if upto is None:
+        return 0
+    cur.execute("DELETE FROM change_log WHERE seq <= ?", (upto,))
+    deleted = cur.rowcount
+    cur.execute("UPDATE change_log_horizon SET seq = MAX(seq, ?) WHERE id = 1", (upto,))
+    return deleted
+
+
+async def compact_once(batch_size: int = CHANGE_LOG_COMPACT_BATCH) -> int:
+    total = 0
+    after = 0
+    while after is not None:
+        deleted, after = await run_write(drop_superseded, after, batch_size)
+        total += deleted
+        if deleted:
+            await asyncio.sleep(0.05)
+    cutoff = datetime.utcnow() - CHANGE_LOG_RETENTION
+    while True:
+        deleted = await run_write(expire_changes, cutoff, batch_size)
+        total += deleted
+        if deleted < batch_size:
+            break
+        await asyncio.sleep(0.05)
+    return total
+
+
+async def change_log_compactor(interval: float = CHANGE_LOG_COMPACT_INTERVAL, compact=compact_once) -> None:
+    while True:
+        try:
+            deleted = await compact()
+            if deleted:
+                logger.info("Compacted %d change log entries", deleted)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Change log compaction failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,550 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+import asyncio
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+import os
+
+
+# pragmas applied once when a connection is opened
+def connection_pragmas() -> list[str]:
+    return [
+        # first, so workers starting together wait for each other's lock
+        # instead of failing the journal_mode switch below
+        f"PRAGMA busy_timeout = {int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))};",
+        # must precede journal_mode so it applies to a fresh file; existing files
+        # are converted by `python -m app.maintenance vacuum`
+        "PRAGMA auto_vacuum = INCREMENTAL;",
+        "PRAGMA foreign_keys = ON;",
+        # WAL lets readers in every worker run alongside the one writer
+        "PRAGMA journal_mode = WAL;",
+        "PRAGMA synchronous = NORMAL;",
+        # negative cache_size is in KiB
+        f"PRAGMA cache_size = -{int(os.getenv('DB_CACHE_SIZE_KB', '8192'))};",
+        f"PRAGMA mmap_size = {int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))};",
+    ]
+
+
+def open_connection(db_path: str | None = None) -> sqlite3.Connection:
+    db_path = db_path or os.getenv("DB_PATH", "projects.db")
+    con = sqlite3.connect(db_path, check_same_thread=False)
+    con.row_factory = sqlite3.Row
+    for pragma in connection_pragmas():
+        con.execute(pragma)
+    return con
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# -------- Busy retries --------
+# busy_timeout covers most lock waits, but a read transaction that has to
+# upgrade to a write (or a checkpoint in another process) fails at once with
+# SQLITE_BUSY. Those are retried with jittered exponential backoff.
+BUSY_RETRIES = int(os.getenv("DB_BUSY_RETRIES", "5"))
+BUSY_BACKOFF = float(os.getenv("DB_BUSY_BACKOFF_MS", "20")) / 1000
+
+busy_stats = {"retries": 0, "gave_up": 0}
+
+
+def is_busy(error: sqlite3.Error) -> bool:
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is None:
+        return "locked" in str(error) or "busy" in str(error)
+    return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def busy_backoff(attempt: int) -> float:
+    # full jitter, so workers that collided do not retry in lockstep
+    return random.uniform(0, BUSY_BACKOFF * 2**attempt)
+
+
+def with_busy_retry(con: sqlite3.Connection, fn, *args):
+    # fn(con, *args) must leave committing to the caller or be safe to re-run
+    for attempt in range(BUSY_RETRIES + 1):
+        try:
+            return fn(con, *args)
+        except sqlite3.OperationalError as e:
+            if not is_busy(e):
+                raise
+            if con.in_transaction:
+                con.rollback()
+            if attempt == BUSY_RETRIES:
+                busy_stats["gave_up"] += 1
+                raise
+            busy_stats["retries"] += 1
+            time.sleep(busy_backoff(attempt))
+
+
+class ConnectionPool:
+    def __init__(self, db_path: str, size: int = 8, timeout: float = 10.0):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._idle: list[sqlite3.Connection] = []
+        self._opened = 0
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {"checkouts": 0, "waits": 0, "wait_seconds": 0.0, "peak_in_use": 0}
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            if not self._idle and self._opened >= self.size:
+                self._stats["waits"] += 1
+                started = time.perf_counter()
+                deadline = started + self.timeout
+                while not self._idle and self._opened >= self.size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0 or self._closed:
+                        raise PoolTimeout("Timed out waiting for a database connection")
+                    self._cond.wait(remaining)
+                self._stats["wait_seconds"] += time.perf_counter() - started
+
+            if self._idle:
+                con = self._idle.pop()
+            else:
+                # reserve the slot before opening outside the lock
+                self._opened += 1
+                con = None
+
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+
+        if con is None:
+            try:
+                con = open_connection(self.db_path)
+            except Exception:
+                with self._cond:
+                    self._opened -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+        return con
+
+    def release(self, con: sqlite3.Connection) -> None:
+        broken = False
+        if con.in_transaction:
+            try:
+                con.rollback()
+            except sqlite3.Error:
+                broken = True
+
+        with self._cond:
+            self._in_use -= 1
+            if broken or self._closed:
+                self._opened -= 1
+                con.close()
+            else:
+                self._idle.append(con)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        con = self.acquire()
+        try:
+            yield con
+        finally:
+            self.release(con)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._opened -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                **self._stats,
+                "busy_retries": busy_stats["retries"],
+                "busy_gave_up": busy_stats["gave_up"],
+            }
+
+
+_pool: ConnectionPool | None = None
+# one worker per pooled connection so DB jobs never queue on the pool itself
+_executor: ThreadPoolExecutor | None = None
+
+
+def open_pool() -> ConnectionPool:
+    global _pool, _executor
+    if _pool is None:
+        _pool = ConnectionPool(
+            os.getenv("DB_PATH", "projects.db"),
+            size=int(os.getenv("DB_POOL_SIZE", "8")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        )
+        _executor = ThreadPoolExecutor(max_workers=_pool.size, thread_name_prefix="db")
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool, _executor, _shards
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+    if _shards is not None:
+        _shards.close()
+        _shards = None
+
+
+def get_pool() -> ConnectionPool:
+    if _pool is None:
+        raise RuntimeError("Connection pool is not open")
+    return _pool
+
+
+def get_conn():
+    return get_pool().connection()
+
+
+# -------- Per-user shards --------
+class ShardRouter:
+    # An LRU of per-user ConnectionPools. At most max_open shards are open,
+    # each with up to pool_size connections (three file handles apiece in WAL
+    # mode). Evicting a shard closes its idle connections at once and busy
+    # ones as they are released.
+    def __init__(self, path_for, prepare, max_open: int, pool_size: int, timeout: float):
+        if max_open < 1:
+            raise ValueError("At least one shard must stay open")
+        self.path_for = path_for
+        self.prepare = prepare
+        self.max_open = max_open
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools: OrderedDict[int, ConnectionPool] = OrderedDict()
+        # event-loop side, per shard: a semaphore and the number of holders
+        self._slots: dict[int, list] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "opens": 0, "evictions": 0, "slot_waits": 0}
+
+    def _pool(self, user_id: int) -> ConnectionPool:
+        with self._lock:
+            pool = self._pools.get(user_id)
+            if pool is not None:
+                self._pools.move_to_end(user_id)
+                self._stats["hits"] += 1
+                return pool
+        # creating or upgrading the file can take a while; keep the lock free
+        path = self.path_for(user_id)
+        self.prepare(path, user_id)
+        with self._lock:
+            pool = self._pools.get(user_id)
+            if pool is None:
+                pool = ConnectionPool(path, size=self.pool_size, timeout=self.timeout)
+                self._pools[user_id] = pool
+                self._stats["opens"] += 1
+                while len(self._pools) > self.max_open:
+                    _, evicted = self._pools.popitem(last=False)
+                    evicted.close()
+                    self._stats["evictions"] += 1
+            else:
+                self._pools.move_to_end(user_id)
+            return pool
+
+    @asynccontextmanager
+    async def slot(self, user_id: int):
+        # All shards share the DB executor. A job only goes to it once its
+        # shard has a free connection, so a user with more requests in flight
+        # than pool_size waits here, not on executor threads that every other
+        # shard needs. Only touched from the event loop.
+        entry = self._slots.get(user_id)
+        if entry is None:
+            entry = self._slots[user_id] = [asyncio.Semaphore(self.pool_size), 0]
+        entry[1] += 1
+        try:
+            if entry[0].locked():
+                self._stats["slot_waits"] += 1
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._slots[user_id]
+
+    @contextmanager
+    def connection(self, user_id: int):
+        while True:
+            pool = self._pool(user_id)
+            try:
+                con = pool.acquire()
+                break
+            except (RuntimeError, PoolTimeout):
+                # evicted between lookup and checkout
+                if not pool._closed:
+                    raise
+        try:
+            yield con
+        finally:
+            pool.release(con)
+
+    def close(self) -> None:
+        with self._lock:
+            while self._pools:
+                self._pools.popitem()[1].close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pools = list(self._pools.values())
+            stats = dict(self._stats)
+        return {
+            "max_open": self.max_open,
+            "pool_size": self.pool_size,
+            "open": len(pools),
+            "connections": sum(pool.stats()["opened"] for pool in pools),
+            **stats,
+        }
+
+
+_shards: ShardRouter | None = None
+_shard: ContextVar[int | None] = ContextVar("shard", default=None)
+
+
+def open_shards(path_for, prepare) -> ShardRouter:
+    # prepare(path, user_id) creates or upgrades a shard before it is opened
+    global _shards
+    if _shards is None:
+        _shards = ShardRouter(
+            path_for,
+            prepare,
+            max_open=int(os.getenv("DB_SHARD_MAX_OPEN", "64")),
+            pool_size=int(os.getenv("DB_SHARD_POOL_SIZE", "2")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        )
+    return _shards
+
+
+def shards_open() -> bool:
+    return _shards is not None
+
+
+def shard_stats() -> dict | None:
+    return _shards.stats() if _shards is not None else None
+
+
+def use_shard(user_id: int) -> None:
+    # routes the rest of this request's run_db/run_write calls to the user's
+    # shard; a no-op unless shards are open
+    _shard.set(user_id)
+
+
+def current_shard() -> int | None:
+    return _shard.get() if _shards is not None else None
+
+
+def get_shard_conn(user_id: int):
+    if _shards is None:
+        raise RuntimeError("Shards are not open")
+    return _shards.connection(user_id)
+
+
+# -------- Statement counting --------
+class StatementCounter:
+    # Set as the connection's trace callback for the duration of a run_db call.
+    # Only statements the app issued count: each trigger step is reported with
+    # its parent statement's text again, nested ones start with "--", and FTS5
+    # reads its own shadow tables as 'main'.'...'.
+    def __init__(self, timing: bool = False, record: bool = False):
+        self.statements = 0
+        # the statements themselves, with their parameters filled in, when
+        # asked for (tests explain them)
+        self.recorded: list[str] | None = [] if record else None
+        # time spent holding a connection inside run_db/run_write jobs
+        self.seconds = 0.0
+        # named Server-Timing sections filled by timed(), when enabled
+        self.sections: dict[str, float] | None = {} if timing else None
+        self._last: str | None = None
+
+    def __call__(self, sql: str) -> bool:
+        if sql == self._last or sql.startswith("--") or "'main'." in sql:
+            return False
+        self._last = sql
+        self.statements += 1
+        if self.recorded is not None:
+            self.recorded.append(sql)
+        return True
+
+    def job_done(self, con: sqlite3.Connection) -> None:
+        self._last = None
+
+
+# -------- Query tracing --------
+# Opt-in: logs every statement at DEBUG tagged with its request id, and the
+# ones slower than SLOW_QUERY_MS at WARNING with their query plan. Bound
+# values are masked in the log; the plan is taken from the real statement.
+DB_TRACE = os.getenv("DB_TRACE", "false").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# the progress handler runs every this many SQLite VM instructions
+TRACE_PROGRESS_STEPS = int(os.getenv("TRACE_PROGRESS_STEPS", "1000"))
+SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+trace_logger = logging.getLogger("app.db.trace")
+if DB_TRACE and not trace_logger.handlers:
+    # the app configures no logging of its own; DB_TRACE_LEVEL=WARNING
+    # keeps only the slow queries
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    trace_logger.addHandler(_handler)
+    trace_logger.setLevel(os.getenv("DB_TRACE_LEVEL", "DEBUG").upper())
+    trace_logger.propagate = False
+
+
+def mask_literals(sql: str) -> str:
+    # the trace callback gets statements with their parameters filled in,
+    # session tokens included
+    return " ".join(SQL_LITERAL.sub("?", sql).split())
+
+
+class StatementTracer(StatementCounter):
+    # A statement runs from its trace callback until the next statement of
+    # the same job starts or the job ends, so its time includes fetching its
+    # rows. Progress handler ticks approximate the VM work it did.
+    def __init__(self, request_id: str, timing: bool = False, record: bool = False):
+        super().__init__(timing, record)
+        self.request_id = request_id
+        self.slow: list[tuple[str, float, int]] = []
+        self._ticks = 0
+        self._current: tuple[str, float, int] | None = None
+
+    def __call__(self, sql: str) -> bool:
+        if not super().__call__(sql):
+            return False
+        self._finish()
+        self._current = (sql, time.perf_counter(), self._ticks)
+        return True
+
+    def progress(self) -> int:
+        self._ticks += 1
+        return 0
+
+    def _finish(self) -> None:
+        if self._current is None:
+            return
+        sql, started, ticks = self._current
+        self._current = None
+        ms = (time.perf_counter() - started) * 1000
+        steps = (self._ticks - ticks) * TRACE_PROGRESS_STEPS
+        if ms >= SLOW_QUERY_MS:
+            self.slow.append((sql, ms, steps))
+        elif trace_logger.isEnabledFor(logging.DEBUG):
+            trace_logger.debug("[%s] %.2fms ~%d steps %s", self.request_id, ms, steps, mask_literals(sql))
+
+    def job_done(self, con: sqlite3.Connection) -> None:
+        super().job_done(con)
+        self._finish()
+        # explained after the job so the plans are not traced themselves
+        for sql, ms, steps in self.slow:
+            plan = None
+            if sql.lstrip().upper().startswith(EXPLAINABLE):
+                try:
+                    plan = [row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                except sqlite3.Error:
+                    pass
+            trace_logger.warning(
+                "[%s] slow query %.1fms ~%d steps: %s; plan: %s",
+                self.request_id, ms, steps, mask_literals(sql), " | ".join(plan) if plan else "n/a",
+            )
+        self.slow.clear()
+
+
+_statement_counter: ContextVar[StatementCounter | None] = ContextVar("statement_counter", default=None)
+
+
+@contextmanager
+def count_statements(request_id: str | None = None, timing: bool = False, record: bool = False):
+    # counts every statement run_db executes in this context (one request),
+    # traced as well when DB_TRACE is on
+    counter = StatementTracer(request_id or "-", timing, record) if DB_TRACE else StatementCounter(timing, record)
+    token = _statement_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _statement_counter.reset(token)
+
+
+def current_statement_counter() -> StatementCounter | None:
+    return _statement_counter.get()
+
+
+@contextmanager
+def timed(section: str):
+    # adds the enclosed time to the request's Server-Timing section; works
+    # on DB threads too, where traced() makes the counter current
+    counter = _statement_counter.get()
+    if counter is None or counter.sections is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        counter.sections[section] = counter.sections.get(section, 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def traced(con: sqlite3.Connection, counter: StatementCounter | None):
+    if counter is None:
+        yield
+        return
+    con.set_trace_callback(counter)
+    tracer = isinstance(counter, StatementTracer)
+    if tracer:
+        con.set_progress_handler(counter.progress, TRACE_PROGRESS_STEPS)
+    token = _statement_counter.set(counter)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        counter.seconds += time.perf_counter() - started
+        _statement_counter.reset(token)
+        con.set_trace_callback(None)
+        if tracer:
+            con.set_progress_handler(None, 0)
+        counter.job_done(con)
+
+
+def conn_for(shard: int | None):
+    # a pooled connection to the central database or to a user's shard
+    return get_conn() if shard is None else get_shard_conn(shard)
+
+
+def _run_with_conn(fn, args, counter, shard):
+    with conn_for(shard) as con, traced(con, counter):
+        return with_busy_retry(con, fn, *args)
+
+
+async def run_db(fn, *args):
+    # fn(con, *args) runs on a DB worker thread with a pooled connection, on
+    # the current user's shard when shards are open
+    if _executor is None:
+        raise RuntimeError("Connection pool is not open")
+    loop = asyncio.get_running_loop()
+    shard = current_shard()
+    # run_in_executor does not carry context over, so pass counter and shard along
+    if shard is None:
+        return await loop.run_in_executor(_executor, _run_with_conn, fn, args, current_statement_counter(), None)
+    async with _shards.slot(shard):
+        return await loop.run_in_executor(_executor, _run_with_conn, fn, args, current_statement_counter(), shard)
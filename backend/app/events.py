@@ -0,0 +1,112 @@
+from collections import OrderedDict
+import asyncio
+import json
+import os
+
+
+SSE_MAX_PENDING = int(os.getenv("SSE_MAX_PENDING", "64"))
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))
+
+
+class Subscription:
+    # Pending events are keyed by (entity, id): a newer event for the same item
+    # replaces the queued one. Past max_pending the oldest event is dropped and
+    # the client is told to resync from /changes.
+    def __init__(self, broker: "Broker", user_id: int, project_id: int | None, max_pending: int, cursor: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.project_id = project_id
+        self.max_pending = max_pending
+        # the /changes cursor the client was handed when it connected
+        self.cursor = cursor
+        self._pending: OrderedDict[tuple[str, int], dict] = OrderedDict()
+        self._wake = asyncio.Event()
+        self.overflowed = False
+
+    def wants(self, event: dict) -> bool:
+        return self.project_id is None or event["project_id"] == self.project_id
+
+    def push(self, event: dict) -> None:
+        key = (event["entity"], event["id"])
+        if key in self._pending:
+            self._pending[key] = event
+            self.broker._stats["coalesced"] += 1
+        else:
+            self._pending[key] = event
+            if len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+                self.overflowed = True
+                self.broker._stats["dropped"] += 1
+        self._wake.set()
+
+    async def next(self, timeout: float) -> list[dict] | None:
+        # None on timeout, otherwise everything queued since the last call
+        if not self._pending and not self.overflowed:
+            self._wake.clear()
+            # asyncio.timeout, unlike wait_for, never swallows a cancellation
+            # that races with the wakeup
+            try:
+                async with asyncio.timeout(timeout):
+                    await self._wake.wait()
+            except TimeoutError:
+                return None
+        events = list(self._pending.values())
+        self._pending.clear()
+        if self.overflowed:
+            self.overflowed = False
+            events.insert(0, {"op": "resync"})
+        self.broker._stats["delivered"] += len(events)
+        return events
+
+
+class Broker:
+    # In-process fan-out from mutation handlers to live connections of the same
+    # user. Only reaches connections on this worker.
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._subscribers: dict[int, set[Subscription]] = {}
+        self._stats = {"published": 0, "delivered": 0, "coalesced": 0, "dropped": 0}
+
+    def subscribe(self, user_id: int, project_id: int | None = None, cursor: int = 0) -> Subscription:
+        sub = Subscription(self, user_id, project_id, self.max_pending, cursor)
+        self._subscribers.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._subscribers.get(sub.user_id)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._subscribers[sub.user_id]
+
+    def user_cursors(self) -> dict[int, int]:
+        # subscribed users and the oldest cursor any of their connections holds
+        return {user_id: min(sub.cursor for sub in subs) for user_id, subs in self._subscribers.items()}
+
+    def resync(self, user_id: int) -> None:
+        # tell every connection of this user to reload from /changes
+        for sub in self._subscribers.get(user_id, ()):
+            sub.overflowed = True
+            sub._wake.set()
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self._stats["published"] += 1
+        for sub in self._subscribers.get(user_id, ()):
+            if sub.wants(event):
+                sub.push(event)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+            "max_pending": self.max_pending,
+            **self._stats,
+        }
+
+
+broker = Broker(max_pending=SSE_MAX_PENDING)
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
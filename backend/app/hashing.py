@@ -0,0 +1,156 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import base64
+import hashlib
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+
+
+# scrypt
+def hash_password(password: str) -> str:
+    salt = secrets.token_bytes(16)
+    derived = hashlib.scrypt(password.encode(), salt=salt, n=2**14, r=8, p=1)
+    payload = salt + derived
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    try:
+        payload = base64.urlsafe_b64decode(encoded.encode())
+    except (ValueError, TypeError):
+        return False
+
+    salt, stored = payload[:16], payload[16:]
+    try:
+        derived = hashlib.scrypt(password.encode(), salt=salt, n=2**14, r=8, p=1)
+    except ValueError:
+        return False
+    return secrets.compare_digest(stored, derived)
+
+
+class HashQueueFull(Exception):
+    pass
+
+
+def pool_context():
+    # Workers are started lazily, after the pool, writer and watcher threads
+    # are running, and forking a process that has threads is unsafe. A fork
+    # server (spawn where there is none) starts them from a clean process.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["app.hashing"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class HashPool:
+    # scrypt jobs run in worker processes; at most workers + queue_size jobs
+    # are admitted at once and everything past that is rejected immediately
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._executor: ProcessPoolExecutor | None = None
+        self._in_flight = 0
+        self._running = 0
+        self._latencies: deque[float] = deque(maxlen=512)
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0, "latency_seconds_total": 0.0}
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn, *args):
+        if self._executor is None:
+            raise RuntimeError("Hash pool is not running")
+        if self._in_flight >= self.workers + self.queue_size:
+            self._stats["rejected"] += 1
+            raise HashQueueFull()
+
+        self._in_flight += 1
+        self._stats["submitted"] += 1
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+            elapsed = time.perf_counter() - started
+            self._latencies.append(elapsed)
+            self._stats["completed"] += 1
+            self._stats["latency_seconds_total"] += elapsed
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def pct(p: float) -> float | None:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "queue_depth": max(0, self._in_flight - self.workers),
+            **self._stats,
+            "latency_p50": pct(0.50),
+            "latency_p95": pct(0.95),
+            "latency_max": latencies[-1] if latencies else None,
+        }
+
+
+class TokenBucketLimiter:
+    # one bucket per key; least recently seen keys are evicted past max_keys
+    def __init__(self, rate: float, burst: int, max_keys: int = 10_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def acquire(self, key: str) -> float:
+        # returns 0 when allowed, otherwise seconds until a token is available
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate if self.rate > 0 else 60.0
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._buckets), "rejected": self.rejected}
+
+
+hash_pool = HashPool(
+    workers=int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    queue_size=int(os.getenv("HASH_QUEUE_SIZE", "16")),
+)
+
+# rates are tokens per second
+ip_limiter = TokenBucketLimiter(
+    rate=float(os.getenv("AUTH_RATE_PER_IP", "1")),
+    burst=int(os.getenv("AUTH_BURST_PER_IP", "10")),
+)
+username_limiter = TokenBucketLimiter(
+    rate=float(os.getenv("AUTH_RATE_PER_USERNAME", "0.2")),
+    burst=int(os.getenv("AUTH_BURST_PER_USERNAME", "5")),
+)
@@ -0,0 +1,91 @@
+import sqlite3
+import json
+
+
+MAX_LABEL_FILTERS = 10
+
+
+def normalize_labels(labels) -> list[str]:
+    if not isinstance(labels, list):
+        return []
+    names: list[str] = []
+    for label in labels:
+        if isinstance(label, (dict, list)) or label is None:
+            continue
+        name = str(label).strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def set_task_labels(con: sqlite3.Connection, user_id: int, task_id: int, labels: list[str]) -> None:
+    # label.task_count is maintained by the task_label triggers
+    cur = con.cursor()
+    cur.execute("DELETE FROM task_label WHERE task_id = ?", (task_id,))
+    if not labels:
+        return
+    # a fixed number of statements however many labels there are
+    names = json.dumps(labels)
+    cur.execute(
+        """
+        INSERT INTO label (user_id, name)
+        SELECT ?, value FROM json_each(?) WHERE true
+        ON CONFLICT (user_id, name) DO NOTHING
+        """,
+        (user_id, names),
+    )
+    cur.execute(
+        """
+        INSERT INTO task_label (task_id, label_id, position)
+        SELECT ?, l.id, j.key
+          FROM json_each(?) AS j
+          JOIN label AS l ON l.user_id = ? AND l.name = j.value
+        """,
+        (task_id, names, user_id),
+    )
+
+
+def labels_for_tasks(con: sqlite3.Connection, task_ids: list[int]) -> dict[int, list[str]]:
+    by_task: dict[int, list[str]] = {task_id: [] for task_id in task_ids}
+    if not task_ids:
+        return by_task
+    q_marks = ",".join("?" for _ in task_ids)
+    cur = con.cursor()
+    cur.execute(
+        f"""
+        SELECT tl.task_id, l.name
+          FROM task_label AS tl
+          JOIN label AS l ON l.id = tl.label_id
+         WHERE tl.task_id IN ({q_marks})
+         ORDER BY tl.task_id, tl.position
+        """,
+        task_ids,
+    )
+    for row in cur.fetchall():
+        by_task[row["task_id"]].append(row["name"])
+    return by_task
+
+
+def matching_tasks_sql(user_id: int, labels: list[str]) -> tuple[str, dict]:
+    # ids of tasks carrying every requested label, via the label(user_id, name)
+    # and task_label(label_id, task_id) indexes
+    names = {f"label_{i}": name for i, name in enumerate(labels)}
+    placeholders = ", ".join(f":{key}" for key in names)
+    sql = f"""
+        SELECT tl.task_id
+          FROM label AS l
+          JOIN task_label AS tl ON tl.label_id = l.id
+         WHERE l.user_id = :label_user_id AND l.name IN ({placeholders})
+         GROUP BY tl.task_id
+        HAVING COUNT(*) = {len(names)}
+    """
+    return sql, {"label_user_id": user_id, **names}
+
+
+def label_counts(con: sqlite3.Connection, user_id: int) -> list[dict]:
+    cur = con.cursor()
+    cur.execute(
+        "SELECT name, task_count FROM label WHERE user_id = ? AND task_count > 0 ORDER BY name ASC",
+        (user_id,),
+    )
+    return [{"name": row["name"], "task_count": row["task_count"]} for row in cur.fetchall()]
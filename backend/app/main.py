@@ -1,135 +1,78 @@
-from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Literal
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Annotated, Any, Literal
+from contextlib import asynccontextmanager, suppress
+from functools import partial
+import asyncio
+import logging
 import sqlite3
-import json
 import os
-import base64
+import math
 import hashlib
+import json
 import secrets
+import time
 from datetime import datetime, timedelta
 import re
 
-
-# DB
-def get_conn():
-    db_path = os.getenv("DB_PATH", "projects.db")
-    con = sqlite3.connect(db_path)
-    con.row_factory = sqlite3.Row
-    con.execute("PRAGMA foreign_keys = ON;")
-    return con
+from app.db import (
+    DB_TRACE,
+    PoolTimeout,
+    close_pool,
+    count_statements,
+    current_statement_counter,
+    get_pool,
+    open_pool,
+    open_shards,
+    run_db,
+    shard_stats,
+    timed,
+    use_shard,
+)
+from app.hashing import (
+    HashQueueFull,
+    TokenBucketLimiter,
+    hash_password,
+    hash_pool,
+    ip_limiter,
+    username_limiter,
+    verify_password,
+)
+from app.maintenance import session_reaper
+from app.metrics import UNMATCHED_ROUTE, metrics
+from app.cache import project_cache
+from app.changes import change_log_compactor, latest_seq, read_changes
+from app.events import SSE_HEARTBEAT, broker, format_sse
+from app.labels import (
+    MAX_LABEL_FILTERS,
+    label_counts,
+    labels_for_tasks,
+    matching_tasks_sql,
+    normalize_labels,
+    set_task_labels,
+)
+from app.migrations import init_db
+from app.responses import FastJSONResponse
+from app.search import search
+from app.sessions import session_cache
+from app.shards import SHARDED, compact_shards, init_shard, shard_path
+from app.transfer import Importer, ImportRejected, export_busy, import_progress, stream_export
+from app.workers import FORWARD_CHANGES, run_as_leader, watcher
+from app.writer import run_write, start_writer, stop_writer, writer_stats
 
 
-def init_db():
-    con = get_conn()
-    cur = con.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS project (
-        id                INTEGER PRIMARY KEY AUTOINCREMENT,
-        title             TEXT NOT NULL,
-        short_description TEXT,
-        description       TEXT,
-        github            TEXT,
-        website           TEXT,
-        status            TEXT NOT NULL CHECK(status IN ('idea','active','paused','done')),
-        user_id           INTEGER NOT NULL DEFAULT 1,
-        FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE
-    )
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS task (
-        id          INTEGER PRIMARY KEY AUTOINCREMENT,
-        project_id  INTEGER NOT NULL,
-        title       TEXT NOT NULL,
-        desc        TEXT,
-        status      TEXT NOT NULL CHECK(status IN ('open','in_progress','done')) DEFAULT 'open',
-        labels_json TEXT NOT NULL DEFAULT '[]',
-        FOREIGN KEY (project_id) REFERENCES project(id) ON DELETE CASCADE
-    )
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS note (
-        id          INTEGER PRIMARY KEY AUTOINCREMENT,
-        project_id  INTEGER NOT NULL,
-        body        TEXT NOT NULL,
-        FOREIGN KEY (project_id) REFERENCES project(id) ON DELETE CASCADE
-    )
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS user (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL UNIQUE,
-        password_hash TEXT NOT NULL
-    )
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS session (
-        token TEXT PRIMARY KEY,
-        user_id INTEGER NOT NULL,
-        expires_at TEXT NOT NULL,
-        created_at TEXT NOT NULL,
-        FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE
-    )
-    """)
-    con.commit()
-    ensure_default_user(con)
-    ensure_project_user_column(con)
-    con.close()
+logger = logging.getLogger(__name__)
 
+# sessions revoked or refreshed by another worker
+watcher.on_invalidate("session", session_cache.invalidate)
 
 SESSION_COOKIE = "pb_session"
 SESSION_DURATION = timedelta(days=7)
-
-
-def ensure_default_user(con: sqlite3.Connection) -> None:
-    cur = con.cursor()
-    cur.execute("SELECT COUNT(*) FROM user")
-    (count,) = cur.fetchone() or (0,)
-    if count:
-        return
-
-    username = os.getenv("DEFAULT_ADMIN_USER")
-    password = os.getenv("DEFAULT_ADMIN_PASSWORD")
-    password_hash = hash_password(password)
-    cur.execute(
-        "INSERT INTO user (username, password_hash) VALUES (?, ?)",
-        (username, password_hash),
-    )
-    con.commit()
-
-
-def ensure_project_user_column(con: sqlite3.Connection) -> None:
-    cur = con.cursor()
-    cur.execute("PRAGMA table_info(project)")
-    columns = {row[1] for row in cur.fetchall()}
-    if "user_id" in columns:
-        return
-
-    cur.execute("ALTER TABLE project ADD COLUMN user_id INTEGER")
-    cur.execute("UPDATE project SET user_id = 1 WHERE user_id IS NULL")
-    con.commit()
-
-
-def hash_password(password: str) -> str:
-    salt = secrets.token_bytes(16)
-    derived = hashlib.scrypt(password.encode(), salt=salt, n=2**14, r=8, p=1)
-    payload = salt + derived
-    return base64.urlsafe_b64encode(payload).decode()
-
-
-def verify_password(password: str, encoded: str) -> bool:
-    try:
-        payload = base64.urlsafe_b64decode(encoded.encode())
-    except (ValueError, TypeError):
-        return False
-
-    salt, stored = payload[:16], payload[16:]
-    try:
-        derived = hashlib.scrypt(password.encode(), salt=salt, n=2**14, r=8, p=1)
-    except ValueError:
-        return False
-    return secrets.compare_digest(stored, derived)
+# sliding expiry: extend a session on use, persisting at most once per interval
+SESSION_SLIDING = os.getenv("SESSION_SLIDING", "false").lower() == "true"
+SESSION_REFRESH_INTERVAL = timedelta(seconds=int(os.getenv("SESSION_REFRESH_INTERVAL", "3600")))
 
 
 def new_session_token() -> str:
@@ -145,43 +88,78 @@ def upsert_session(con: sqlite3.Connection, user_id: int) -> tuple[str, datetime
         "INSERT INTO session (token, user_id, expires_at, created_at) VALUES (?, ?, ?, ?)",
         (token, user_id, expires.isoformat(), now.isoformat()),
     )
-    con.commit()
     return token, expires
 
 
-def get_user_by_session(token: str | None) -> dict | None:
-    if not token:
+def set_session_cookie(response: Response, token: str, expires: datetime) -> None:
+    response.set_cookie(
+        SESSION_COOKIE,
+        token,
+        httponly=True,
+        max_age=int(SESSION_DURATION.total_seconds()),
+        expires=expires.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        samesite="lax",
+        secure=os.getenv("SESSION_COOKIE_SECURE", "false").lower() == "true",
+        path="/",
+    )
+
+
+def load_session(con: sqlite3.Connection, token: str) -> tuple[dict, datetime] | None:
+    cur = con.cursor()
+    cur.execute(
+        """
+        SELECT user.id, user.username, session.expires_at
+        FROM session
+        JOIN user ON user.id = session.user_id
+        WHERE session.token = ?
+        """,
+        (token,),
+    )
+    row = cur.fetchone()
+    if not row:
         return None
+    return {"id": row["id"], "username": row["username"]}, datetime.fromisoformat(row["expires_at"])
 
-    con = get_conn()
-    try:
-        cur = con.cursor()
-        cur.execute(
-            """
-            SELECT user.id, user.username, session.expires_at
-            FROM session
-            JOIN user ON user.id = session.user_id
-            WHERE session.token = ?
-            """,
-            (token,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
-        expires_at = datetime.fromisoformat(row["expires_at"])
-        if expires_at < datetime.utcnow():
-            cur.execute("DELETE FROM session WHERE token = ?", (token,))
-            con.commit()
-            return None
-        return {"id": row["id"], "username": row["username"]}
-    finally:
-        con.close()
+
+def delete_session(con: sqlite3.Connection, token: str) -> None:
+    cur = con.cursor()
+    cur.execute("DELETE FROM session WHERE token = ?", (token,))
+
+
+def refresh_session(con: sqlite3.Connection, token: str, expires: datetime) -> None:
+    cur = con.cursor()
+    cur.execute("UPDATE session SET expires_at = ? WHERE token = ?", (expires.isoformat(), token))
 
 
-def require_user(request: Request) -> dict:
-    user = get_user_by_session(request.cookies.get(SESSION_COOKIE))
-    if not user:
+async def require_user(request: Request) -> dict:
+    token = request.cookies.get(SESSION_COOKIE)
+    if not token:
         raise HTTPException(status_code=401, detail="Unauthorized")
+
+    now = datetime.utcnow()
+    cached = session_cache.get(token, now)
+    if cached is None:
+        loaded = await run_db(load_session, token)
+        if loaded and loaded[1] < now:
+            # reads run on pooled connections; the delete goes through the writer
+            await run_write(delete_session, token)
+            loaded = None
+        if not loaded:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        session_cache.put(token, *loaded)
+        user, expires = loaded
+    else:
+        user, expires = cached
+
+    if SESSION_SLIDING:
+        slid = now + SESSION_DURATION
+        if slid - expires >= SESSION_REFRESH_INTERVAL:
+            await run_write(refresh_session, token, slid)
+            session_cache.update_expiry(token, slid)
+            # SessionCookieMiddleware sets the cookie, so it also reaches
+            # handlers that return a Response of their own
+            request.state.session_refresh = (token, slid)
+    use_shard(user["id"])
     return user
 
 
@@ -189,7 +167,30 @@ def row_to_dict(row: sqlite3.Row | None) -> dict:
     return dict(row) if row is not None else {}
 
 
-def build_projects(rows: list[sqlite3.Row]) -> list[dict]:
+def in_params(prefix: str, values: list) -> tuple[str, dict]:
+    # named IN (...) placeholders so filters with named params can be combined
+    params = {f"{prefix}{i}": value for i, value in enumerate(values)}
+    return ", ".join(f":{key}" for key in params), params
+
+
+def task_filter(user_id: int, labels: list[str] | None) -> tuple[str, dict]:
+    if not labels:
+        return "", {}
+    sql, params = matching_tasks_sql(user_id, labels)
+    return f" AND id IN ({sql})", params
+
+
+def project_filter(user_id: int, labels: list[str] | None, column: str) -> tuple[str, dict]:
+    # projects holding at least one task that matches the label filter
+    filter_sql, params = task_filter(user_id, labels)
+    if not filter_sql:
+        return "", {}
+    return f" AND {column} IN (SELECT project_id FROM task WHERE 1 = 1{filter_sql})", params
+
+
+def build_projects(
+    con: sqlite3.Connection, rows: list[sqlite3.Row], labels: list[str] | None = None
+) -> list[dict]:
     if not rows:
         return []
 
@@ -211,27 +212,197 @@ def build_projects(rows: list[sqlite3.Row]) -> list[dict]:
         for row in rows
     }
 
-    con = get_conn()
     cur = con.cursor()
 
-    q_marks = ",".join("?" for _ in project_ids)
-    cur.execute(f"SELECT id, project_id, body FROM note WHERE project_id IN ({q_marks}) ORDER BY id ASC", project_ids)
+    # queries first, then assembly, so Server-Timing can tell them apart
+    with timed("sql"):
+        q_marks, params = in_params("project_", project_ids)
+        cur.execute(f"SELECT id, project_id, body FROM note WHERE project_id IN ({q_marks}) ORDER BY id ASC", params)
+        notes = cur.fetchall()
+
+        filter_sql, filter_params = task_filter(rows[0]["user_id"], labels)
+        cur.execute(
+            f"SELECT id, project_id, title, desc, status FROM task WHERE project_id IN ({q_marks}){filter_sql} ORDER BY id ASC",
+            {**params, **filter_params},
+        )
+        tasks = cur.fetchall()
+        labels_by_task = labels_for_tasks(con, [r["id"] for r in tasks])
+
+    with timed("assembly"):
+        for r in notes:
+            by_id[r["project_id"]]["notes"].append({"id": r["id"], "desc": r["body"]})
+        for r in tasks:
+            task = {"id": r["id"], "title": r["title"], "desc": r["desc"], "status": r["status"], "labels": labels_by_task[r["id"]]}
+            by_id[r["project_id"]][r["status"]].append(task)
+
+    return [by_id[i] for i in project_ids]
+
+
+# "sql" assembles each project's nested payload inside SQLite with the JSON1
+# functions and passes the text straight through; "python" uses build_projects.
+PROJECTS_ASSEMBLY = os.getenv("PROJECTS_ASSEMBLY", "sql").lower()
+
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+MAX_BATCH_OPERATIONS = int(os.getenv("MAX_BATCH_OPERATIONS", "500"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def task_array_sql(status: str, filter_sql: str) -> str:
+    # subquery results lose their JSON subtype, hence the json() wrappers
+    return f"""json((
+        SELECT json_group_array(json_object(
+            'id', t.id, 'title', t.title, 'desc', t.desc, 'status', t.status,
+            'labels', json((
+                SELECT json_group_array(l.name)
+                FROM (SELECT name FROM task_label AS tl JOIN label ON label.id = tl.label_id
+                      WHERE tl.task_id = t.id ORDER BY tl.position) AS l
+            ))
+        ))
+        FROM (SELECT * FROM task WHERE project_id = p.id AND status = '{status}'{filter_sql} ORDER BY id ASC) AS t
+    ))"""
+
+
+def project_json_sql(filter_sql: str = "") -> str:
+    return f"""
+    json_object(
+        'id', p.id,
+        'title', p.title,
+        'short_description', p.short_description,
+        'description', p.description,
+        'github', p.github,
+        'website', p.website,
+        'status', p.status,
+        'notes', json((
+            SELECT json_group_array(json_object('id', n.id, 'desc', n.body))
+            FROM (SELECT id, body FROM note WHERE project_id = p.id ORDER BY id ASC) AS n
+        )),
+        'open', {task_array_sql("open", filter_sql)},
+        'in_progress', {task_array_sql("in_progress", filter_sql)},
+        'done', {task_array_sql("done", filter_sql)}
+    )
+    """
+
+
+PROJECT_JSON_SQL = project_json_sql()
+
+
+def build_projects_json(
+    con: sqlite3.Connection, where: str, params: dict, limit: int = -1, labels: list[str] | None = None
+) -> list[sqlite3.Row]:
+    # one statement; each row is (id, serialized payload). labels only narrow
+    # the task lists; callers restrict the project set in `where` if needed.
+    filter_sql, filter_params = task_filter(params["user_id"], labels)
+    payload_sql = project_json_sql(filter_sql) if filter_sql else PROJECT_JSON_SQL
+    cur = con.cursor()
+    cur.execute(
+        f"SELECT p.id, {payload_sql} AS payload FROM project AS p WHERE {where} ORDER BY p.id ASC LIMIT :limit",
+        {**params, **filter_params, "limit": limit},
+    )
+    return cur.fetchall()
+
+
+def summarize_projects(
+    con: sqlite3.Connection, rows: list[sqlite3.Row], labels: list[str] | None = None
+) -> list[dict]:
+    # per-status task counts and note counts from grouped aggregates over the
+    # covering indexes, so the payload does not grow with the number of tasks
+    if not rows:
+        return []
+
+    project_ids = [row["id"] for row in rows]
+    by_id = {
+        row["id"]: {
+            "id": row["id"],
+            "title": row["title"],
+            "short_description": row["short_description"],
+            "description": row["description"],
+            "github": row["github"],
+            "website": row["website"],
+            "status": row["status"],
+            "task_counts": {"open": 0, "in_progress": 0, "done": 0},
+            "note_count": 0,
+        }
+        for row in rows
+    }
+
+    cur = con.cursor()
+    q_marks, params = in_params("project_", project_ids)
+    filter_sql, filter_params = task_filter(rows[0]["user_id"], labels)
+    cur.execute(
+        f"SELECT project_id, status, COUNT(*) AS n FROM task WHERE project_id IN ({q_marks}){filter_sql} GROUP BY project_id, status",
+        {**params, **filter_params},
+    )
     for r in cur.fetchall():
-        by_id[r["project_id"]]["notes"].append({"id": r["id"], "desc": r["body"]})
+        by_id[r["project_id"]]["task_counts"][r["status"]] = r["n"]
 
-    cur.execute(f"SELECT id, project_id, title, desc, status, labels_json FROM task WHERE project_id IN ({q_marks}) ORDER BY id ASC", project_ids)
+    cur.execute(
+        f"SELECT project_id, COUNT(*) AS n FROM note WHERE project_id IN ({q_marks}) GROUP BY project_id",
+        params,
+    )
     for r in cur.fetchall():
-        try:
-            labels = json.loads(r["labels_json"]) if r["labels_json"] else []
-        except (TypeError, json.JSONDecodeError):
-            labels = []
-        task = {"id": r["id"], "title": r["title"], "desc": r["desc"], "status": r["status"], "labels": labels}
-        by_id[r["project_id"]][r["status"]].append(task)
+        by_id[r["project_id"]]["note_count"] = r["n"]
 
-    con.close()
     return [by_id[i] for i in project_ids]
 
 
+def json_response(content: str | bytes) -> Response:
+    return Response(content=content, media_type="application/json")
+
+
+def publish_change(user_id: int, op: str, entity: str, entity_id: int, project_id: int, data: dict | None = None) -> None:
+    # same shape as a /changes entry; with several workers the watcher
+    # forwards every change from the change log instead
+    if FORWARD_CHANGES:
+        return
+    event = {"op": op, "entity": entity, "id": entity_id, "project_id": project_id}
+    if data is not None:
+        event["data"] = data
+    broker.publish(user_id, event)
+
+
+PROJECT_FIELDS = ("id", "title", "short_description", "description", "github", "website", "status")
+
+
+# -------- ETags --------
+def make_etag(scope: str, version: int, request: Request) -> str:
+    # the query string changes the representation (view, labels, paging)
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    variant = hashlib.sha1(query.encode()).hexdigest()[:8]
+    return f'"{scope}-v{version}-{variant}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def not_modified(etag: str) -> Response:
+    return with_etag(Response(status_code=304), etag)
+
+
+def user_projects_version(con: sqlite3.Connection, user_id: int) -> int:
+    (version,) = con.execute("SELECT projects_version FROM user WHERE id = ?", (user_id,)).fetchone()
+    return version
+
+
+def project_version(con: sqlite3.Connection, project_id: int, user_id: int) -> int | None:
+    row = con.execute(
+        "SELECT version FROM project WHERE id = ? AND user_id = ?",
+        (project_id, user_id),
+    ).fetchone()
+    return row["version"] if row else None
+
+
 
 # models
 class ProjectCreate(BaseModel):
@@ -243,7 +414,7 @@ class ProjectCreate(BaseModel):
     status: Literal["idea", "active", "paused", "done"]
 
 
-class ProjectModel(BaseModel):
+class ProjectFieldsModel(BaseModel):
     id: int
     title: str
     short_description: str | None
@@ -251,13 +422,145 @@ class ProjectModel(BaseModel):
     github: str | None
     website: str | None
     status: Literal["idea", "active", "paused", "done"]
-    notes: list[dict]
-    open: list[dict]
-    in_progress: list[dict]
-    done: list[dict]
+
+
+class TaskModel(BaseModel):
+    id: int
+    title: str
+    desc: str | None
+    status: Literal["open", "in_progress", "done"]
+    labels: list[str]
+
+
+class NoteModel(BaseModel):
+    id: int
+    desc: str
+
+
+class ProjectModel(ProjectFieldsModel):
+    notes: list[NoteModel]
+    open: list[TaskModel]
+    in_progress: list[TaskModel]
+    done: list[TaskModel]
     # user_id intentionally hidden from API responses
 
 
+# Request bodies for task and note writes. Every field is optional and
+# loosely typed so that insert_task/insert_note keep answering an empty title
+# or an unknown status with their own 400s; unset fields are left out of the
+# dict the write functions get, so a PATCH only touches what it names.
+class TaskFields(BaseModel):
+    title: str | None = None
+    desc: str | None = None
+    status: str | None = None
+    # normalize_labels treats anything but a list as no labels
+    labels: Any = None
+
+
+class NoteFields(BaseModel):
+    desc: str | None = None
+
+
+class TaskDeleted(BaseModel):
+    success: bool
+    deleted_task_id: int
+
+
+class NoteDeleted(BaseModel):
+    success: bool
+    deleted_note_id: int
+
+
+class ProjectDeleted(BaseModel):
+    success: bool
+    deleted_project_id: int
+
+
+class TaskCounts(BaseModel):
+    open: int
+    in_progress: int
+    done: int
+
+
+class ProjectSummaryModel(BaseModel):
+    id: int
+    title: str
+    short_description: str | None
+    description: str | None
+    github: str | None
+    website: str | None
+    status: Literal["idea", "active", "paused", "done"]
+    task_counts: TaskCounts
+    note_count: int
+
+
+class SearchResult(BaseModel):
+    type: Literal["project", "task", "note"]
+    id: int
+    project_id: int
+    project_title: str
+    title: str | None
+    snippet: str | None
+    score: float
+
+
+class LabelCount(BaseModel):
+    name: str
+    task_count: int
+
+
+class Change(BaseModel):
+    op: Literal["upsert", "delete"]
+    entity: Literal["project", "task", "note"]
+    id: int
+    project_id: int
+    data: dict | None = None
+
+
+class ChangesResponse(BaseModel):
+    resync: bool
+    cursor: int
+    has_more: bool
+    changes: list[Change]
+
+
+class TaskOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    entity: Literal["task"]
+    id: int | None = None
+    data: TaskFields = Field(default_factory=TaskFields)
+
+
+class NoteOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    entity: Literal["note"]
+    id: int | None = None
+    data: NoteFields = Field(default_factory=NoteFields)
+
+
+# the payload is checked with the same models as the single-item endpoints
+BatchOperation = Annotated[TaskOperation | NoteOperation, Field(discriminator="entity")]
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation] = Field(..., min_length=1, max_length=MAX_BATCH_OPERATIONS)
+    # roll the whole batch back on the first failing operation
+    atomic: bool = False
+
+
+class BatchResult(BaseModel):
+    index: int
+    ok: bool
+    status: int
+    result: dict | None = None
+    error: str | None = None
+
+
+class BatchResponse(BaseModel):
+    committed: bool
+    results: list[BatchResult]
+
+
 class UserModel(BaseModel):
     id: int
     username: str
@@ -302,15 +605,177 @@ def validate_password_policy(password: str) -> list[str]:
 
 
 # FastAPI app
-app = FastAPI()
-init_db()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # a single schema_version read unless migrations are pending
+    init_db()
+    open_pool()
+    if SHARDED:
+        open_shards(shard_path, init_shard)
+    start_writer()
+    hash_pool.start()
+    compactor = partial(change_log_compactor, compact=compact_shards) if SHARDED else change_log_compactor
+    background = [
+        asyncio.create_task(run_as_leader([session_reaper, compactor])),
+        asyncio.create_task(watcher.run()),
+    ]
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        for task in background:
+            with suppress(asyncio.CancelledError):
+                await task
+        hash_pool.shutdown()
+        stop_writer()
+        close_pool()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout(request: Request, exc: PoolTimeout):
+    # every connection stayed checked out for DB_POOL_TIMEOUT: overload,
+    # not a server error
+    return FastJSONResponse({"detail": "Server busy, try again shortly"}, status_code=503, headers={"Retry-After": "1"})
+
+
+# -------- Statement counting --------
+# Debug only: an X-SQL-Statements header with the number of statements each
+# request ran. Per-endpoint budgets are asserted in tests/test_query_budgets.py.
+SQL_STATEMENTS_HEADER = "X-SQL-Statements"
+SQL_COUNT_HEADER = os.getenv("SQL_COUNT_HEADER", "false").lower() == "true"
+
+
+# Debug only: a Server-Timing header splitting each request into time on DB
+# threads (with the sql/assembly sections of build_projects) and the rest
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+def request_id(scope) -> str:
+    # the proxy's id when it sent a sane one, so log lines can be matched up
+    for name, value in scope["headers"]:
+        if name == b"x-request-id":
+            candidate = value.decode("latin-1")
+            if REQUEST_ID.fullmatch(candidate):
+                return candidate
+    return secrets.token_hex(8)
+
+
+def server_timing(counter, total: float) -> str:
+    parts = [("db", counter.seconds), *counter.sections.items(), ("app", max(total - counter.seconds, 0.0)), ("total", total)]
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in parts)
+
+
+class StatementCountMiddleware:
+    # Counts the statements each request runs through run_db/run_write for
+    # metrics, SQL_COUNT_HEADER and SERVER_TIMING; with DB_TRACE on they are
+    # logged under the request's X-Request-ID. With none of those enabled
+    # statements run without a trace callback.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (metrics.enabled or SQL_COUNT_HEADER or SERVER_TIMING or DB_TRACE):
+            await self.app(scope, receive, send)
+            return
+
+        rid = request_id(scope) if DB_TRACE else None
+        started = time.perf_counter()
+        with count_statements(rid, SERVER_TIMING) as counter:
+            async def send_with_count(message):
+                if message["type"] == "http.response.start":
+                    message.setdefault("headers", [])
+                    if SQL_COUNT_HEADER:
+                        message["headers"].append((SQL_STATEMENTS_HEADER.lower().encode(), str(counter.statements).encode()))
+                    if rid is not None:
+                        message["headers"].append((REQUEST_ID_HEADER.lower().encode(), rid.encode()))
+                    if SERVER_TIMING:
+                        message["headers"].append((b"server-timing", server_timing(counter, time.perf_counter() - started).encode()))
+                await send(message)
+
+            await self.app(scope, receive, send_with_count)
+
+
+# -------- Metrics --------
+# bearer token for /metrics and /stats/*; both are off (404) while it is unset,
+# since nginx proxies everything under /api/ to this app
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+class MetricsMiddleware:
+    # per route template: request count by status, latency, and the SQL
+    # statement count and time gathered by StatementCountMiddleware's counter
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            counter = current_statement_counter()
+            metrics.observe(
+                scope["method"],
+                getattr(route, "path", UNMATCHED_ROUTE),
+                status,
+                time.perf_counter() - started,
+                counter.statements if counter else 0,
+                counter.seconds if counter else 0.0,
+            )
+
+
+# -------- Sliding sessions --------
+class SessionCookieMiddleware:
+    # adds the cookie for a session require_user extended to the response
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SESSION_SLIDING:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                refreshed = scope.get("state", {}).get("session_refresh")
+                if refreshed:
+                    cookie = Response()
+                    set_session_cookie(cookie, *refreshed)
+                    message["headers"] = [*message["headers"], *(h for h in cookie.raw_headers if h[0] == b"set-cookie")]
+            await send(message)
 
+        await self.app(scope, receive, send_with_cookie)
+
+
+app.add_middleware(SessionCookieMiddleware)
+# added first, so it runs inside the statement counter's context
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(StatementCountMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://127.0.0.1:5173", "http://localhost:5173"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", REQUEST_ID_HEADER, "Server-Timing", *([SQL_STATEMENTS_HEADER] if SQL_COUNT_HEADER else [])],
 )
 
 
@@ -319,33 +784,179 @@ async def read_root():
     return {"Hello": "World"}
 
 
-# -------- Projects --------
-@app.get("/getProjects", response_model=list[ProjectModel])
-async def get_projects(user: dict = Depends(require_user)):
-    con = get_conn()
-    cur = con.cursor()
-    cur.execute("SELECT * FROM project WHERE user_id = ? ORDER BY id ASC", (user["id"],))
-    rows = cur.fetchall()
-    con.close()
-    return build_projects(rows)
+def require_metrics_token(request: Request):
+    # scrapers and operators, not users: a session cookie is not enough
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Not authenticated")
 
 
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    # Prometheus text format; per worker process
+    body = metrics.render({
+        "db_pool": get_pool().stats(),
+        "writer": writer_stats(),
+        "project_cache": project_cache.stats(),
+        "events": broker.stats(),
+        "session_cache": session_cache.stats(),
+    })
+    return Response(content=body, media_type="text/plain; version=0.0.4; charset=utf-8")
 
-@app.get("/getProject/{project_id}", response_model=ProjectModel)
-async def get_project(project_id: int, user: dict = Depends(require_user)):
-    con = get_conn()
-    try:
+
+@app.get("/stats/db", dependencies=[Depends(require_metrics_token)])
+async def db_stats():
+    return {
+        **get_pool().stats(),
+        "writer": writer_stats(),
+        "invalidation": watcher.stats(),
+        "shards": shard_stats(),
+    }
+
+
+@app.get("/stats/events", dependencies=[Depends(require_metrics_token)])
+async def event_stats():
+    return broker.stats()
+
+
+@app.get("/stats/cache", dependencies=[Depends(require_metrics_token)])
+async def cache_stats():
+    return {"projects": project_cache.stats()}
+
+
+@app.get("/stats/auth", dependencies=[Depends(require_metrics_token)])
+async def auth_stats():
+    return {
+        "session_cache": session_cache.stats(),
+        "hashing": hash_pool.stats(),
+        "ip_limiter": ip_limiter.stats(),
+        "username_limiter": username_limiter.stats(),
+    }
+
+
+# -------- Projects --------
+def label_filter(label: list[str] = Query([], description="Only tasks carrying every given label")) -> list[str]:
+    labels = normalize_labels(label)
+    if len(labels) > MAX_LABEL_FILTERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LABEL_FILTERS} labels can be filtered on")
+    return labels
+
+
+@app.get("/getProjects", response_model=list[ProjectModel] | list[ProjectSummaryModel])
+async def get_projects(
+    request: Request,
+    after: int = Query(0, ge=0, description="Return projects with id greater than this cursor"),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    view: Literal["full", "summary"] = "full",
+    labels: list[str] = Depends(label_filter),
+    user: dict = Depends(require_user),
+):
+    # a 304 costs one primary-key lookup and never builds the payload
+    etag = make_etag(f"u{user['id']}", await run_db(user_projects_version, user["id"]), request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # keyset pagination on project.id; one extra row tells us whether there is a next page
+    fetch = limit + 1 if limit else -1
+
+    if view == "full" and PROJECTS_ASSEMBLY == "sql":
+        where_sql, where_params = project_filter(user["id"], labels, "p.id")
+        rows = await run_db(
+            build_projects_json,
+            f"p.user_id = :user_id AND p.id > :after{where_sql}",
+            {"user_id": user["id"], "after": after, **where_params},
+            fetch,
+            labels,
+        )
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        with timed("assembly"):
+            response = with_etag(json_response("[" + ",".join(row["payload"] for row in rows) + "]"), etag)
+        if has_more:
+            response.headers[NEXT_CURSOR_HEADER] = str(rows[-1]["id"])
+        return response
+
+    def query(con: sqlite3.Connection) -> tuple[list[dict], bool]:
+        filter_sql, filter_params = project_filter(user["id"], labels, "id")
+        cur = con.cursor()
+        cur.execute(
+            f"SELECT * FROM project WHERE user_id = :user_id AND id > :after{filter_sql} ORDER BY id ASC LIMIT :limit",
+            {"user_id": user["id"], "after": after, "limit": fetch, **filter_params},
+        )
+        rows = cur.fetchall()
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        if view == "summary":
+            return summarize_projects(con, rows, labels), has_more
+        return build_projects(con, rows, labels), has_more
+
+    projects, has_more = await run_db(query)
+    # build_projects and summarize_projects already return the response
+    # model's shape, so skip FastAPI's validation pass
+    response = with_etag(FastJSONResponse(projects), etag)
+    if has_more:
+        response.headers[NEXT_CURSOR_HEADER] = str(projects[-1]["id"])
+    return response
+
+
+async def load_project(project_id: int, user_id: int, labels: list[str] | None = None) -> bytes:
+    # the serialized payload, assembled in SQLite or by build_projects
+    if PROJECTS_ASSEMBLY == "sql":
+        rows = await run_db(
+            build_projects_json,
+            "p.id = :project_id AND p.user_id = :user_id",
+            {"project_id": project_id, "user_id": user_id},
+            -1,
+            labels,
+        )
+        if not rows:
+            raise HTTPException(status_code=404, detail="Project not found")
+        return rows[0]["payload"].encode()
+
+    def query(con: sqlite3.Connection) -> dict:
         cur = con.cursor()
         cur.execute(
             "SELECT * FROM project WHERE id = ? AND user_id = ?",
-            (project_id, user["id"]),
+            (project_id, user_id),
         )
         row = cur.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Project not found")
-        return build_projects([row])[0]
-    finally:
-        con.close()
+        return build_projects(con, [row], labels)[0]
+
+    return json.dumps(await run_db(query), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+@app.get("/getProject/{project_id}", response_model=ProjectModel)
+async def get_project(
+    project_id: int,
+    request: Request,
+    labels: list[str] = Depends(label_filter),
+    user: dict = Depends(require_user),
+):
+    version = await run_db(project_version, project_id, user["id"])
+    if version is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    # project ids are only unique per user once shards are on
+    etag = make_etag(f"u{user['id']}-p{project_id}", version, request)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    if labels:
+        payload = await load_project(project_id, user["id"], labels)
+    else:
+        payload = await project_cache.get_or_load(
+            (user["id"], project_id), version, partial(load_project, project_id, user["id"])
+        )
+    return with_etag(json_response(payload), etag)
+
+
+@app.get("/labels", response_model=list[LabelCount])
+async def get_labels(user: dict = Depends(require_user)):
+    return FastJSONResponse(await run_db(label_counts, user["id"]))
 
 
 
@@ -354,31 +965,30 @@ async def add_project(
     project_data: ProjectCreate,
     user: dict = Depends(require_user),
 ):
-    con = get_conn()
-    cur = con.cursor()
-    cur.execute(
-        """
-        INSERT INTO project (title, short_description, description, github, website, status, user_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            project_data.title,
-            project_data.short_description,
-            project_data.description,
-            project_data.github,
-            project_data.website,
-            project_data.status,
-            user["id"],
-        ),
-    )
-    new_id = cur.lastrowid
-    con.commit()
-    con.close()
+    def write(con: sqlite3.Connection) -> int | None:
+        cur = con.cursor()
+        cur.execute(
+            """
+            INSERT INTO project (title, short_description, description, github, website, status, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                project_data.title,
+                project_data.short_description,
+                project_data.description,
+                project_data.github,
+                project_data.website,
+                project_data.status,
+                user["id"],
+            ),
+        )
+        return cur.lastrowid
 
+    new_id = await run_write(write)
     if new_id is None:
         raise HTTPException(status_code=500, detail="Failed to create project")
 
-    return {
+    project = {
         "id": new_id,
         "title": project_data.title,
         "short_description": project_data.short_description,
@@ -391,39 +1001,67 @@ async def add_project(
         "in_progress": [],
         "done": [],
     }
+    publish_change(user["id"], "upsert", "project", new_id, new_id, {key: project[key] for key in PROJECT_FIELDS})
+    return project
+
+
+def client_ip(request: Request) -> str:
+    # only trust forwarding headers when running behind our own proxy
+    if os.getenv("TRUST_PROXY_HEADERS", "false").lower() == "true":
+        forwarded = request.headers.get("x-real-ip") or request.headers.get("x-forwarded-for", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def enforce_rate_limit(limiter: TokenBucketLimiter, key: str) -> None:
+    wait = limiter.acquire(key)
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
 
 
-@app.post("/login", response_model=LoginResponse)
-async def login(data: LoginRequest, response: Response):
-    con = get_conn()
+async def run_hash(fn, *args):
     try:
+        return await hash_pool.run(fn, *args)
+    except HashQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+
+@app.post("/login", response_model=LoginResponse)
+async def login(data: LoginRequest, request: Request, response: Response):
+    enforce_rate_limit(ip_limiter, client_ip(request))
+    enforce_rate_limit(username_limiter, data.username.strip().lower())
+
+    def lookup(con: sqlite3.Connection) -> sqlite3.Row | None:
         cur = con.cursor()
         cur.execute(
             "SELECT id, password_hash FROM user WHERE username = ?",
             (data.username,),
         )
-        row = cur.fetchone()
-        if not row or not verify_password(data.password, row["password_hash"]):
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-
-        token, expires = upsert_session(con, row["id"])
-        response.set_cookie(
-            SESSION_COOKIE,
-            token,
-            httponly=True,
-            max_age=int(SESSION_DURATION.total_seconds()),
-            expires=expires.strftime("%a, %d %b %Y %H:%M:%S GMT"),
-            samesite="lax",
-            secure=os.getenv("SESSION_COOKIE_SECURE", "false").lower() == "true",
-            path="/",
-        )
-        return {"user": {"id": row["id"], "username": data.username}}
-    finally:
-        con.close()
+        return cur.fetchone()
+
+    row = await run_db(lookup)
+    # scrypt runs in the hash pool and without holding a DB connection
+    if not row or not await run_hash(verify_password, data.password, row["password_hash"]):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    token, expires = await run_write(upsert_session, row["id"])
+    set_session_cookie(response, token, expires)
+    return {"user": {"id": row["id"], "username": data.username}}
 
 
 @app.post("/signup", response_model=LoginResponse)
-async def signup(data: SignupRequest, response: Response):
+async def signup(data: SignupRequest, request: Request, response: Response):
+    enforce_rate_limit(ip_limiter, client_ip(request))
+
     username = data.username.strip()
     if len(username) < 3:
         raise HTTPException(status_code=400, detail="Username must be at least 3 characters long")
@@ -432,14 +1070,18 @@ async def signup(data: SignupRequest, response: Response):
     if password_errors:
         raise HTTPException(status_code=400, detail=password_errors)
 
-    con = get_conn()
-    try:
+    def username_taken(con: sqlite3.Connection) -> bool:
         cur = con.cursor()
         cur.execute("SELECT 1 FROM user WHERE username = ?", (username,))
-        if cur.fetchone():
-            raise HTTPException(status_code=409, detail="Username already taken")
+        return cur.fetchone() is not None
+
+    if await run_db(username_taken):
+        raise HTTPException(status_code=409, detail="Username already taken")
+
+    password_hash = await run_hash(hash_password, data.password)
 
-        password_hash = hash_password(data.password)
+    def create(con: sqlite3.Connection) -> tuple[int, str, datetime]:
+        cur = con.cursor()
         try:
             cur.execute(
                 "INSERT INTO user (username, password_hash) VALUES (?, ?)",
@@ -449,36 +1091,20 @@ async def signup(data: SignupRequest, response: Response):
             raise HTTPException(status_code=409, detail="Username already taken")
 
         user_id = cur.lastrowid
-        con.commit()
-
         token, expires = upsert_session(con, user_id)
-        response.set_cookie(
-            SESSION_COOKIE,
-            token,
-            httponly=True,
-            max_age=int(SESSION_DURATION.total_seconds()),
-            expires=expires.strftime("%a, %d %b %Y %H:%M:%S GMT"),
-            samesite="lax",
-            secure=os.getenv("SESSION_COOKIE_SECURE", "false").lower() == "true",
-            path="/",
-        )
+        return user_id, token, expires
 
-        return {"user": {"id": user_id, "username": username}}
-    finally:
-        con.close()
+    user_id, token, expires = await run_write(create)
+    set_session_cookie(response, token, expires)
+    return {"user": {"id": user_id, "username": username}}
 
 
 @app.post("/logout")
 async def logout(request: Request, response: Response):
     token = request.cookies.get(SESSION_COOKIE)
     if token:
-        con = get_conn()
-        try:
-            cur = con.cursor()
-            cur.execute("DELETE FROM session WHERE token = ?", (token,))
-            con.commit()
-        finally:
-            con.close()
+        session_cache.invalidate(token)
+        await run_write(delete_session, token)
 
     response.delete_cookie(SESSION_COOKIE, path="/")
     return {"ok": True}
@@ -488,23 +1114,12 @@ async def logout(request: Request, response: Response):
 async def get_me(user: dict = Depends(require_user)):
     return user
 
-@app.patch("/projects/{project_id}", response_model=ProjectModel)
+@app.patch("/projects/{project_id}", response_model=ProjectFieldsModel)
 async def edit_project(
     project_id: int,
     updates: dict,
     user: dict = Depends(require_user),
 ):
-    con = get_conn()
-    cur = con.cursor()
-
-    cur.execute(
-        "SELECT id FROM project WHERE id = ? AND user_id = ?",
-        (project_id, user["id"]),
-    )
-    if not cur.fetchone():
-        con.close()
-        raise HTTPException(status_code=404, detail="Project not found")
-
     title             = updates.get("title")
     short_description = updates.get("short_description")
     description       = updates.get("description")
@@ -513,76 +1128,150 @@ async def edit_project(
     status            = updates.get("status")
 
     if status is not None and status not in {"idea","active","paused","done"}:
-        con.close()
         raise HTTPException(status_code=400, detail="Invalid project status")
 
-    cur.execute(
-        """
-        UPDATE project
-           SET title             = COALESCE(?, title),
-               short_description = COALESCE(?, short_description),
-               description       = COALESCE(?, description),
-               github            = COALESCE(?, github),
-               website           = COALESCE(?, website),
-               status            = COALESCE(?, status)
-         WHERE id = ?
-        """,
-        (title, short_description, description, github, website, status, project_id)
-    )
-    con.commit()
-    con.close()
-    # chane in future to return updated fields only
-    return await get_project(project_id, user)
+    def write(con: sqlite3.Connection) -> dict:
+        cur = con.cursor()
+        cur.execute(
+            f"""
+            UPDATE project
+               SET title             = COALESCE(?, title),
+                   short_description = COALESCE(?, short_description),
+                   description       = COALESCE(?, description),
+                   github            = COALESCE(?, github),
+                   website           = COALESCE(?, website),
+                   status            = COALESCE(?, status)
+             WHERE id = ? AND user_id = ?
+            RETURNING {', '.join(PROJECT_FIELDS)}
+            """,
+            (title, short_description, description, github, website, status, project_id, user["id"])
+        )
+        row = cur.fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        return dict(row)
 
+    # only the project's own fields; tasks and notes are untouched
+    fields = await run_write(write)
+    project_cache.invalidate((user["id"], project_id))
+    publish_change(user["id"], "upsert", "project", project_id, project_id, fields)
+    return fields
 
-# -------- Tasks --------
-@app.post("/projects/{project_id}/tasks", response_model=dict)
-async def add_task(project_id: int, task: dict, user: dict = Depends(require_user)):
-    con = get_conn()
-    cur = con.cursor()
 
-    cur.execute(
-        "SELECT id FROM project WHERE id = ? AND user_id = ?",
-        (project_id, user["id"]),
+# -------- Changes --------
+@app.get("/changes", response_model=ChangesResponse, response_model_exclude_none=True)
+async def get_changes(
+    since: int = Query(0, ge=0, description="Cursor returned by the previous call"),
+    limit: int = Query(500, ge=1, le=1000),
+    user: dict = Depends(require_user),
+):
+    # read_changes leaves out data instead of sending null
+    return FastJSONResponse(await run_db(read_changes, user["id"], since, limit))
+
+
+# -------- Live updates --------
+@app.get("/events")
+async def stream_events(
+    project_id: int | None = Query(None, description="Only events for this project"),
+    user: dict = Depends(require_user),
+):
+    if project_id is not None and await run_db(project_version, project_id, user["id"]) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    # anything published before we subscribe is in /changes after this cursor
+    cursor = await run_db(latest_seq)
+
+    async def stream():
+        sub = broker.subscribe(user["id"], project_id, cursor)
+        try:
+            yield format_sse("ready", {"cursor": cursor})
+            while True:
+                events = await sub.next(SSE_HEARTBEAT)
+                if events is None:
+                    yield ": keepalive\n\n"
+                    continue
+                for event in events:
+                    yield format_sse("resync" if event["op"] == "resync" else "change", event)
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # nginx would otherwise buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+
+
+# -------- Search --------
+@app.get("/search", response_model=list[SearchResult])
+async def search_projects(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    user: dict = Depends(require_user),
+):
+    return FastJSONResponse(await run_db(search, user["id"], q, limit, offset))
+
+
+# -------- Task and note writes --------
+# Shared by the single-item handlers and /batch. All run through run_write,
+# which commits, so none of them commit themselves. Each
+# write is one statement with the ownership check in its WHERE clause; the
+# follow-up lookup in not_found only runs on the error path.
+OWNED_PROJECT = "SELECT id FROM project WHERE id = ? AND user_id = ?"
+
+TASK_LABELS_JSON = """
+    (SELECT json_group_array(name) FROM (
+        SELECT l.name FROM task_label AS tl JOIN label AS l ON l.id = tl.label_id
+         WHERE tl.task_id = task.id ORDER BY tl.position
+    ))
+"""
+
+
+def require_project(con: sqlite3.Connection, project_id: int, user_id: int) -> None:
+    cur = con.cursor()
+    cur.execute(OWNED_PROJECT, (project_id, user_id))
     if cur.fetchone() is None:
-        con.close()
         raise HTTPException(status_code=404, detail="Project not found")
 
+
+def not_found(con: sqlite3.Connection, project_id: int, user_id: int, detail: str) -> HTTPException:
+    require_project(con, project_id, user_id)
+    return HTTPException(status_code=404, detail=detail)
+
+
+def insert_task(con: sqlite3.Connection, user_id: int, project_id: int, task: dict) -> dict:
+    cur = con.cursor()
+
     title = (task.get("title") or "").strip()
     if not title:
-        con.close()
         raise HTTPException(status_code=400, detail="Task title cannot be empty")
 
     desc = task.get("desc")
     status = task.get("status") or "open"
     if status not in {"open", "in_progress", "done"}:
-        con.close()
         raise HTTPException(status_code=400, detail="Invalid task status")
 
-    labels = task.get("labels") or []
-    try:
-        labels_json = json.dumps(labels, ensure_ascii=False)
-    except (TypeError, json.JSONDecodeError):
-        labels = []
-        labels_json = "[]"
+    labels = normalize_labels(task.get("labels") or [])
 
     try:
         cur.execute(
-            """
-            INSERT INTO task (project_id, title, desc, status, labels_json)
-            VALUES (?, ?, ?, ?, ?)
+            f"""
+            INSERT INTO task (project_id, title, desc, status)
+            SELECT ?, ?, ?, ? WHERE EXISTS ({OWNED_PROJECT})
+            RETURNING id
             """,
-            (project_id, title, desc, status, labels_json),
+            (project_id, title, desc, status, project_id, user_id),
         )
-        task_id = cur.lastrowid
-        con.commit()
+        row = cur.fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        task_id = row["id"]
+        if labels:
+            set_task_labels(con, user_id, task_id, labels)
     except sqlite3.IntegrityError as e:
-        con.close()
         raise HTTPException(status_code=400, detail=str(e))
 
-    con.close()
-
     return {
         "id": task_id,
         "title": title,
@@ -592,230 +1281,300 @@ async def add_task(project_id: int, task: dict, user: dict = Depends(require_use
     }
 
 
-@app.delete("/projects/{project_id}/tasks/{task_id}", response_model=dict)
-async def delete_task(
-    project_id: int,
-    task_id: int,
-    user: dict = Depends(require_user),
-):
-    con = get_conn()
+def apply_task_update(con: sqlite3.Connection, user_id: int, project_id: int, task_id: int, updates: dict) -> dict:
     cur = con.cursor()
 
-    cur.execute(
-        "SELECT id FROM project WHERE id = ? AND user_id = ?",
-        (project_id, user["id"]),
-    )
-    if cur.fetchone() is None:
-        con.close()
-        raise HTTPException(status_code=404, detail="Project not found")
-
-    cur.execute(
-        "DELETE FROM task WHERE id = ? AND project_id = ?",
-        (task_id, project_id)
-    )
-    if cur.rowcount == 0:
-        con.close()
-        raise HTTPException(status_code=404, detail="Task not found")
-
-    con.commit()
-    con.close()
-
-    return {"success": True, "deleted_task_id": task_id}
-
-
-@app.patch("/projects/{project_id}/tasks/{task_id}", response_model=dict)
-async def update_task(
-    project_id: int,
-    task_id: int,
-    updates: dict,
-    user: dict = Depends(require_user),
-):
-    con = get_conn()
-    cur = con.cursor()
-
-    cur.execute(
-        "SELECT id FROM project WHERE id = ? AND user_id = ?",
-        (project_id, user["id"]),
-    )
-    if not cur.fetchone():
-        con.close()
-        raise HTTPException(status_code=404, detail="Project not found")
-
-    cur.execute(
-        "SELECT 1 FROM task WHERE id = ? AND project_id = ?",
-        (task_id, project_id)
-    )
-    if not cur.fetchone():
-        con.close()
-        raise HTTPException(status_code=404, detail="Task not found")
-
     title  = updates.get("title")
     desc   = updates.get("desc")
     status = updates.get("status")
-    labels_json = (
-        json.dumps(updates["labels"], ensure_ascii=False)
-        if "labels" in updates else None
-    )
+    relabel = "labels" in updates
 
     try:
+        # with new labels the old ones are not worth reading back
         cur.execute(
-            """
+            f"""
             UPDATE task
                SET title       = COALESCE(?, title),
                    desc        = COALESCE(?, desc),
-                   status      = COALESCE(?, status),
-                   labels_json = COALESCE(?, labels_json)
-             WHERE id = ? AND project_id = ?
+                   status      = COALESCE(?, status)
+             WHERE id = ? AND project_id IN ({OWNED_PROJECT})
+            RETURNING id, title, desc, status, {"'[]'" if relabel else TASK_LABELS_JSON} AS labels
             """,
-            (title, desc, status, labels_json, task_id, project_id)
-        )
-        con.commit()
-        
-        cur.execute(
-            "SELECT id, title, desc, status, labels_json FROM task WHERE id = ? AND project_id = ?",
-            (task_id, project_id)
+            (title, desc, status, task_id, project_id, user_id)
         )
         row = cur.fetchone()
-        if not row:
-            con.close()
-            raise HTTPException(status_code=500, detail="Row missing after update")
-
+        if row is None:
+            raise not_found(con, project_id, user_id, "Task not found")
+        labels = json.loads(row["labels"])
+        if relabel:
+            labels = normalize_labels(updates["labels"])
+            set_task_labels(con, user_id, task_id, labels)
     except sqlite3.IntegrityError as e:
-        con.close()
         raise HTTPException(status_code=400, detail=str(e))
 
-    con.close()
-
     return {
         "id": row["id"],
         "title": row["title"],
         "desc": row["desc"],
         "status": row["status"],
-        "labels": json.loads(row["labels_json"] or "[]"),
+        "labels": labels,
     }
 
 
-@app.delete("/projects/{project_id}", response_model=dict)
-async def delete_project(project_id: int, user: dict = Depends(require_user)):
-    con = get_conn()
+def remove_task(con: sqlite3.Connection, user_id: int, project_id: int, task_id: int) -> None:
     cur = con.cursor()
-
     cur.execute(
-        "SELECT id FROM project WHERE id = ? AND user_id = ?",
-        (project_id, user["id"]),
+        f"DELETE FROM task WHERE id = ? AND project_id IN ({OWNED_PROJECT})",
+        (task_id, project_id, user_id)
     )
-    if not cur.fetchone():
-        con.close()
-        raise HTTPException(status_code=404, detail="Project not found")
-
-    cur.execute("DELETE FROM project WHERE id = ?", (project_id,))
-    con.commit()
-    con.close()
-
-    return {"success": True, "deleted_project_id": project_id}
+    if cur.rowcount == 0:
+        raise not_found(con, project_id, user_id, "Task not found")
 
-# -------- Notes --------
 
-@app.post("/projects/{project_id}/notes", response_model=dict)
-async def add_note(
-    project_id: int,
-    note: dict,
-    user: dict = Depends(require_user),
-):
+def insert_note(con: sqlite3.Connection, user_id: int, project_id: int, note: dict) -> dict:
     body = (note.get("desc") or "").strip()
     if not body:
         raise HTTPException(status_code=400, detail="Note body cannot be empty")
 
-    con = get_conn()
     cur = con.cursor()
     cur.execute(
-        "SELECT id FROM project WHERE id = ? AND user_id = ?",
-        (project_id, user["id"]),
+        f"""
+        INSERT INTO note (project_id, body)
+        SELECT ?, ? WHERE EXISTS ({OWNED_PROJECT})
+        RETURNING id
+        """,
+        (project_id, body, project_id, user_id),
     )
-    if not cur.fetchone():
-        con.close()
+    row = cur.fetchone()
+    if row is None:
         raise HTTPException(status_code=404, detail="Project not found")
+    return {"id": row["id"], "desc": body}
 
-    cur.execute("INSERT INTO note (project_id, body) VALUES (?, ?)", (project_id, body))
-    note_id = cur.lastrowid
-    con.commit()
-    con.close()
-    return {"id": note_id, "desc": body}
 
+def apply_note_update(con: sqlite3.Connection, user_id: int, project_id: int, note_id: int, updates: dict) -> dict:
+    cur = con.cursor()
+    cur.execute(
+        f"""
+        UPDATE note
+           SET body = COALESCE(?, body)
+         WHERE id = ? AND project_id IN ({OWNED_PROJECT})
+        RETURNING id, body
+        """,
+        (updates.get("desc"), note_id, project_id, user_id)
+    )
+    row = cur.fetchone()
+    if row is None:
+        raise not_found(con, project_id, user_id, "Note not found")
+    return {"id": row["id"], "desc": row["body"]}
 
 
-@app.patch("/projects/{project_id}/notes/{note_id}", response_model=dict)
-async def edit_note(
+def remove_note(con: sqlite3.Connection, user_id: int, project_id: int, note_id: int) -> None:
+    cur = con.cursor()
+    cur.execute(
+        f"DELETE FROM note WHERE id = ? AND project_id IN ({OWNED_PROJECT})",
+        (note_id, project_id, user_id)
+    )
+    if cur.rowcount == 0:
+        raise not_found(con, project_id, user_id, "Note not found")
+
+
+def publish_item(user_id: int, entity: str, op: str, project_id: int, item_id: int, result: dict | None) -> None:
+    if op == "delete":
+        publish_change(user_id, "delete", entity, item_id, project_id)
+    else:
+        publish_change(user_id, "upsert", entity, item_id, project_id, {**result, "project_id": project_id})
+
+
+# -------- Tasks --------
+@app.post("/projects/{project_id}/tasks", response_model=TaskModel)
+async def add_task(project_id: int, task: TaskFields, user: dict = Depends(require_user)):
+    created = await run_write(insert_task, user["id"], project_id, task.model_dump(exclude_unset=True))
+    project_cache.invalidate((user["id"], project_id))
+    publish_item(user["id"], "task", "create", project_id, created["id"], created)
+    return created
+
+
+@app.delete("/projects/{project_id}/tasks/{task_id}", response_model=TaskDeleted)
+async def delete_task(
     project_id: int,
-    note_id: int,
-    updates: dict,
+    task_id: int,
     user: dict = Depends(require_user),
 ):
-    con = get_conn()
-    cur = con.cursor()
+    await run_write(remove_task, user["id"], project_id, task_id)
+    project_cache.invalidate((user["id"], project_id))
+    publish_item(user["id"], "task", "delete", project_id, task_id, None)
+    return {"success": True, "deleted_task_id": task_id}
 
-    cur.execute(
-        "SELECT id FROM project WHERE id = ? AND user_id = ?",
-        (project_id, user["id"]),
-    )
-    if not cur.fetchone():
-        con.close()
-        raise HTTPException(status_code=404, detail="Project not found")
 
-    cur.execute(
-        "SELECT id FROM note WHERE id = ? AND project_id = ?",
-        (note_id, project_id)
-    )
-    if not cur.fetchone():
-        con.close()
-        raise HTTPException(status_code=404, detail="Note not found")
+@app.patch("/projects/{project_id}/tasks/{task_id}", response_model=TaskModel)
+async def update_task(
+    project_id: int,
+    task_id: int,
+    updates: TaskFields,
+    user: dict = Depends(require_user),
+):
+    updated = await run_write(apply_task_update, user["id"], project_id, task_id, updates.model_dump(exclude_unset=True))
+    project_cache.invalidate((user["id"], project_id))
+    publish_item(user["id"], "task", "update", project_id, task_id, updated)
+    return updated
 
-    body = updates.get("desc")
 
-    cur.execute(
-        """
-        UPDATE note
-           SET body = COALESCE(?, body)
-         WHERE id = ? AND project_id = ?
-        """,
-        (body, note_id, project_id)
-    )
-    con.commit()
-    con.close()
+@app.delete("/projects/{project_id}", response_model=ProjectDeleted)
+async def delete_project(project_id: int, user: dict = Depends(require_user)):
+    def write(con: sqlite3.Connection) -> None:
+        cur = con.cursor()
+        cur.execute("DELETE FROM project WHERE id = ? AND user_id = ?", (project_id, user["id"]))
+        if cur.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+    await run_write(write)
+    project_cache.invalidate((user["id"], project_id))
+    publish_change(user["id"], "delete", "project", project_id, project_id)
+    return {"success": True, "deleted_project_id": project_id}
+
+# -------- Notes --------
 
-    return {"id": note_id, "desc": updates.get("desc")}
+@app.post("/projects/{project_id}/notes", response_model=NoteModel)
+async def add_note(
+    project_id: int,
+    note: NoteFields,
+    user: dict = Depends(require_user),
+):
+    created = await run_write(insert_note, user["id"], project_id, note.model_dump(exclude_unset=True))
+    project_cache.invalidate((user["id"], project_id))
+    publish_item(user["id"], "note", "create", project_id, created["id"], created)
+    return created
 
 
-@app.delete("/projects/{project_id}/notes/{note_id}", response_model=dict)
+
+@app.patch("/projects/{project_id}/notes/{note_id}", response_model=NoteModel)
+async def edit_note(
+    project_id: int,
+    note_id: int,
+    updates: NoteFields,
+    user: dict = Depends(require_user),
+):
+    updated = await run_write(apply_note_update, user["id"], project_id, note_id, updates.model_dump(exclude_unset=True))
+    project_cache.invalidate((user["id"], project_id))
+    publish_item(user["id"], "note", "update", project_id, note_id, updated)
+    return updated
+
+
+@app.delete("/projects/{project_id}/notes/{note_id}", response_model=NoteDeleted)
 async def delete_note(
     project_id: int,
     note_id: int,
     user: dict = Depends(require_user),
 ):
-    con = get_conn()
-    cur = con.cursor()
+    await run_write(remove_note, user["id"], project_id, note_id)
+    project_cache.invalidate((user["id"], project_id))
+    publish_item(user["id"], "note", "delete", project_id, note_id, None)
+    return {"success": True, "deleted_note_id": note_id}
 
-    cur.execute(
-        "SELECT id FROM project WHERE id = ? AND user_id = ?",
-        (project_id, user["id"]),
-    )
-    if not cur.fetchone():
-        con.close()
-        raise HTTPException(status_code=404, detail="Project not found")
 
-    cur.execute(
-        "SELECT id FROM note WHERE id = ? AND project_id = ?",
-        (note_id, project_id)
-    )
-    if not cur.fetchone():
-        con.close()
-        raise HTTPException(status_code=404, detail="Note not found")
+# -------- Batch --------
+def apply_operation(con: sqlite3.Connection, user_id: int, project_id: int, operation: TaskOperation | NoteOperation) -> dict | None:
+    if operation.op != "create" and operation.id is None:
+        raise HTTPException(status_code=400, detail=f"{operation.op} needs an id")
+    data = operation.data.model_dump(exclude_unset=True)
+    if operation.entity == "task":
+        if operation.op == "create":
+            return insert_task(con, user_id, project_id, data)
+        if operation.op == "update":
+            return apply_task_update(con, user_id, project_id, operation.id, data)
+        remove_task(con, user_id, project_id, operation.id)
+        return None
+    if operation.op == "create":
+        return insert_note(con, user_id, project_id, data)
+    if operation.op == "update":
+        return apply_note_update(con, user_id, project_id, operation.id, data)
+    remove_note(con, user_id, project_id, operation.id)
+    return None
 
-    cur.execute(
-        "DELETE FROM note WHERE id = ? AND project_id = ?",
-        (note_id, project_id)
+
+@app.post("/projects/{project_id}/batch", response_model=BatchResponse, response_model_exclude_none=True)
+async def batch_mutations(
+    project_id: int,
+    batch: BatchRequest,
+    user: dict = Depends(require_user),
+):
+    # one write job with one ownership check for the whole batch; each
+    # operation runs in a savepoint so a failure only undoes itself, and an
+    # exception undoes the whole job
+    def write(con: sqlite3.Connection) -> list[dict]:
+        cur = con.cursor()
+        require_project(con, project_id, user["id"])
+
+        results = []
+        for index, operation in enumerate(batch.operations):
+            cur.execute("SAVEPOINT batch_op")
+            try:
+                result = apply_operation(con, user["id"], project_id, operation)
+            except HTTPException as e:
+                cur.execute("ROLLBACK TO batch_op")
+                cur.execute("RELEASE batch_op")
+                failure = {"index": index, "ok": False, "status": e.status_code, "error": e.detail}
+                if batch.atomic:
+                    # nothing is kept, so the operations before this one are
+                    # reported as not applied
+                    rolled_back = [{"index": r["index"], "ok": False, "status": 424, "error": "Rolled back"} for r in results]
+                    raise HTTPException(
+                        status_code=e.status_code,
+                        detail={"committed": False, "results": [*rolled_back, failure]},
+                    )
+                results.append(failure)
+                continue
+            cur.execute("RELEASE batch_op")
+            results.append({"index": index, "ok": True, "status": 200, "result": result})
+
+        return results
+
+    results = await run_write(write)
+    project_cache.invalidate((user["id"], project_id))
+    for operation, result in zip(batch.operations, results):
+        if result["ok"]:
+            item_id = result["result"]["id"] if operation.op == "create" else operation.id
+            publish_item(user["id"], operation.entity, operation.op, project_id, item_id, result["result"])
+    return {"committed": True, "results": results}
+
+
+# -------- Export / import --------
+@app.get("/export")
+async def export_projects(user: dict = Depends(require_user)):
+    # NDJSON streamed from one read snapshot; memory stays flat however
+    # large the account is
+    if export_busy():
+        raise HTTPException(status_code=503, detail="Too many exports running, try again shortly")
+    return StreamingResponse(
+        stream_export(user["id"]),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="projectboard-export.ndjson"'},
     )
-    con.commit()
-    con.close()
 
-    return {"success": True, "deleted_note_id": note_id}
+
+@app.post("/import")
+async def import_projects(request: Request, user: dict = Depends(require_user)):
+    # accepts an /export file (or anything in its format) and adds every
+    # project in it as a new project; committed batches stay on failure
+    progress = import_progress(user["id"])
+    if progress is not None and progress["state"] == "running":
+        raise HTTPException(status_code=409, detail="An import is already running")
+
+    importer = Importer(user["id"])
+    try:
+        await importer.run(request.stream(), run_write)
+    except ImportRejected as e:
+        raise HTTPException(status_code=400, detail={"line": e.line, "error": e.message, "imported": importer.progress})
+    finally:
+        if importer.project_ids:
+            broker.resync(user["id"])
+    logger.info("Import for user %s: %s", user["id"], importer.progress)
+    return {**importer.progress, "project_ids": importer.project_ids}
+
+
+@app.get("/import/status")
+async def import_status(user: dict = Depends(require_user)):
+    progress = import_progress(user["id"])
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No import on this worker")
+    return progress
@@ -0,0 +1,243 @@
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import json
+import logging
+import sqlite3
+import os
+
+from app.db import open_connection
+from app.writer import run_write
+
+
+logger = logging.getLogger(__name__)
+
+SESSION_REAP_INTERVAL = float(os.getenv("SESSION_REAP_INTERVAL", "300"))
+SESSION_REAP_BATCH = int(os.getenv("SESSION_REAP_BATCH", "500"))
+# workers poll cache_invalidation every CACHE_POLL_INTERVAL seconds; rows
+# older than this have long been seen
+CACHE_INVALIDATION_RETENTION = timedelta(seconds=float(os.getenv("CACHE_INVALIDATION_RETENTION", "600")))
+
+TABLES = ("user", "session", "project", "task", "note", "label", "task_label", "change_log", "cache_invalidation")
+
+
+# -------- Session reaper --------
+def reap_expired_sessions(con: sqlite3.Connection, now: datetime, batch_size: int) -> int:
+    # one batch per call, so each write stays short; uses
+    # idx_session_expires_at. Does not commit (see run_write).
+    cur = con.cursor()
+    cur.execute(
+        """
+        DELETE FROM session
+         WHERE token IN (
+            SELECT token FROM session WHERE expires_at < ? LIMIT ?
+         )
+        """,
+        (now.isoformat(), batch_size),
+    )
+    return cur.rowcount
+
+
+def prune_invalidations(con: sqlite3.Connection, cutoff: datetime, batch_size: int) -> int:
+    cur = con.cursor()
+    cur.execute(
+        """
+        DELETE FROM cache_invalidation
+         WHERE seq IN (
+            SELECT seq FROM cache_invalidation WHERE created_at < ? LIMIT ?
+         )
+        """,
+        (cutoff.isoformat(), batch_size),
+    )
+    return cur.rowcount
+
+
+async def reap_once(batch_size: int = SESSION_REAP_BATCH) -> int:
+    now = datetime.utcnow()
+    total = 0
+    for step, cutoff in (
+        (reap_expired_sessions, now),
+        (prune_invalidations, now - CACHE_INVALIDATION_RETENTION),
+    ):
+        while True:
+            # through the group-commit writer rather than a pooled
+            # connection of its own competing for the write lock
+            deleted = await run_write(step, cutoff, batch_size)
+            total += deleted
+            if deleted < batch_size:
+                break
+            # let other writers in between batches
+            await asyncio.sleep(0.05)
+    return total
+
+
+async def session_reaper(interval: float = SESSION_REAP_INTERVAL) -> None:
+    while True:
+        try:
+            deleted = await reap_once()
+            if deleted:
+                logger.info("Reaped %d expired sessions and invalidation rows", deleted)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Session reaper failed")
+        await asyncio.sleep(interval)
+
+
+# -------- Storage --------
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def table_stats(con: sqlite3.Connection) -> dict:
+    page_size = con.execute("PRAGMA page_size").fetchone()[0]
+    page_count = con.execute("PRAGMA page_count").fetchone()[0]
+    freelist = con.execute("PRAGMA freelist_count").fetchone()[0]
+    auto_vacuum = con.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+    tables = {}
+    for table in TABLES:
+        (rows,) = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        tables[table] = {"rows": rows}
+
+    # dbstat is optional in SQLite builds
+    try:
+        for row in con.execute("SELECT name, SUM(pgsize) AS bytes FROM dbstat GROUP BY name"):
+            if row["name"] in tables:
+                tables[row["name"]]["bytes"] = row["bytes"]
+    except sqlite3.OperationalError:
+        pass
+
+    return {
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_count": freelist,
+        "file_bytes": page_size * page_count,
+        "reclaimable_bytes": page_size * freelist,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+        "tables": tables,
+    }
+
+
+def incremental_vacuum(con: sqlite3.Connection, pages: int | None = None) -> dict:
+    before = table_stats(con)
+    if before["auto_vacuum"] != "incremental":
+        # switching modes on an existing file needs one full VACUUM
+        con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        con.execute("VACUUM")
+    elif pages:
+        con.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+    else:
+        con.execute("PRAGMA incremental_vacuum")
+    after = table_stats(con)
+    return {
+        "reclaimed_bytes": before["file_bytes"] - after["file_bytes"],
+        "before": before,
+        "after": after,
+    }
+
+
+# -------- Query plans --------
+# Hot statements from main.py with representative parameters, for checking a
+# deployed database's indexes. None of them may fall back to a full table
+# scan. tests/test_query_plans.py explains the statements the endpoints
+# actually run.
+QUERY_PLAN_CHECKS = [
+    ("session lookup", "SELECT user.id, user.username, session.expires_at FROM session JOIN user ON user.id = session.user_id WHERE session.token = ?", ("t",)),
+    ("session delete", "DELETE FROM session WHERE token = ?", ("t",)),
+    ("session refresh", "UPDATE session SET expires_at = ? WHERE token = ?", ("x", "t")),
+    ("session reap", "DELETE FROM session WHERE token IN (SELECT token FROM session WHERE expires_at < ? LIMIT ?)", ("x", 1)),
+    ("sessions by user", "SELECT token FROM session WHERE user_id = ?", (1,)),
+    ("user projects version", "SELECT projects_version FROM user WHERE id = ?", (1,)),
+    ("project version", "SELECT version FROM project WHERE id = ? AND user_id = ?", (1, 1)),
+    ("changes since cursor", "SELECT MAX(seq) FROM change_log WHERE user_id = ? AND seq > ? GROUP BY entity, entity_id", (1, 0)),
+    ("change log window", "SELECT MAX(seq) FROM (SELECT seq FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?)", (0, 10)),
+    ("superseded changes", "DELETE FROM change_log AS c WHERE c.seq > ? AND c.seq <= ? AND EXISTS (SELECT 1 FROM change_log AS d WHERE d.entity = c.entity AND d.entity_id = c.entity_id AND d.seq > c.seq)", (0, 10)),
+    ("expired changes", "SELECT seq FROM change_log WHERE changed_at < ? ORDER BY changed_at ASC, seq ASC LIMIT ?", ("x", 10)),
+    ("new invalidations", "SELECT seq, scope, key FROM cache_invalidation WHERE seq > ? ORDER BY seq", (0,)),
+    ("expired invalidations", "DELETE FROM cache_invalidation WHERE seq IN (SELECT seq FROM cache_invalidation WHERE created_at < ? LIMIT ?)", ("x", 10)),
+    ("user by name", "SELECT id, password_hash FROM user WHERE username = ?", ("u",)),
+    ("projects by user", "SELECT * FROM project WHERE user_id = ? ORDER BY id ASC", (1,)),
+    ("project ownership", "SELECT id FROM project WHERE id = ? AND user_id = ?", (1, 1)),
+    ("project update", "UPDATE project SET title = COALESCE(?, title) WHERE id = ? AND user_id = ? RETURNING id", ("t", 1, 1)),
+    ("project delete", "DELETE FROM project WHERE id = ? AND user_id = ?", (1, 1)),
+    ("notes for projects", "SELECT id, project_id, body FROM note WHERE project_id IN (?, ?) ORDER BY id ASC", (1, 2)),
+    ("tasks for projects", "SELECT id, project_id, title, desc, status FROM task WHERE project_id IN (?, ?) ORDER BY id ASC", (1, 2)),
+    ("tasks by project", "SELECT id FROM task WHERE project_id = ?", (1,)),
+    ("task lookup", "SELECT id, title, desc, status FROM task WHERE id = ? AND project_id = ?", (1, 1)),
+    ("labels for tasks", "SELECT tl.task_id, l.name FROM task_label AS tl JOIN label AS l ON l.id = tl.label_id WHERE tl.task_id IN (?, ?) ORDER BY tl.task_id, tl.position", (1, 2)),
+    ("tasks by label", "SELECT tl.task_id FROM label AS l JOIN task_label AS tl ON tl.label_id = l.id WHERE l.user_id = ? AND l.name IN (?, ?) GROUP BY tl.task_id HAVING COUNT(*) = 2", (1, "a", "b")),
+    ("label counts", "SELECT name, task_count FROM label WHERE user_id = ? AND task_count > 0 ORDER BY name ASC", (1,)),
+    ("task labels replace", "DELETE FROM task_label WHERE task_id = ?", (1,)),
+    ("task insert", "INSERT INTO task (project_id, title, desc, status) SELECT ?, ?, ?, ? WHERE EXISTS (SELECT id FROM project WHERE id = ? AND user_id = ?) RETURNING id", (1, "t", None, "open", 1, 1)),
+    ("task update", "UPDATE task SET status = COALESCE(?, status) WHERE id = ? AND project_id IN (SELECT id FROM project WHERE id = ? AND user_id = ?) RETURNING id, (SELECT json_group_array(name) FROM (SELECT l.name FROM task_label AS tl JOIN label AS l ON l.id = tl.label_id WHERE tl.task_id = task.id ORDER BY tl.position))", ("done", 1, 1, 1)),
+    ("task delete", "DELETE FROM task WHERE id = ? AND project_id IN (SELECT id FROM project WHERE id = ? AND user_id = ?)", (1, 1, 1)),
+    ("task labels insert", "INSERT INTO task_label (task_id, label_id, position) SELECT ?, l.id, j.key FROM json_each(?) AS j JOIN label AS l ON l.user_id = ? AND l.name = j.value", (1, '["a"]', 1)),
+    ("notes by project", "SELECT id FROM note WHERE project_id = ?", (1,)),
+    ("note lookup", "SELECT id FROM note WHERE id = ? AND project_id = ?", (1, 1)),
+    ("note update", "UPDATE note SET body = COALESCE(?, body) WHERE id = ? AND project_id IN (SELECT id FROM project WHERE id = ? AND user_id = ?) RETURNING id, body", ("b", 1, 1, 1)),
+    ("note delete", "DELETE FROM note WHERE id = ? AND project_id IN (SELECT id FROM project WHERE id = ? AND user_id = ?)", (1, 1, 1)),
+]
+
+
+def query_plan(con: sqlite3.Connection, sql: str, params: tuple = ()) -> list[str]:
+    return [row["detail"] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def is_table_scan(detail: str) -> bool:
+    # "SCAN task" is a full scan; "SEARCH ...", "SCAN ... USING INDEX" and
+    # scans over subquery results or virtual tables (json_each, fts) are not
+    if not detail.startswith("SCAN ") or detail.startswith("SCAN (subquery"):
+        return False
+    return not any(marker in detail for marker in ("USING", "CONSTANT ROW", "VIRTUAL TABLE"))
+
+
+def table_scans(plan: list[str]) -> list[str]:
+    # full scans in one statement's plan, leaving out scans of the rows a
+    # CO-ROUTINE or MATERIALIZE step of the same plan produced ("SCAN t" for a
+    # derived table aliased t), which read no table
+    produced = {detail.split(" ", 1)[1] for detail in plan if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+    return [detail for detail in plan if is_table_scan(detail) and detail.split(" ", 2)[1] not in produced]
+
+
+def check_query_plans(con: sqlite3.Connection, checks=QUERY_PLAN_CHECKS) -> list[dict]:
+    failures = []
+    for name, sql, params in checks:
+        plan = query_plan(con, sql, params)
+        if table_scans(plan):
+            failures.append({"name": name, "sql": sql, "plan": plan})
+    return failures
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="report table sizes and free pages")
+    vacuum = sub.add_parser("vacuum", help="reap expired sessions and reclaim free pages")
+    vacuum.add_argument("--pages", type=int, default=None, help="max pages to reclaim")
+    sub.add_parser("plans", help="fail if a hot query falls back to a table scan")
+    args = parser.parse_args(argv)
+
+    con = open_connection()
+    try:
+        if args.command == "stats":
+            result = table_stats(con)
+        elif args.command == "plans":
+            failures = check_query_plans(con)
+            print(json.dumps({"checked": len(QUERY_PLAN_CHECKS), "failures": failures}, indent=2))
+            raise SystemExit(1 if failures else 0)
+        else:
+            reaped = 0
+            while True:
+                deleted = reap_expired_sessions(con, datetime.utcnow(), SESSION_REAP_BATCH)
+                con.commit()
+                reaped += deleted
+                if deleted < SESSION_REAP_BATCH:
+                    break
+            result = {"reaped_sessions": reaped, **incremental_vacuum(con, args.pages)}
+    finally:
+        con.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
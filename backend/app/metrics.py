@@ -0,0 +1,107 @@
+from bisect import bisect_left
+import math
+import time
+import os
+
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16, 32, 64)
+# requests that matched no route share one label, so scanners cannot blow
+# up the number of series
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # per-bucket counts; the last slot is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict) -> str:
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+    # Request counts by route template and status, plus latency, SQL statement
+    # and SQL time histograms per route. Only touched from the event loop, so
+    # no locking; each worker process keeps its own.
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._requests: dict[tuple[str, str, int], int] = {}
+        self._latency: dict[tuple[str, str], Histogram] = {}
+        self._statements: dict[tuple[str, str], Histogram] = {}
+        self._sql_seconds: dict[tuple[str, str], Histogram] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float, statements: int, sql_seconds: float) -> None:
+        key = (method, route)
+        self._requests[(method, route, status)] = self._requests.get((method, route, status), 0) + 1
+        latency = self._latency.get(key)
+        if latency is None:
+            latency = self._latency[key] = Histogram(LATENCY_BUCKETS)
+            self._statements[key] = Histogram(STATEMENT_BUCKETS)
+            self._sql_seconds[key] = Histogram(LATENCY_BUCKETS)
+        latency.observe(seconds)
+        self._statements[key].observe(statements)
+        self._sql_seconds[key].observe(sql_seconds)
+
+    def render(self, gauges: dict[str, dict] | None = None) -> str:
+        # Prometheus text exposition format 0.0.4
+        lines = [
+            "# HELP projectboard_http_requests_total Requests by route template and status.",
+            "# TYPE projectboard_http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self._requests.items()):
+            lines.append(f"projectboard_http_requests_total{format_labels({'method': method, 'route': route, 'status': status})} {count}")
+
+        for name, help_text, histograms in (
+            ("projectboard_http_request_duration_seconds", "Time from request start until the response was sent.", self._latency),
+            ("projectboard_http_request_sql_statements", "SQL statements run per request.", self._statements),
+            ("projectboard_http_request_sql_seconds", "Time per request spent on database threads running queries.", self._sql_seconds),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), histogram in sorted(histograms.items()):
+                labels = {"method": method, "route": route}
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, math.inf), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels({**labels, 'le': format_value(float(bound))})} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        # point-in-time numbers from the /stats endpoints, one gauge each
+        for group, values in (gauges or {}).items():
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    name = f"projectboard_{group}_{key}"
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {format_value(value)}")
+
+        lines.append("# TYPE projectboard_process_start_time_seconds gauge")
+        lines.append(f"projectboard_process_start_time_seconds {format_value(self.started_at)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = RequestMetrics(enabled=METRICS_ENABLED)
@@ -0,0 +1,428 @@
+from datetime import datetime
+import argparse
+import sqlite3
+import os
+
+from app.db import open_connection
+from app.hashing import hash_password
+
+
+# Each step runs inside the migration transaction and must not commit.
+def create_base_tables(con: sqlite3.Connection) -> None:
+    cur = con.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS project (
+        id                INTEGER PRIMARY KEY AUTOINCREMENT,
+        title             TEXT NOT NULL,
+        short_description TEXT,
+        description       TEXT,
+        github            TEXT,
+        website           TEXT,
+        status            TEXT NOT NULL CHECK(status IN ('idea','active','paused','done')),
+        user_id           INTEGER NOT NULL DEFAULT 1,
+        FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS task (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id  INTEGER NOT NULL,
+        title       TEXT NOT NULL,
+        desc        TEXT,
+        status      TEXT NOT NULL CHECK(status IN ('open','in_progress','done')) DEFAULT 'open',
+        labels_json TEXT NOT NULL DEFAULT '[]',
+        FOREIGN KEY (project_id) REFERENCES project(id) ON DELETE CASCADE
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS note (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id  INTEGER NOT NULL,
+        body        TEXT NOT NULL,
+        FOREIGN KEY (project_id) REFERENCES project(id) ON DELETE CASCADE
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS user (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS session (
+        token TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        expires_at TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE
+    )
+    """)
+
+
+def ensure_default_user(con: sqlite3.Connection) -> None:
+    cur = con.cursor()
+    cur.execute("SELECT COUNT(*) FROM user")
+    (count,) = cur.fetchone() or (0,)
+    if count:
+        return
+
+    username = os.getenv("DEFAULT_ADMIN_USER")
+    password = os.getenv("DEFAULT_ADMIN_PASSWORD")
+    password_hash = hash_password(password)
+    cur.execute(
+        "INSERT INTO user (username, password_hash) VALUES (?, ?)",
+        (username, password_hash),
+    )
+
+
+def ensure_project_user_column(con: sqlite3.Connection) -> None:
+    cur = con.cursor()
+    cur.execute("PRAGMA table_info(project)")
+    columns = {row[1] for row in cur.fetchall()}
+    if "user_id" in columns:
+        return
+
+    cur.execute("ALTER TABLE project ADD COLUMN user_id INTEGER")
+    cur.execute("UPDATE project SET user_id = 1 WHERE user_id IS NULL")
+
+
+INDEXES = {
+    "idx_session_expires_at": "session(expires_at)",
+    "idx_session_user_id": "session(user_id)",
+    "idx_project_user_id": "project(user_id, id)",
+    "idx_task_project_status": "task(project_id, status, id)",
+    "idx_note_project_id": "note(project_id, id)",
+}
+
+
+def ensure_indexes(con: sqlite3.Connection) -> None:
+    cur = con.cursor()
+    for name, target in INDEXES.items():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+
+# external-content FTS5 tables kept in sync by triggers
+FTS_TABLES = {
+    "project": ("project_fts", ("title", "short_description", "description")),
+    "task": ("task_fts", ("title", "desc")),
+    "note": ("note_fts", ("body",)),
+}
+
+
+def create_search_index(con: sqlite3.Connection) -> None:
+    cur = con.cursor()
+    for table, (fts, columns) in FTS_TABLES.items():
+        cols = ", ".join(f'"{c}"' for c in columns)
+        new_vals = ", ".join(f'new."{c}"' for c in columns)
+        old_vals = ", ".join(f'old."{c}"' for c in columns)
+        cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {cols},
+            content='{table}',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals});
+        END
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+        END
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals});
+        END
+        """)
+        cur.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def normalize_labels(con: sqlite3.Connection) -> None:
+    cur = con.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS label (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id    INTEGER NOT NULL,
+        name       TEXT NOT NULL,
+        task_count INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (user_id, name),
+        FOREIGN KEY (user_id) REFERENCES user(id) ON DELETE CASCADE
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS task_label (
+        task_id  INTEGER NOT NULL,
+        label_id INTEGER NOT NULL,
+        position INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (task_id, label_id),
+        FOREIGN KEY (task_id) REFERENCES task(id) ON DELETE CASCADE,
+        FOREIGN KEY (label_id) REFERENCES label(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_task_label_label ON task_label(label_id, task_id)")
+    # per-label counts stay current without a GROUP BY on read
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS task_label_count_ai AFTER INSERT ON task_label BEGIN
+        UPDATE label SET task_count = task_count + 1 WHERE id = new.label_id;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS task_label_count_ad AFTER DELETE ON task_label BEGIN
+        UPDATE label SET task_count = task_count - 1 WHERE id = old.label_id;
+    END
+    """)
+
+    # copy labels_json into the new tables, then drop the column
+    labels = """
+        FROM task AS t
+        JOIN project AS p ON p.id = t.project_id,
+             json_each(CASE WHEN json_valid(t.labels_json) AND json_type(t.labels_json) = 'array'
+                            THEN t.labels_json ELSE '[]' END) AS j
+    """
+    name = "trim(CAST(j.value AS TEXT))"
+    cur.execute(f"""
+    INSERT OR IGNORE INTO label (user_id, name)
+    SELECT DISTINCT p.user_id, {name} {labels}
+     WHERE j.type NOT IN ('null', 'object', 'array') AND {name} <> ''
+    """)
+    cur.execute(f"""
+    INSERT OR IGNORE INTO task_label (task_id, label_id, position)
+    SELECT t.id, l.id, j.key {labels}
+      JOIN label AS l ON l.user_id = p.user_id AND l.name = {name}
+     WHERE j.type NOT IN ('null', 'object', 'array')
+    """)
+    cur.execute("ALTER TABLE task DROP COLUMN labels_json")
+
+
+def add_version_counters(con: sqlite3.Connection) -> None:
+    # project.version moves on every project/task/note/label change, and
+    # user.projects_version on every change to any of the user's projects.
+    # Both only ever increase, which makes them safe ETag sources.
+    cur = con.cursor()
+    cur.execute("ALTER TABLE project ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    cur.execute("ALTER TABLE user ADD COLUMN projects_version INTEGER NOT NULL DEFAULT 0")
+
+    bump_project = "UPDATE project SET version = version + 1 WHERE id = {};"
+    triggers = {
+        "project_version_au": (
+            "AFTER UPDATE OF title, short_description, description, github, website, status ON project",
+            bump_project.format("new.id"),
+        ),
+        "task_version_ai": ("AFTER INSERT ON task", bump_project.format("new.project_id")),
+        "task_version_au": ("AFTER UPDATE ON task", bump_project.format("new.project_id")),
+        "task_version_ad": ("AFTER DELETE ON task", bump_project.format("old.project_id")),
+        "note_version_ai": ("AFTER INSERT ON note", bump_project.format("new.project_id")),
+        "note_version_au": ("AFTER UPDATE ON note", bump_project.format("new.project_id")),
+        "note_version_ad": ("AFTER DELETE ON note", bump_project.format("old.project_id")),
+        "task_label_version_ai": (
+            "AFTER INSERT ON task_label",
+            bump_project.format("(SELECT project_id FROM task WHERE id = new.task_id)"),
+        ),
+        "task_label_version_ad": (
+            "AFTER DELETE ON task_label",
+            bump_project.format("(SELECT project_id FROM task WHERE id = old.task_id)"),
+        ),
+        "user_version_project_ai": (
+            "AFTER INSERT ON project",
+            "UPDATE user SET projects_version = projects_version + 1 WHERE id = new.user_id;",
+        ),
+        "user_version_project_au": (
+            "AFTER UPDATE OF version ON project",
+            "UPDATE user SET projects_version = projects_version + 1 WHERE id = new.user_id;",
+        ),
+        "user_version_project_ad": (
+            "AFTER DELETE ON project",
+            "UPDATE user SET projects_version = projects_version + 1 WHERE id = old.user_id;",
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+
+def create_change_log(con: sqlite3.Connection) -> None:
+    # written by triggers, so every mutation logs in its own transaction
+    cur = con.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id    INTEGER NOT NULL,
+        entity     TEXT NOT NULL CHECK(entity IN ('project','task','note')),
+        entity_id  INTEGER NOT NULL,
+        project_id INTEGER NOT NULL,
+        op         TEXT NOT NULL CHECK(op IN ('upsert','delete')),
+        changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_change_log_user_seq ON change_log(user_id, seq)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_change_log_entity ON change_log(entity, entity_id, seq)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_change_log_changed_at ON change_log(changed_at)")
+    # cursors below this seq point at compacted history
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_log_horizon (
+        id  INTEGER PRIMARY KEY CHECK (id = 1),
+        seq INTEGER NOT NULL
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO change_log_horizon (id, seq) VALUES (1, 0)")
+
+    def log(entity: str, ref: str, op: str, project_id: str) -> str:
+        # children removed by a project's cascade are skipped: the project
+        # tombstone already covers them
+        return f"""
+        INSERT INTO change_log (user_id, entity, entity_id, project_id, op)
+        SELECT user_id, '{entity}', {ref}, id, '{op}'
+          FROM project WHERE id = {project_id};
+        """
+
+    triggers = {
+        "project_log_ai": ("AFTER INSERT ON project", log("project", "new.id", "upsert", "new.id")),
+        "project_log_au": (
+            "AFTER UPDATE OF title, short_description, description, github, website, status ON project",
+            log("project", "new.id", "upsert", "new.id"),
+        ),
+        "project_log_ad": (
+            "AFTER DELETE ON project",
+            """
+            INSERT INTO change_log (user_id, entity, entity_id, project_id, op)
+            VALUES (old.user_id, 'project', old.id, old.id, 'delete');
+            """,
+        ),
+        "task_log_ai": ("AFTER INSERT ON task", log("task", "new.id", "upsert", "new.project_id")),
+        "task_log_au": ("AFTER UPDATE ON task", log("task", "new.id", "upsert", "new.project_id")),
+        "task_log_ad": ("AFTER DELETE ON task", log("task", "old.id", "delete", "old.project_id")),
+        "note_log_ai": ("AFTER INSERT ON note", log("note", "new.id", "upsert", "new.project_id")),
+        "note_log_au": ("AFTER UPDATE ON note", log("note", "new.id", "upsert", "new.project_id")),
+        "note_log_ad": ("AFTER DELETE ON note", log("note", "old.id", "delete", "old.project_id")),
+        "task_label_log_ai": (
+            "AFTER INSERT ON task_label",
+            log("task", "new.task_id", "upsert", "(SELECT project_id FROM task WHERE id = new.task_id)"),
+        ),
+        "task_label_log_ad": (
+            "AFTER DELETE ON task_label",
+            log("task", "old.task_id", "upsert", "(SELECT project_id FROM task WHERE id = old.task_id)"),
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+
+def create_cache_invalidation(con: sqlite3.Connection) -> None:
+    # other workers poll this (on PRAGMA data_version changes) to drop cache
+    # entries; written by triggers so every write path is covered
+    cur = con.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS cache_invalidation (
+        seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+        scope      TEXT NOT NULL,
+        key        TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cache_invalidation_created_at ON cache_invalidation(created_at)")
+    triggers = {
+        "session_invalidate_ad": "AFTER DELETE ON session",
+        "session_invalidate_au": "AFTER UPDATE OF user_id, expires_at ON session",
+    }
+    for name, event in triggers.items():
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN
+            INSERT INTO cache_invalidation (scope, key) VALUES ('session', old.token);
+        END
+        """)
+
+
+# Ordered, append-only. Steps 1-4 are idempotent so databases created before
+# schema_version existed upgrade cleanly.
+MIGRATIONS = [
+    (1, "base tables", create_base_tables),
+    (2, "default admin user", ensure_default_user),
+    (3, "project.user_id column", ensure_project_user_column),
+    (4, "lookup indexes", ensure_indexes),
+    (5, "full-text search index", create_search_index),
+    (6, "label tables", normalize_labels),
+    (7, "project and user version counters", add_version_counters),
+    (8, "change log", create_change_log),
+    (9, "cache invalidation log", create_cache_invalidation),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(con: sqlite3.Connection) -> int:
+    try:
+        (version,) = con.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return version or 0
+
+
+def migrate(con: sqlite3.Connection, migrations=MIGRATIONS, on_create=None) -> list[int]:
+    # fast path for every worker start: one read, no locks
+    if current_version(con) >= migrations[-1][0]:
+        return []
+
+    # exclusive lock so concurrently starting workers apply steps exactly once
+    con.execute("BEGIN EXCLUSIVE")
+    try:
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version    INTEGER PRIMARY KEY,
+            name       TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        """)
+        version = current_version(con)
+        applied = []
+        for step_version, name, step in migrations:
+            if step_version <= version:
+                continue
+            step(con)
+            con.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (step_version, name, datetime.utcnow().isoformat()),
+            )
+            applied.append(step_version)
+        # seeds a brand-new file in the same transaction as its schema
+        if on_create is not None and version == 0:
+            on_create(con)
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    return applied
+
+
+def init_db() -> list[int]:
+    con = open_connection()
+    try:
+        return migrate(con)
+    finally:
+        con.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations")
+    parser.add_argument("--status", action="store_true", help="print the schema version and exit")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        con = open_connection()
+        try:
+            print(f"schema version {current_version(con)} (latest {LATEST_VERSION})")
+        finally:
+            con.close()
+        return
+
+    applied = init_db()
+    print(f"applied {applied}" if applied else f"up to date at version {LATEST_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
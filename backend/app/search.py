@@ -0,0 +1,72 @@
+import html
+import re
+import sqlite3
+
+
+# snippet() markers; replaced with <mark> after the text is HTML-escaped
+_OPEN, _CLOSE = "\x02", "\x03"
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+SEARCH_SQL = f"""
+SELECT * FROM (
+    SELECT 'project' AS type, p.id AS id, p.id AS project_id, p.title AS project_title,
+           p.title AS title, snippet(project_fts, -1, '{_OPEN}', '{_CLOSE}', '…', 12) AS snippet,
+           bm25(project_fts, 10.0, 5.0, 1.0) AS score
+      FROM project_fts
+      JOIN project AS p ON p.id = project_fts.rowid
+     WHERE project_fts MATCH :query AND p.user_id = :user_id
+    UNION ALL
+    SELECT 'task', t.id, t.project_id, p.title,
+           t.title, snippet(task_fts, -1, '{_OPEN}', '{_CLOSE}', '…', 12),
+           bm25(task_fts, 5.0, 1.0)
+      FROM task_fts
+      JOIN task AS t ON t.id = task_fts.rowid
+      JOIN project AS p ON p.id = t.project_id
+     WHERE task_fts MATCH :query AND p.user_id = :user_id
+    UNION ALL
+    SELECT 'note', n.id, n.project_id, p.title,
+           NULL, snippet(note_fts, -1, '{_OPEN}', '{_CLOSE}', '…', 12),
+           bm25(note_fts)
+      FROM note_fts
+      JOIN note AS n ON n.id = note_fts.rowid
+      JOIN project AS p ON p.id = n.project_id
+     WHERE note_fts MATCH :query AND p.user_id = :user_id
+)
+ORDER BY score ASC, type ASC, id ASC
+LIMIT :limit OFFSET :offset
+"""
+
+
+def to_match_query(text: str) -> str | None:
+    # user text is never passed to MATCH as-is: each word becomes a quoted
+    # prefix term, so FTS5 operators and punctuation are inert
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens[:16])
+
+
+def highlight(snippet: str | None) -> str | None:
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def search(con: sqlite3.Connection, user_id: int, text: str, limit: int, offset: int) -> list[dict]:
+    query = to_match_query(text)
+    if query is None:
+        return []
+    cur = con.cursor()
+    cur.execute(SEARCH_SQL, {"query": query, "user_id": user_id, "limit": limit, "offset": offset})
+    return [
+        {
+            "type": row["type"],
+            "id": row["id"],
+            "project_id": row["project_id"],
+            "project_title": row["project_title"],
+            "title": row["title"],
+            "snippet": highlight(row["snippet"]),
+            "score": row["score"],
+        }
+        for row in cur.fetchall()
+    ]
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import time
+import os
+
+
+class SessionCache:
+    # token -> (user, expires_at), bounded by max_size (LRU) and ttl seconds.
+    # ttl bounds how long a session revoked elsewhere can still be served.
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[dict, datetime, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, token: str, now: datetime) -> tuple[dict, datetime] | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            user, expires_at, cached_at = entry
+            if expires_at <= now or time.monotonic() - cached_at > self.ttl:
+                del self._entries[token]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(token)
+            self._stats["hits"] += 1
+            return user, expires_at
+
+    def put(self, token: str, user: dict, expires_at: datetime) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[token] = (user, expires_at, time.monotonic())
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def update_expiry(self, token: str, expires_at: datetime) -> None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                self._entries[token] = (entry[0], expires_at, entry[2])
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            if self._entries.pop(token, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else None,
+            }
+
+
+session_cache = SessionCache(
+    max_size=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SESSION_CACHE_TTL", "60")),
+)
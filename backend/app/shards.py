@@ -0,0 +1,224 @@
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import os
+
+from app.changes import (
+    CHANGE_LOG_COMPACT_BATCH,
+    CHANGE_LOG_RETENTION,
+    drop_superseded,
+    expire_changes,
+    latest_seq,
+)
+from app.db import open_connection
+from app.migrations import LATEST_VERSION, MIGRATIONS, current_version, init_db, migrate
+
+
+# Per-user storage: with DB_SHARDS on, each user's projects, tasks, notes,
+# labels and change log live in their own SQLite file. The central DB_PATH
+# keeps users and sessions. Shards use the central schema (minus the admin
+# seed) with a copy of their owner's user row as the foreign key target.
+SHARDED = os.getenv("DB_SHARDS", "false").lower() == "true"
+SHARD_DIR = os.getenv("DB_SHARD_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(os.getenv("DB_PATH", "projects.db"))), "shards"
+)
+SHARD_MIGRATIONS = [m for m in MIGRATIONS if m[0] != 2]
+SHARD_FILE = re.compile(r"user-(\d+)\.db")
+
+
+def shard_path(user_id: int) -> str:
+    return os.path.join(SHARD_DIR, f"user-{user_id}.db")
+
+
+def shard_user_ids() -> list[int]:
+    if not os.path.isdir(SHARD_DIR):
+        return []
+    return sorted(int(m.group(1)) for name in os.listdir(SHARD_DIR) if (m := SHARD_FILE.fullmatch(name)))
+
+
+def start_change_log(con: sqlite3.Connection, seq: int) -> None:
+    # seqs continue after the central log's, so cursors clients already
+    # hold are either still valid or older than the horizon (resync)
+    con.execute("UPDATE change_log_horizon SET seq = ? WHERE id = 1", (seq,))
+    con.execute("DELETE FROM sqlite_sequence WHERE name = 'change_log'")
+    con.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (seq,))
+
+
+def seed_shard(con: sqlite3.Connection, owner: sqlite3.Row, seq: int) -> None:
+    # credentials stay central; the copy only anchors foreign keys and
+    # carries projects_version forward so ETags keep increasing
+    con.execute(
+        "INSERT INTO user (id, username, password_hash, projects_version) VALUES (?, ?, '', ?)",
+        (owner["id"], owner["username"], owner["projects_version"]),
+    )
+    start_change_log(con, seq)
+
+
+def shard_origin(central: sqlite3.Connection, user_id: int) -> tuple[sqlite3.Row, int]:
+    owner = central.execute("SELECT id, username, projects_version FROM user WHERE id = ?", (user_id,)).fetchone()
+    if owner is None:
+        raise LookupError(f"No user {user_id} in the central database")
+    return owner, latest_seq(central)
+
+
+def init_shard(path: str, user_id: int) -> None:
+    # runs whenever a worker opens a shard: creates it on first use and
+    # applies new migrations afterwards
+    fresh = not os.path.exists(path)
+    con = open_connection(path) if not fresh else None
+    try:
+        if con is not None and current_version(con) >= LATEST_VERSION:
+            return
+        central = open_connection()
+        try:
+            owner, seq = shard_origin(central, user_id)
+            if fresh and central.execute("SELECT 1 FROM project WHERE user_id = ? LIMIT 1", (user_id,)).fetchone():
+                # an empty shard would hide this data
+                raise RuntimeError(f"User {user_id} still has projects in the central database; run python -m app.shards split")
+        finally:
+            central.close()
+        if con is None:
+            os.makedirs(SHARD_DIR, exist_ok=True)
+            con = open_connection(path)
+        migrate(con, SHARD_MIGRATIONS, lambda c: seed_shard(c, owner, seq))
+    finally:
+        if con is not None:
+            con.close()
+
+
+# -------- Compaction --------
+def compact_shard(path: str, batch_size: int) -> int:
+    con = open_connection(path)
+    try:
+        total = 0
+        after = 0
+        while after is not None:
+            deleted, after = drop_superseded(con, after, batch_size)
+            con.commit()
+            total += deleted
+        cutoff = datetime.utcnow() - CHANGE_LOG_RETENTION
+        while True:
+            deleted = expire_changes(con, cutoff, batch_size)
+            con.commit()
+            total += deleted
+            if deleted < batch_size:
+                break
+        return total
+    finally:
+        con.close()
+
+
+async def compact_shards(batch_size: int = CHANGE_LOG_COMPACT_BATCH) -> int:
+    # one shard at a time on its own connection, so the walk does not churn
+    # the open-shard LRU
+    total = 0
+    for user_id in shard_user_ids():
+        total += await asyncio.to_thread(compact_shard, shard_path(user_id), batch_size)
+    return total
+
+
+# -------- Splitting the central database --------
+# ids are kept, so URLs and client state stay valid; label counts and
+# versions are rebuilt by the shard's triggers
+COPY_STATEMENTS = [
+    """
+    INSERT INTO project (id, title, short_description, description, github, website, status, user_id, version)
+    SELECT id, title, short_description, description, github, website, status, user_id, version
+      FROM central.project WHERE user_id = :user_id
+    """,
+    """
+    INSERT INTO task (id, project_id, title, desc, status)
+    SELECT t.id, t.project_id, t.title, t.desc, t.status
+      FROM central.task AS t JOIN central.project AS p ON p.id = t.project_id
+     WHERE p.user_id = :user_id
+    """,
+    """
+    INSERT INTO note (id, project_id, body)
+    SELECT n.id, n.project_id, n.body
+      FROM central.note AS n JOIN central.project AS p ON p.id = n.project_id
+     WHERE p.user_id = :user_id
+    """,
+    "INSERT INTO label (id, user_id, name) SELECT id, user_id, name FROM central.label WHERE user_id = :user_id",
+    """
+    INSERT INTO task_label (task_id, label_id, position)
+    SELECT tl.task_id, tl.label_id, tl.position
+      FROM central.task_label AS tl JOIN central.label AS l ON l.id = tl.label_id
+     WHERE l.user_id = :user_id
+    """,
+]
+
+
+def remove_file(path: str) -> None:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def split_user(central: sqlite3.Connection, central_path: str, user_id: int, keep: bool) -> dict:
+    # built under a temporary name and renamed into place, so an interrupted
+    # split never leaves a half-filled shard; rerunning it starts over
+    owner, seq = shard_origin(central, user_id)
+    path = shard_path(user_id)
+    tmp = f"{path}.tmp"
+    remove_file(tmp)
+    con = open_connection(tmp)
+    try:
+        migrate(con, SHARD_MIGRATIONS, lambda c: seed_shard(c, owner, seq))
+        con.execute("ATTACH DATABASE ? AS central", (central_path,))
+        counts = {}
+        for table, sql in zip(("projects", "tasks", "notes", "labels", "task_labels"), COPY_STATEMENTS):
+            counts[table] = con.execute(sql, {"user_id": user_id}).rowcount
+        # the copy logged every row; the client-visible history starts here
+        con.execute("DELETE FROM change_log")
+        start_change_log(con, seq)
+        con.commit()
+        con.execute("DETACH DATABASE central")
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        con.close()
+    remove_file(path)
+    os.replace(tmp, path)
+    remove_file(tmp)
+
+    if not keep:
+        central.execute("DELETE FROM project WHERE user_id = ?", (user_id,))
+        central.execute("DELETE FROM label WHERE user_id = ?", (user_id,))
+        central.execute("DELETE FROM change_log WHERE user_id = ?", (user_id,))
+        central.commit()
+    return {"user_id": user_id, **counts}
+
+
+def split(keep: bool = False) -> list[dict]:
+    # run with the API stopped: a running worker may hold a shard open
+    init_db()
+    central_path = os.getenv("DB_PATH", "projects.db")
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    central = open_connection(central_path)
+    try:
+        user_ids = [row["user_id"] for row in central.execute("SELECT DISTINCT user_id FROM project ORDER BY user_id")]
+        return [split_user(central, central_path, user_id, keep) for user_id in user_ids]
+    finally:
+        central.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+    split_cmd = sub.add_parser("split", help="move every user's projects from DB_PATH into DB_SHARD_DIR")
+    split_cmd.add_argument("--keep", action="store_true", help="copy without deleting from the central database")
+    sub.add_parser("list", help="list shard files")
+    args = parser.parse_args(argv)
+
+    if args.command == "split":
+        users = split(args.keep)
+        print(json.dumps({"shard_dir": SHARD_DIR, "users": users}, indent=2))
+    else:
+        shards = [{"user_id": u, "bytes": os.path.getsize(shard_path(u))} for u in shard_user_ids()]
+        print(json.dumps({"shard_dir": SHARD_DIR, "shards": shards}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
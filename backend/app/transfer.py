@@ -0,0 +1,337 @@
+from collections import OrderedDict
+from datetime import datetime
+import asyncio
+import json
+import sqlite3
+import threading
+import os
+
+from app.db import conn_for, current_shard
+from app.labels import normalize_labels
+
+
+EXPORT_FORMAT = 1
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+# each running export holds one pooled connection
+MAX_CONCURRENT_EXPORTS = int(os.getenv("MAX_CONCURRENT_EXPORTS", "2"))
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "2000"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+
+PROJECT_STATUSES = {"idea", "active", "paused", "done"}
+TASK_STATUSES = {"open", "in_progress", "done"}
+PROJECT_TEXT_FIELDS = ("short_description", "description", "github", "website")
+
+
+# -------- Export --------
+# One NDJSON line per row, assembled by SQLite: a header, then each project
+# followed by its tasks and notes, then an end line with the counts.
+EXPORT_PROJECTS = """
+SELECT id, json_object(
+    'type', 'project', 'id', id, 'title', title, 'short_description', short_description,
+    'description', description, 'github', github, 'website', website, 'status', status
+) AS line
+  FROM project WHERE user_id = ? ORDER BY id
+"""
+EXPORT_TASKS = """
+SELECT json_object(
+    'type', 'task', 'id', t.id, 'project_id', t.project_id, 'title', t.title, 'desc', t.desc,
+    'status', t.status,
+    'labels', json((
+        SELECT json_group_array(name) FROM (
+            SELECT l.name FROM task_label AS tl JOIN label AS l ON l.id = tl.label_id
+             WHERE tl.task_id = t.id ORDER BY tl.position
+        )
+    ))
+) AS line
+  FROM task AS t WHERE t.project_id = ? ORDER BY t.id
+"""
+EXPORT_NOTES = """
+SELECT json_object('type', 'note', 'id', id, 'project_id', project_id, 'desc', body) AS line
+  FROM note WHERE project_id = ? ORDER BY id
+"""
+
+
+def export_lines(con: sqlite3.Connection, user_id: int, chunk_rows: int):
+    # one read transaction, so a slow client still gets a consistent snapshot;
+    # rows are fetched chunk_rows at a time and never held all at once
+    con.execute("BEGIN")
+    counts = {"projects": 0, "tasks": 0, "notes": 0}
+    lines = [json.dumps({"type": "export", "format": EXPORT_FORMAT, "exported_at": datetime.utcnow().isoformat()})]
+    for project in con.execute(EXPORT_PROJECTS, (user_id,)):
+        lines.append(project["line"])
+        counts["projects"] += 1
+        for kind, sql in (("tasks", EXPORT_TASKS), ("notes", EXPORT_NOTES)):
+            cur = con.execute(sql, (project["id"],))
+            while rows := cur.fetchmany(chunk_rows):
+                lines.extend(row["line"] for row in rows)
+                counts[kind] += len(rows)
+                if len(lines) >= chunk_rows:
+                    yield ("\n".join(lines) + "\n").encode()
+                    lines = []
+    lines.append(json.dumps({"type": "end", **counts}))
+    yield ("\n".join(lines) + "\n").encode()
+
+
+def _export_chunks(shard: int | None, user_id: int, chunk_rows: int):
+    with conn_for(shard) as con:
+        yield from export_lines(con, user_id, chunk_rows)
+
+
+_export_slots = asyncio.Semaphore(MAX_CONCURRENT_EXPORTS)
+
+
+def export_busy() -> bool:
+    return _export_slots.locked()
+
+
+def stream_export(user_id: int, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    # the generator holds its pooled connection for the whole export and is
+    # advanced one chunk at a time on a worker thread
+    chunks = _export_chunks(current_shard(), user_id, chunk_rows)
+    lock = threading.Lock()
+
+    def step() -> bytes | None:
+        with lock:
+            return next(chunks, None)
+
+    async def stream():
+        try:
+            async with _export_slots:
+                while (chunk := await asyncio.to_thread(step)) is not None:
+                    yield chunk
+        finally:
+            # after a disconnect, waits for a step still running on its thread
+            with lock:
+                chunks.close()
+
+    return stream()
+
+
+# -------- Import --------
+class ImportRejected(ValueError):
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+# user id -> progress of their latest import on this worker
+_imports: OrderedDict[int, dict] = OrderedDict()
+MAX_TRACKED_IMPORTS = 1000
+
+
+def import_progress(user_id: int) -> dict | None:
+    return _imports.get(user_id)
+
+
+def next_rowid(con: sqlite3.Connection, table: str) -> int:
+    # AUTOINCREMENT hands out one past the highest id ever used, so rows
+    # inserted back to back in our write transaction get consecutive ids
+    row = con.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    return (row[0] if row else 0) + 1
+
+
+class Importer:
+    # Parses NDJSON as it arrives and writes batch_size records per
+    # transaction. Every project gets a new id; tasks and notes follow their
+    # project, so they must come after it in the file (as in an export).
+    def __init__(self, user_id: int, batch_size: int = IMPORT_BATCH):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        # file id -> new id, and label name -> id, for committed batches only
+        self.project_ids: dict[int, int] = {}
+        self._label_ids: dict[str, int] = {}
+        self._seen: set[int] = set()
+        self._buffer = b""
+        self._pending: list[tuple[str, tuple]] = []
+        self.progress = {
+            "state": "running",
+            "started_at": datetime.utcnow().isoformat(),
+            "bytes": 0,
+            "lines": 0,
+            "projects": 0,
+            "tasks": 0,
+            "notes": 0,
+            "batches": 0,
+            "complete": False,
+        }
+        _imports[user_id] = self.progress
+        _imports.move_to_end(user_id)
+        while len(_imports) > MAX_TRACKED_IMPORTS:
+            _imports.popitem(last=False)
+
+    def feed(self, chunk: bytes) -> list[list]:
+        # returns the batches that filled up
+        self.progress["bytes"] += len(chunk)
+        *lines, self._buffer = (self._buffer + chunk).split(b"\n")
+        if len(self._buffer) > IMPORT_MAX_LINE_BYTES:
+            raise ImportRejected(self.progress["lines"] + 1, "line too long")
+        return self._parse(lines)
+
+    def finish(self) -> list[list]:
+        lines, self._buffer = [self._buffer], b""
+        batches = self._parse(lines)
+        if self._pending:
+            batches.append(self._pending)
+            self._pending = []
+        return batches
+
+    def _parse(self, lines: list[bytes]) -> list[list]:
+        batches = []
+        for raw in lines:
+            self.progress["lines"] += 1
+            if not raw.strip():
+                continue
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                raise ImportRejected(self.progress["lines"], "invalid JSON")
+            item = self._validate(record)
+            if item is None:
+                continue
+            self._pending.append(item)
+            if len(self._pending) >= self.batch_size:
+                batches.append(self._pending)
+                self._pending = []
+        return batches
+
+    def _validate(self, record) -> tuple[str, tuple] | None:
+        line = self.progress["lines"]
+        if not isinstance(record, dict):
+            raise ImportRejected(line, "expected a JSON object")
+        kind = record.get("type")
+        if kind == "export":
+            if record.get("format") != EXPORT_FORMAT:
+                raise ImportRejected(line, f"unsupported export format {record.get('format')!r}")
+            return None
+        if kind == "end":
+            self.progress["complete"] = True
+            return None
+
+        if kind == "project":
+            file_id = record.get("id")
+            if not isinstance(file_id, int) or file_id in self._seen:
+                raise ImportRejected(line, "project needs a unique integer id")
+            # blank titles and bodies are accepted: the API can store them
+            # (PATCH does not check), and every exported record must import
+            title = record.get("title")
+            if not isinstance(title, str):
+                raise ImportRejected(line, "project title must be a string")
+            if record.get("status") not in PROJECT_STATUSES:
+                raise ImportRejected(line, "invalid project status")
+            fields = [record.get(field) for field in PROJECT_TEXT_FIELDS]
+            if any(value is not None and not isinstance(value, str) for value in fields):
+                raise ImportRejected(line, "project fields must be strings")
+            self._seen.add(file_id)
+            return "project", (file_id, title, *fields, record["status"])
+
+        if kind not in ("task", "note"):
+            raise ImportRejected(line, f"unknown record type {kind!r}")
+        project_id = record.get("project_id")
+        if project_id not in self._seen:
+            raise ImportRejected(line, f"{kind} refers to a project that is not earlier in the file")
+
+        if kind == "task":
+            title = record.get("title")
+            if not isinstance(title, str):
+                raise ImportRejected(line, "task title must be a string")
+            desc = record.get("desc")
+            if desc is not None and not isinstance(desc, str):
+                raise ImportRejected(line, "task desc must be a string")
+            status = record.get("status") or "open"
+            if status not in TASK_STATUSES:
+                raise ImportRejected(line, "invalid task status")
+            return "task", (project_id, title, desc, status, normalize_labels(record.get("labels") or []))
+
+        body = record.get("desc")
+        if not isinstance(body, str):
+            raise ImportRejected(line, "note body must be a string")
+        return "note", (project_id, body)
+
+    def write_batch(self, con: sqlite3.Connection, batch: list) -> tuple[dict, dict]:
+        # runs through run_write, so it may be retried and must not touch
+        # self; returns the new project and label ids for commit() to keep
+        cur = con.cursor()
+        projects: dict[int, int] = {}
+        labels: dict[str, int] = {}
+        tasks, task_labels, notes = [], [], []
+        for kind, row in batch:
+            if kind == "project":
+                file_id, *fields = row
+                cur.execute(
+                    """
+                    INSERT INTO project (title, short_description, description, github, website, status, user_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    RETURNING id
+                    """,
+                    (*fields, self.user_id),
+                )
+                projects[file_id] = cur.fetchone()[0]
+                continue
+            project_id = projects.get(row[0]) or self.project_ids[row[0]]
+            if kind == "task":
+                tasks.append((project_id, *row[1:4]))
+                task_labels.append(row[4])
+            else:
+                notes.append((project_id, row[1]))
+
+        if tasks:
+            first = next_rowid(con, "task")
+            cur.executemany("INSERT INTO task (project_id, title, desc, status) VALUES (?, ?, ?, ?)", tasks)
+            if next_rowid(con, "task") != first + len(tasks):
+                raise RuntimeError("Task ids were not assigned consecutively")
+
+            names = sorted({name for names in task_labels for name in names} - self._label_ids.keys())
+            if names:
+                names_json = json.dumps(names)
+                cur.execute(
+                    """
+                    INSERT INTO label (user_id, name)
+                    SELECT ?, value FROM json_each(?) WHERE true
+                    ON CONFLICT (user_id, name) DO NOTHING
+                    """,
+                    (self.user_id, names_json),
+                )
+                cur.execute(
+                    "SELECT l.id, l.name FROM json_each(?) AS j JOIN label AS l ON l.user_id = ? AND l.name = j.value",
+                    (names_json, self.user_id),
+                )
+                labels = {row["name"]: row["id"] for row in cur.fetchall()}
+            label_ids = {**self._label_ids, **labels} if labels else self._label_ids
+            cur.executemany(
+                "INSERT INTO task_label (task_id, label_id, position) VALUES (?, ?, ?)",
+                [
+                    (first + i, label_ids[name], position)
+                    for i, names in enumerate(task_labels)
+                    for position, name in enumerate(names)
+                ],
+            )
+
+        if notes:
+            cur.executemany("INSERT INTO note (project_id, body) VALUES (?, ?)", notes)
+        return projects, labels
+
+    async def commit(self, batch: list, write) -> None:
+        projects, labels = await write(self.write_batch, batch)
+        self.project_ids.update(projects)
+        self._label_ids.update(labels)
+        for kind, _ in batch:
+            self.progress[kind + "s"] += 1
+        self.progress["batches"] += 1
+
+    async def run(self, body, write) -> dict:
+        # body yields the request bytes as they arrive; write is run_write
+        try:
+            async for chunk in body:
+                for batch in self.feed(chunk):
+                    await self.commit(batch, write)
+            for batch in self.finish():
+                await self.commit(batch, write)
+        except BaseException as e:
+            self.progress["state"] = "failed"
+            self.progress["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            self.progress["finished_at"] = datetime.utcnow().isoformat()
+        self.progress["state"] = "done"
+        return self.progress
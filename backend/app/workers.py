@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import sqlite3
+import os
+
+from app.changes import latest_seq, read_changes
+from app.db import get_shard_conn, open_connection, shards_open
+from app.events import broker
+
+
+logger = logging.getLogger(__name__)
+
+# uvicorn reads WEB_CONCURRENCY as its --workers default
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+CACHE_POLL_INTERVAL = float(os.getenv("CACHE_POLL_INTERVAL", "0.5"))
+# With several workers a write only reaches the broker of the worker that
+# handled it, so live events come from the change log instead.
+FORWARD_CHANGES = os.getenv("SSE_FROM_CHANGE_LOG", "true" if WORKERS > 1 else "false").lower() == "true"
+LEADER_RETRY_INTERVAL = 30.0
+
+
+# -------- Background job leader --------
+def try_leader_lock(db_path: str):
+    # an exclusive flock next to the database; the OS drops it when the
+    # holding worker exits, so another one can take over
+    try:
+        import fcntl
+    except ImportError:
+        return open(os.devnull)
+    lock = open(f"{db_path}.leader", "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+async def run_as_leader(jobs: list, db_path: str | None = None) -> None:
+    # session reaping and change log compaction only need one worker
+    db_path = db_path or os.getenv("DB_PATH", "projects.db")
+    lock = try_leader_lock(db_path)
+    while lock is None:
+        await asyncio.sleep(LEADER_RETRY_INTERVAL)
+        lock = try_leader_lock(db_path)
+    try:
+        await asyncio.gather(*(job() for job in jobs))
+    finally:
+        lock.close()
+
+
+# -------- Cross-worker invalidation --------
+class DataVersionWatcher:
+    # PRAGMA data_version changes whenever another connection commits, and
+    # costs no I/O to read. Only then does the watcher read the new
+    # cache_invalidation rows (and change log entries, when forwarding).
+    def __init__(self, db_path: str, interval: float, forward_changes: bool):
+        self.db_path = db_path
+        self.interval = interval
+        self.forward_changes = forward_changes
+        self._handlers: dict[str, list] = {}
+        self._con: sqlite3.Connection | None = None
+        self._data_version: int | None = None
+        self._seq = 0
+        self._change_seq = 0
+        self._shard_seqs: dict[int, int] = {}
+        self._stats = {"polls": 0, "wakeups": 0, "invalidations": 0, "forwarded": 0}
+
+    def on_invalidate(self, scope: str, handler) -> None:
+        self._handlers.setdefault(scope, []).append(handler)
+
+    def _open(self) -> None:
+        con = open_connection(self.db_path)
+        (self._seq,) = con.execute("SELECT COALESCE(MAX(seq), 0) FROM cache_invalidation").fetchone()
+        self._change_seq = latest_seq(con)
+        (self._data_version,) = con.execute("PRAGMA data_version").fetchone()
+        self._con = con
+
+    def poll(self, users: dict[int, int]) -> tuple[list[sqlite3.Row], list[tuple[int, dict]]]:
+        # users maps each subscribed user to the oldest cursor they hold
+        sharded = shards_open()
+        rows, changes = self._poll_central(users, self.forward_changes and not sharded)
+        if self.forward_changes and sharded:
+            changes = self._read_shard_changes(users)
+        return rows, changes
+
+    def _poll_central(self, users: dict[int, int], forward: bool) -> tuple[list[sqlite3.Row], list[tuple[int, dict]]]:
+        con = self._con
+        (version,) = con.execute("PRAGMA data_version").fetchone()
+        if version == self._data_version:
+            return [], []
+        self._data_version = version
+
+        # one snapshot, so nothing committed mid-poll is skipped or repeated
+        con.execute("BEGIN")
+        try:
+            rows = con.execute(
+                "SELECT seq, scope, key FROM cache_invalidation WHERE seq > ? ORDER BY seq",
+                (self._seq,),
+            ).fetchall()
+            if rows:
+                self._seq = rows[-1]["seq"]
+            changes = self._read_changes(con, users) if forward else []
+        finally:
+            con.rollback()
+        return rows, changes
+
+    def _read_changes(self, con: sqlite3.Connection, users: dict[int, int]) -> list[tuple[int, dict]]:
+        upto = latest_seq(con)
+        since, self._change_seq = self._change_seq, upto
+        if upto <= since:
+            return []
+        changes = []
+        for user_id in users:
+            changes.extend(self._page_changes(con, user_id, since)[0])
+        return changes
+
+    def _read_shard_changes(self, users: dict[int, int]) -> list[tuple[int, dict]]:
+        # shard commits do not move the central data_version, and every
+        # shard numbers its log on its own, so each subscribed user's log
+        # head is checked with a cursor of its own
+        for user_id in list(self._shard_seqs):
+            if user_id not in users:
+                del self._shard_seqs[user_id]
+        changes = []
+        for user_id, cursor in users.items():
+            since = self._shard_seqs.get(user_id, cursor)
+            with get_shard_conn(user_id) as con:
+                if latest_seq(con) > since:
+                    page, since = self._page_changes(con, user_id, since)
+                    changes.extend(page)
+            self._shard_seqs[user_id] = since
+        return changes
+
+    def _page_changes(self, con: sqlite3.Connection, user_id: int, since: int) -> tuple[list[tuple[int, dict]], int]:
+        changes = []
+        cursor = since
+        while True:
+            page = read_changes(con, user_id, cursor, 500)
+            if page["resync"]:
+                return [(user_id, {"op": "resync"})], page["cursor"]
+            changes.extend((user_id, change) for change in page["changes"])
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                return changes, cursor
+
+    def apply(self, rows: list[sqlite3.Row], changes: list[tuple[int, dict]]) -> None:
+        for row in rows:
+            for handler in self._handlers.get(row["scope"], ()):
+                handler(row["key"])
+        for user_id, change in changes:
+            if change["op"] == "resync":
+                broker.resync(user_id)
+            else:
+                broker.publish(user_id, change)
+        self._stats["invalidations"] += len(rows)
+        self._stats["forwarded"] += len(changes)
+
+    async def run(self) -> None:
+        await asyncio.to_thread(self._open)
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                self._stats["polls"] += 1
+                try:
+                    rows, changes = await asyncio.to_thread(self.poll, broker.user_cursors())
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Data version poll failed")
+                    continue
+                if rows or changes:
+                    self._stats["wakeups"] += 1
+                    self.apply(rows, changes)
+        finally:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": WORKERS,
+            "interval": self.interval,
+            "forward_changes": self.forward_changes,
+            **self._stats,
+        }
+
+
+watcher = DataVersionWatcher(os.getenv("DB_PATH", "projects.db"), CACHE_POLL_INTERVAL, FORWARD_CHANGES)
@@ -0,0 +1,226 @@
+from concurrent.futures import Future
+from contextlib import suppress
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import os
+
+from app.db import (
+    BUSY_RETRIES,
+    StatementCounter,
+    busy_backoff,
+    busy_stats,
+    current_shard,
+    current_statement_counter,
+    is_busy,
+    open_connection,
+    run_db,
+    traced,
+)
+
+
+logger = logging.getLogger(__name__)
+
+SINGLE_WRITER = os.getenv("DB_SINGLE_WRITER", "true").lower() == "true"
+# How long the writer waits for more jobs after the first one, and the most
+# jobs it puts in one transaction. Jobs queued while the previous group was
+# committing are always taken together; a window only pays off when commits
+# are expensive (synchronous=FULL, slow disks).
+WRITE_WINDOW = float(os.getenv("DB_WRITE_WINDOW_MS", "0")) / 1000
+WRITE_MAX_BATCH = int(os.getenv("DB_WRITE_MAX_BATCH", "64"))
+
+
+class GroupCommitWriter:
+    # One thread owns the only writing connection. Jobs that arrive within
+    # `window` of each other share a transaction and a commit (one fsync);
+    # each runs in its own savepoint so a failing job only undoes itself.
+    # Jobs are fn(con, *args) and must not commit.
+    def __init__(self, db_path: str, window: float, max_batch: int):
+        self.db_path = db_path
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._stats = {"jobs": 0, "groups": 0, "failed_jobs": 0, "failed_groups": 0, "max_group": 0, "commit_seconds": 0.0}
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def shutdown(self) -> None:
+        if self._thread is not None:
+            # jobs queued before the sentinel still run
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, fn, args: tuple, counter: StatementCounter | None = None) -> Future:
+        if self._thread is None:
+            raise RuntimeError("Writer is not running")
+        future: Future = Future()
+        self._queue.put((fn, args, counter, future))
+        return future
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, args, current_statement_counter()))
+
+    def _collect(self) -> list:
+        first = self._queue.get()
+        if first is None:
+            self._stopping = True
+            return []
+        jobs = [first]
+        deadline = time.monotonic() + self.window
+        while len(jobs) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self._stopping = True
+                break
+            jobs.append(job)
+        return jobs
+
+    def _run(self) -> None:
+        # Nothing may end this loop but shutdown: with the thread gone every
+        # later run_write would wait forever.
+        con: sqlite3.Connection | None = None
+        try:
+            while not self._stopping:
+                # callers cancelled while queued are dropped; a running
+                # future can no longer be cancelled, so settling it below
+                # cannot fail
+                jobs = [job for job in self._collect() if job[3].set_running_or_notify_cancel()]
+                if not jobs:
+                    continue
+                try:
+                    if con is None:
+                        con = open_connection(self.db_path)
+                    self._run_group(con, jobs)
+                except Exception as e:
+                    logger.exception("Writer failed on a group of %d jobs", len(jobs))
+                    for _, _, _, future in jobs:
+                        if not future.done():
+                            future.set_exception(e)
+                    # start over on a fresh connection
+                    if con is not None:
+                        with suppress(sqlite3.Error):
+                            con.close()
+                        con = None
+        finally:
+            if con is not None:
+                con.close()
+
+    def _attempt(self, con: sqlite3.Connection, jobs: list) -> tuple[list, list, float]:
+        done: list[tuple[Future, object]] = []
+        failed: list[tuple[Future, BaseException]] = []
+        con.execute("BEGIN IMMEDIATE")
+        for fn, args, counter, future in jobs:
+            with traced(con, counter):
+                con.execute("SAVEPOINT job")
+                try:
+                    result = fn(con, *args)
+                except Exception as e:
+                    con.execute("ROLLBACK TO job")
+                    failed.append((future, e))
+                else:
+                    done.append((future, result))
+                con.execute("RELEASE job")
+        started = time.perf_counter()
+        con.commit()
+        return done, failed, time.perf_counter() - started
+
+    def _run_group(self, con: sqlite3.Connection, jobs: list) -> None:
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                done, failed, commit_seconds = self._attempt(con, jobs)
+                break
+            except sqlite3.Error as e:
+                # the transaction itself is gone: nothing in this group was
+                # written, so another worker holding the lock means try again
+                if con.in_transaction:
+                    con.rollback()
+                if is_busy(e) and attempt < BUSY_RETRIES:
+                    busy_stats["retries"] += 1
+                    time.sleep(busy_backoff(attempt))
+                    continue
+                if is_busy(e):
+                    busy_stats["gave_up"] += 1
+                logger.exception("Write group of %d jobs failed", len(jobs))
+                for _, _, _, future in jobs:
+                    future.set_exception(e)
+                with self._lock:
+                    self._stats["failed_groups"] += 1
+                return
+
+        with self._lock:
+            self._stats["jobs"] += len(jobs)
+            self._stats["groups"] += 1
+            self._stats["failed_jobs"] += len(failed)
+            self._stats["max_group"] = max(self._stats["max_group"], len(jobs))
+            self._stats["commit_seconds"] += commit_seconds
+        for future, result in done:
+            future.set_result(result)
+        for future, error in failed:
+            future.set_exception(error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            groups = self._stats["groups"]
+            return {
+                "running": self._thread is not None,
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "queued": self._queue.qsize(),
+                **self._stats,
+                "avg_group": self._stats["jobs"] / groups if groups else None,
+            }
+
+
+_writer: GroupCommitWriter | None = None
+
+
+def start_writer() -> None:
+    global _writer
+    if SINGLE_WRITER and _writer is None:
+        _writer = GroupCommitWriter(os.getenv("DB_PATH", "projects.db"), WRITE_WINDOW, WRITE_MAX_BATCH)
+        _writer.start()
+
+
+def stop_writer() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.shutdown()
+        _writer = None
+
+
+def writer_stats() -> dict:
+    return _writer.stats() if _writer is not None else {"running": False}
+
+
+def _write_and_commit(con: sqlite3.Connection, fn, *args):
+    # an explicit transaction: the sqlite3 module would not open one before a
+    # SAVEPOINT, whose RELEASE would then commit; IMMEDIATE also takes the
+    # write lock up front instead of failing a read-to-write upgrade
+    con.execute("BEGIN IMMEDIATE")
+    result = fn(con, *args)
+    con.commit()
+    return result
+
+
+async def run_write(fn, *args):
+    # fn(con, *args) must not commit; it is committed with its group, or on
+    # its own pooled connection when DB_SINGLE_WRITER is off. Shard writes
+    # skip the writer: each shard has its own write lock.
+    if _writer is not None and current_shard() is None:
+        return await _writer.run(fn, *args)
+    return await run_db(_write_and_commit, fn, *args)
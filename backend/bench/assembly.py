@@ -0,0 +1,121 @@
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import secrets
+import time
+
+from app.db import open_connection
+from bench.common import percentile, scratch_db
+
+
+# -------- Project assembly benchmark --------
+def seed_account(db_path: str, tasks: int, projects: int, labels: int) -> str:
+    # a throwaway user (no usable password) with `tasks` tasks spread over
+    # `projects` projects, a note per ten tasks and up to two labels per
+    # task; returns a session token for it
+    con = open_connection(db_path)
+    try:
+        (user_id,) = con.execute(
+            "INSERT INTO user (username, password_hash) VALUES (?, '!') RETURNING id", (f"assembly-bench-{secrets.token_hex(4)}",)
+        ).fetchone()
+        project_ids = [
+            con.execute(
+                "INSERT INTO project (title, short_description, status, user_id) VALUES (?, 'assembly bench', 'active', ?) RETURNING id",
+                (f"project {p}", user_id),
+            ).fetchone()[0]
+            for p in range(projects)
+        ]
+        label_ids = [
+            con.execute("INSERT INTO label (user_id, name) VALUES (?, ?) RETURNING id", (user_id, f"label-{i}")).fetchone()[0]
+            for i in range(labels)
+        ]
+        for i in range(tasks):
+            (task_id,) = con.execute(
+                "INSERT INTO task (project_id, title, desc, status) VALUES (?, ?, ?, ?) RETURNING id",
+                (project_ids[i % projects], f"task {i}", f"description of task {i}", ("open", "in_progress", "done")[i % 3]),
+            ).fetchone()
+            if label_ids:
+                con.executemany(
+                    "INSERT INTO task_label (task_id, label_id, position) VALUES (?, ?, ?)",
+                    [(task_id, label_ids[(i + k) % len(label_ids)], k) for k in range(i % min(3, len(label_ids) + 1))],
+                )
+        con.executemany(
+            "INSERT INTO note (project_id, body) VALUES (?, ?)",
+            [(project_ids[i % projects], f"note {i}") for i in range(tasks // 10)],
+        )
+        token = secrets.token_urlsafe(32)
+        con.execute(
+            "INSERT INTO session (token, user_id, expires_at, created_at) VALUES (?, ?, '9999-12-31T00:00:00', ?)",
+            (token, user_id, datetime.utcnow().isoformat()),
+        )
+        con.commit()
+        return token
+    finally:
+        con.close()
+
+
+async def bench_assembly(db_path: str, sizes: list[int], projects: int, labels: int, requests: int, rounds: int) -> list[dict]:
+    # GET /getProjects in-process with PROJECTS_ASSEMBLY switched between
+    # build_projects ("python") and the JSON1 statement ("sql"), in
+    # alternating rounds; /getProjects has no payload cache, so every request
+    # assembles
+    import httpx
+
+    import app.main
+    from app.main import app as asgi_app
+
+    mode = app.main.PROJECTS_ASSEMBLY
+    results = []
+    async with asgi_app.router.lifespan_context(asgi_app):
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for tasks in sizes:
+                headers = {"Cookie": f"pb_session={seed_account(db_path, tasks, min(projects, max(1, tasks)), labels)}"}
+                latencies = {"python": [], "sql": []}
+                payloads = {}
+                for assembly in ("python", "sql"):  # warm-up
+                    app.main.PROJECTS_ASSEMBLY = assembly
+                    await client.get("/getProjects", headers=headers)
+                for _ in range(rounds):
+                    for assembly in ("python", "sql"):
+                        app.main.PROJECTS_ASSEMBLY = assembly
+                        for _ in range(requests):
+                            started = time.perf_counter()
+                            response = await client.get("/getProjects", headers=headers)
+                            latencies[assembly].append(time.perf_counter() - started)
+                            assert response.status_code == 200
+                        payloads[assembly] = response.content
+                # both paths must produce the same document
+                if json.loads(payloads["python"]) != json.loads(payloads["sql"]):
+                    raise RuntimeError(f"python and sql assembly disagree at {tasks} tasks")
+
+                entry = {"tasks": tasks, "payload_bytes": len(payloads["sql"])}
+                for assembly, samples in latencies.items():
+                    ordered = sorted(samples)
+                    entry[assembly] = {
+                        "requests": len(ordered),
+                        "p50_ms": percentile(ordered, 0.50) * 1e3,
+                        "p99_ms": percentile(ordered, 0.99) * 1e3,
+                    }
+                entry["p50_speedup"] = entry["python"]["p50_ms"] / entry["sql"]["p50_ms"]
+                results.append(entry)
+    app.main.PROJECTS_ASSEMBLY = mode
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.assembly")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10, 1000, 100_000], help="account sizes, in tasks")
+    parser.add_argument("--projects", type=int, default=10, help="projects per account")
+    parser.add_argument("--labels", type=int, default=8, help="labels per account")
+    parser.add_argument("--requests", type=int, default=10, help="requests per size, mode and round")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args(argv)
+    with scratch_db() as db_path:
+        results = asyncio.run(bench_assembly(db_path, args.tasks, args.projects, args.labels, args.requests, args.rounds))
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+import http.client
+import math
+import secrets
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import os
+
+
+# -------- Scratch database --------
+def check_empty(db_path: str, shard_dir: str) -> None:
+    # benchmarks add never-expiring sessions and, with DB_SHARDS, split the
+    # file; neither belongs in a database with real accounts in it
+    if os.path.isdir(shard_dir) and os.listdir(shard_dir):
+        raise SystemExit(f"{shard_dir} is not empty; point --db at a new file")
+    if not os.path.exists(db_path) or not os.path.getsize(db_path):
+        return
+    con = sqlite3.connect(db_path)
+    try:
+        tables = {name for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        used = any(con.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() for table in ("user", "project") if table in tables)
+    finally:
+        con.close()
+    if used:
+        raise SystemExit(f"{db_path} already has users or projects; point --db at a new file")
+
+
+@contextmanager
+def scratch_db(db_path: str | None = None):
+    # A migrated database of the benchmark's own: a temporary one removed on
+    # exit, or `db_path` (kept) if that is a new file. Whatever DB_PATH said
+    # is overridden, and the app reads it at import time, so this has to run
+    # before app.main, app.workers or app.shards are imported.
+    scratch = None if db_path else tempfile.TemporaryDirectory(prefix="projectboard-bench-")
+    db_path = os.path.abspath(db_path or os.path.join(scratch.name, "bench.db"))
+    shard_dir = os.path.join(os.path.dirname(db_path), "shards")
+    try:
+        check_empty(db_path, shard_dir)
+        os.environ["DB_PATH"] = db_path
+        os.environ["DB_SHARD_DIR"] = shard_dir
+        os.environ.setdefault("DEFAULT_ADMIN_USER", "bench-admin")
+        os.environ.setdefault("DEFAULT_ADMIN_PASSWORD", secrets.token_urlsafe(16))
+
+        from app.migrations import init_db
+
+        init_db()
+        yield db_path
+    finally:
+        if scratch:
+            scratch.cleanup()
+
+
+# -------- Results --------
+def percentile(ordered: list[float], q: float) -> float | None:
+    # nearest rank
+    if not ordered:
+        return None
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))]
+
+
+# -------- Servers --------
+def start_server(port: int, workers: int = 1) -> subprocess.Popen:
+    # uvicorn on the scratch database; with one worker the returned pid is
+    # the process serving requests
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env={**os.environ, "WEB_CONCURRENCY": str(workers)},
+    )
+
+
+def wait_until_up(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+# -------- Memory --------
+def proc_status(pid: int, field: str) -> int | None:
+    # a memory field of /proc/<pid>/status, in bytes: VmHWM is the peak
+    # resident set, RssAnon the current heap (RssFile, mmapped database
+    # pages, is bounded by DB_MMAP_SIZE)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import json
+import tracemalloc
+
+from app.events import SSE_HEARTBEAT, SSE_MAX_PENDING, Broker, Subscription
+
+
+# -------- Load test --------
+async def measure_idle_subscribers(count: int, users: int) -> dict:
+    # broker-side cost of idle connections: one subscription plus one parked
+    # task each, as the /events stream holds them (sockets and the ASGI
+    # server's own buffers come on top)
+    test_broker = Broker(max_pending=SSE_MAX_PENDING)
+
+    async def idle(sub: Subscription) -> None:
+        while True:
+            await sub.next(SSE_HEARTBEAT)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    subs = [test_broker.subscribe(i % users) for i in range(count)]
+    tasks = [asyncio.create_task(idle(sub)) for sub in subs]
+    await asyncio.sleep(0.1)
+    after, peak = tracemalloc.get_traced_memory()
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for user_id in range(users):
+        test_broker.publish(user_id, {"op": "delete", "entity": "task", "id": 1, "project_id": 1})
+    await asyncio.sleep(0)
+    fanout = loop.time() - started
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    tracemalloc.stop()
+    return {
+        "subscribers": count,
+        "users": users,
+        "bytes_total": after - before,
+        "bytes_per_subscriber": (after - before) / count,
+        "peak_bytes": peak,
+        "fanout_seconds": fanout,
+        "broker": test_broker.stats(),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.events")
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args(argv)
+    result = asyncio.run(measure_idle_subscribers(args.subscribers, args.users))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
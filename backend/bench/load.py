@@ -0,0 +1,374 @@
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import secrets
+import sqlite3
+import subprocess
+import time
+import os
+
+from app.db import open_connection
+from app.hashing import hash_password
+from app.transfer import next_rowid
+from bench.common import percentile, proc_status, reset_peak_rss, scratch_db, start_server, wait_until_up
+
+
+# Load scenarios against the real app, each a few requests the frontend
+# makes for one user action. Steady scenarios run for --seconds, bursts
+# fire --burst requests as fast as the clients can.
+SCENARIOS = ("landing", "project_open", "drag_storm", "login_burst", "signup_burst")
+BURSTS = {"login_burst", "signup_burst"}
+BENCH_PASSWORD = "Bench-pass-2024!"
+TASK_STATUSES = ("open", "in_progress", "done")
+# settings recorded with every result, so runs with different knobs are not
+# compared by accident
+RECORDED_ENV = ("DB_", "PROJECT", "HASH_", "SESSION_", "AUTH_", "METRICS_", "SERVER_TIMING", "WEB_CONCURRENCY")
+
+
+# -------- Synthetic data --------
+def seed_logins(db_path: str, prefix: str, count: int) -> list[str]:
+    # login bursts use each of these once, so the per-username limiter never
+    # sees the same name twice and the burst measures hashing
+    password_hash = hash_password(BENCH_PASSWORD)
+    usernames = [f"{prefix}-login-{n}" for n in range(count)]
+    con = open_connection(db_path)
+    try:
+        con.executemany("INSERT INTO user (username, password_hash) VALUES (?, ?)", [(name, password_hash) for name in usernames])
+        con.commit()
+    finally:
+        con.close()
+    return usernames
+
+
+def seed_dataset(db_path: str, users: int, projects: int, tasks: int, notes: int, labels: int, seed: int) -> dict:
+    # `users` accounts sharing one password hash, each with `projects`
+    # projects of `tasks` tasks and `notes` notes, `labels` labels per user
+    # with zero to two on every task, and a session token. Content comes
+    # from `seed`; usernames get a fresh prefix so a file can be seeded twice.
+    rng = random.Random(seed)
+    prefix = f"bench-{secrets.token_hex(3)}"
+    password_hash = hash_password(BENCH_PASSWORD)
+    accounts = []
+    con = open_connection(db_path)
+    try:
+        for u in range(users):
+            username = f"{prefix}-{u}"
+            (user_id,) = con.execute(
+                "INSERT INTO user (username, password_hash) VALUES (?, ?) RETURNING id", (username, password_hash)
+            ).fetchone()
+            label_ids = [
+                con.execute("INSERT INTO label (user_id, name) VALUES (?, ?) RETURNING id", (user_id, f"label-{i}")).fetchone()[0]
+                for i in range(labels)
+            ]
+            boards = {}
+            for p in range(projects):
+                (project_id,) = con.execute(
+                    "INSERT INTO project (title, short_description, status, user_id) VALUES (?, ?, 'active', ?) RETURNING id",
+                    (f"project {u}-{p}", "seeded for benchmarks", user_id),
+                ).fetchone()
+                first = next_rowid(con, "task")
+                con.executemany(
+                    "INSERT INTO task (project_id, title, desc, status) VALUES (?, ?, ?, ?)",
+                    [
+                        (project_id, f"task {p}-{i}", "lorem ipsum dolor sit amet" if rng.random() < 0.5 else None, rng.choice(TASK_STATUSES))
+                        for i in range(tasks)
+                    ],
+                )
+                con.executemany(
+                    "INSERT INTO task_label (task_id, label_id, position) VALUES (?, ?, ?)",
+                    [
+                        (first + i, label_id, position)
+                        for i in range(tasks)
+                        for position, label_id in enumerate(rng.sample(label_ids, min(len(label_ids), rng.choice((0, 0, 1, 2)))))
+                    ],
+                )
+                con.executemany(
+                    "INSERT INTO note (project_id, body) VALUES (?, ?)",
+                    [(project_id, f"note {p}-{i}") for i in range(notes)],
+                )
+                boards[project_id] = list(range(first, first + tasks))
+            token = secrets.token_urlsafe(32)
+            con.execute(
+                "INSERT INTO session (token, user_id, expires_at, created_at) VALUES (?, ?, '9999-12-31T00:00:00', ?)",
+                (token, user_id, datetime.utcnow().isoformat()),
+            )
+            con.commit()
+            accounts.append({"id": user_id, "username": username, "token": token, "projects": boards})
+    finally:
+        con.close()
+    return {"prefix": prefix, "accounts": accounts}
+
+
+# -------- Scenarios --------
+def session(account: dict) -> dict:
+    return {"Cookie": f"pb_session={account['token']}"}
+
+
+def client_address(n: int) -> dict:
+    # auth bursts come from many clients; the bench runs with
+    # TRUST_PROXY_HEADERS so each request has an address of its own
+    return {"X-Real-IP": f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"}
+
+
+def make_step(name: str, dataset: dict):
+    accounts = dataset["accounts"]
+    boards = [(account, project_id, task_ids) for account in accounts for project_id, task_ids in account["projects"].items()]
+
+    async def landing(client, index, n, rng):
+        headers = session(accounts[index % len(accounts)])
+        return [
+            (await client.get("/me", headers=headers)).status_code,
+            (await client.get("/getProjects", params={"view": "summary"}, headers=headers)).status_code,
+        ]
+
+    async def project_open(client, index, n, rng):
+        account = accounts[index % len(accounts)]
+        headers = session(account)
+        project_id = rng.choice(list(account["projects"]))
+        return [
+            (await client.get("/me", headers=headers)).status_code,
+            (await client.get(f"/getProject/{project_id}", headers=headers)).status_code,
+        ]
+
+    async def drag_storm(client, index, n, rng):
+        # every client keeps moving cards around one board
+        account, project_id, task_ids = boards[index % len(boards)]
+        if not task_ids:
+            return []
+        response = await client.patch(
+            f"/projects/{project_id}/tasks/{rng.choice(task_ids)}",
+            json={"status": rng.choice(TASK_STATUSES)},
+            headers=session(account),
+        )
+        return [response.status_code]
+
+    async def login_burst(client, index, n, rng):
+        logins = dataset["logins"]
+        response = await client.post(
+            "/login",
+            json={"username": logins[n % len(logins)], "password": BENCH_PASSWORD},
+            headers=client_address(n),
+        )
+        return [response.status_code]
+
+    async def signup_burst(client, index, n, rng):
+        response = await client.post(
+            "/signup",
+            json={"username": f"{dataset['prefix']}-signup-{n}", "password": BENCH_PASSWORD},
+            headers=client_address(n),
+        )
+        return [response.status_code]
+
+    return {
+        "landing": landing,
+        "project_open": project_open,
+        "drag_storm": drag_storm,
+        "login_burst": login_burst,
+        "signup_burst": signup_burst,
+    }[name]
+
+
+# -------- Load generator --------
+async def drive(client, step, clients: int, seconds: float | None, total: int | None, seed: int) -> dict:
+    # `clients` concurrent loops, each timing one scenario step at a time,
+    # until the deadline passes or `total` steps were started
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    issued = 0
+    deadline = time.perf_counter() + seconds if seconds else math.inf
+
+    async def loop(index: int) -> None:
+        nonlocal issued
+        rng = random.Random(seed * 100_003 + index)
+        while time.perf_counter() < deadline and (total is None or issued < total):
+            n = issued
+            issued += 1
+            started = time.perf_counter()
+            codes = await step(client, index, n, rng)
+            latencies.append(time.perf_counter() - started)
+            for code in codes:
+                statuses[code] = statuses.get(code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(loop(i) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    requests = sum(statuses.values())
+    return {
+        "clients": clients,
+        "seconds": elapsed,
+        "steps": len(latencies),
+        "requests": requests,
+        "errors": sum(count for code, count in statuses.items() if code >= 400),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "steps_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "requests_per_second": requests / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            name: (value * 1000 if value is not None else None)
+            for name, value in (
+                ("p50", percentile(latencies, 0.50)),
+                ("p95", percentile(latencies, 0.95)),
+                ("p99", percentile(latencies, 0.99)),
+                ("max", latencies[-1] if latencies else None),
+            )
+        },
+    }
+
+
+async def run_scenarios(client, pid: int, dataset: dict, args) -> list[dict]:
+    results = []
+    for name in args.scenarios:
+        # peak RSS is reset per scenario where the kernel allows it,
+        # otherwise it is the peak since the process started
+        reset_peak_rss(pid)
+        burst = name in BURSTS
+        result = await drive(
+            client,
+            make_step(name, dataset),
+            args.clients,
+            None if burst else args.seconds,
+            args.burst if burst else None,
+            args.seed,
+        )
+        results.append({"scenario": name, **result, "peak_rss_bytes": proc_status(pid, "VmHWM")})
+    return results
+
+
+async def bench_in_process(dataset: dict, args) -> list[dict]:
+    # the app and the load generator share this process and its event loop,
+    # so the peak RSS includes the client side
+    import httpx
+
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await run_scenarios(client, os.getpid(), dataset, args)
+
+
+async def bench_uvicorn(dataset: dict, args) -> list[dict]:
+    # one uvicorn worker, so the server pid is the process serving requests
+    import httpx
+
+    server = start_server(args.port)
+    try:
+        await asyncio.to_thread(wait_until_up, args.port)
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=60) as client:
+            return await run_scenarios(client, server.pid, dataset, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# -------- Reporting --------
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline: dict) -> None:
+    # ratios against an earlier run's output: above 1 is more throughput
+    # or higher latency than the baseline
+    before = {entry["scenario"]: entry for entry in baseline.get("scenarios", [])}
+    for entry in results:
+        old = before.get(entry["scenario"])
+        if not old:
+            continue
+        entry["vs_baseline"] = {
+            "requests_per_second": entry["requests_per_second"] / old["requests_per_second"] if old["requests_per_second"] else None,
+            **{
+                f"latency_{key}": entry["latency_ms"][key] / old["latency_ms"][key] if old["latency_ms"].get(key) else None
+                for key in ("p50", "p95", "p99")
+            },
+        }
+
+
+def bench(args) -> dict:
+    # settings the app reads at import time, so before it is imported
+    os.environ.setdefault("TRUST_PROXY_HEADERS", "true")
+    with scratch_db(args.db) as db_path:
+        return run_bench(db_path, args)
+
+
+def run_bench(db_path: str, args) -> dict:
+    from app.shards import SHARDED, split
+
+    started = time.perf_counter()
+    dataset = seed_dataset(db_path, args.users, args.projects, args.tasks, args.notes, args.labels, args.seed)
+    dataset["logins"] = seed_logins(db_path, dataset["prefix"], args.burst if "login_burst" in args.scenarios else 0)
+    if SHARDED:
+        split()
+    seed_seconds = time.perf_counter() - started
+
+    runner = bench_uvicorn if args.target == "uvicorn" else bench_in_process
+    results = asyncio.run(runner(dataset, args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    return {
+        "commit": git_commit(),
+        "target": args.target,
+        "db": args.db or "scratch",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "cpus": os.cpu_count(),
+        "env": {key: value for key, value in sorted(os.environ.items()) if key.startswith(RECORDED_ENV)},
+        "dataset": {
+            "users": args.users,
+            "projects_per_user": args.projects,
+            "tasks_per_project": args.tasks,
+            "notes_per_project": args.notes,
+            "labels_per_user": args.labels,
+            "seed": args.seed,
+            "seed_seconds": seed_seconds,
+        },
+        "scenarios": results,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.load")
+    parser.add_argument("--db", help="seed this new database file and keep it (default: a temporary one)")
+    parser.add_argument("--target", choices=("asgi", "uvicorn"), default="asgi", help="in-process ASGI client or a local uvicorn")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--projects", type=int, default=5, help="projects per user")
+    parser.add_argument("--tasks", type=int, default=50, help="tasks per project")
+    parser.add_argument("--notes", type=int, default=5, help="notes per project")
+    parser.add_argument("--labels", type=int, default=8, help="labels per user")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each steady scenario")
+    parser.add_argument("--burst", type=int, default=200, help="requests per login/signup burst")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--baseline", help="earlier JSON output to compare against")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args(argv)
+    if min(args.users, args.projects, args.clients) < 1:
+        parser.error("--users, --projects and --clients must be at least 1")
+
+    report = json.dumps(bench(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
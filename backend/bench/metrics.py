@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import json
+import math
+import time
+
+from app.metrics import metrics
+
+
+# -------- Overhead benchmark --------
+async def bench_overhead(requests: int, rounds: int) -> dict:
+    # per-request cost of the metrics middleware on the real app, measured
+    # in-process on GET / so the handler itself costs next to nothing
+    import httpx
+
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    best = {False: math.inf, True: math.inf}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(requests // 10):  # warm-up
+            await client.get("/")
+        # alternating rounds, best of each, so drift on a busy machine hits
+        # both sides alike
+        for _ in range(rounds):
+            for enabled in (False, True):
+                metrics.enabled = enabled
+                started = time.perf_counter()
+                for _ in range(requests):
+                    await client.get("/")
+                best[enabled] = min(best[enabled], (time.perf_counter() - started) / requests)
+    off, on = best[False], best[True]
+
+    # the middleware alone, around an ASGI app that only answers 200
+    from app.main import MetricsMiddleware
+
+    async def bare(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def discard(message):
+        pass
+
+    scope = {"type": "http", "method": "GET"}
+    wrapped = MetricsMiddleware(bare)
+    timings = {}
+    for name, target in (("bare", bare), ("wrapped", wrapped)):
+        started = time.perf_counter()
+        for _ in range(requests * 10):
+            await target(dict(scope), None, discard)
+        timings[name] = (time.perf_counter() - started) / (requests * 10)
+
+    return {
+        "requests": requests,
+        "us_per_request_metrics_off": off * 1e6,
+        "us_per_request_metrics_on": on * 1e6,
+        "us_overhead_per_request": (on - off) * 1e6,
+        "us_middleware_alone": (timings["wrapped"] - timings["bare"]) * 1e6,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.metrics")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(bench_overhead(args.requests, args.rounds)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import json
+import time
+
+from app.responses import FastJSONResponse
+
+
+# -------- Serialization benchmark --------
+def project_payload(tasks: int) -> dict:
+    # one project shaped like build_projects output
+    statuses = ("open", "in_progress", "done")
+    project = {
+        "id": 1,
+        "title": "bench",
+        "short_description": "short",
+        "description": "a longer description",
+        "github": None,
+        "website": None,
+        "status": "active",
+        "notes": [{"id": i, "desc": f"note {i}"} for i in range(tasks // 10)],
+        "open": [],
+        "in_progress": [],
+        "done": [],
+    }
+    for i in range(tasks):
+        status = statuses[i % 3]
+        project[status].append(
+            {
+                "id": i,
+                "title": f"task {i}",
+                "desc": "lorem ipsum dolor sit amet" if i % 2 else None,
+                "status": status,
+                "labels": ["bug", "ui"] if i % 3 == 0 else [],
+            }
+        )
+    return project
+
+
+def best_of(fn, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_serialization(tasks: int, rounds: int) -> dict:
+    # per-response cost of a /getProjects payload: FastAPI's response_model
+    # path versus handing the dicts to FastJSONResponse
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+
+    from app.main import ProjectModel
+
+    payload = [project_payload(tasks)]
+    field = create_model_field("response", list[ProjectModel], mode="serialization")
+
+    def response_model_path():
+        content = asyncio.run(serialize_response(field=field, response_content=payload))
+        return JSONResponse(content).body
+
+    timings = {
+        "response_model + json": best_of(response_model_path, rounds),
+        "json only": best_of(lambda: JSONResponse(payload).body, rounds),
+        "FastJSONResponse": best_of(lambda: FastJSONResponse(payload).body, rounds),
+    }
+    assert json.loads(response_model_path()) == json.loads(FastJSONResponse(payload).body)
+    per_10k = 10_000 / tasks
+    return {
+        "tasks": tasks,
+        "bytes": len(FastJSONResponse(payload).body),
+        "ms_per_10k_tasks": {name: seconds * 1000 * per_10k for name, seconds in timings.items()},
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.responses")
+    parser.add_argument("--tasks", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args(argv)
+    print(json.dumps(bench_serialization(args.tasks, args.rounds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from itertools import accumulate
+import argparse
+import json
+import random
+import secrets
+import string
+import time
+
+from app.db import open_connection
+from app.migrations import FTS_TABLES
+from app.search import search
+from bench.common import percentile, scratch_db
+
+
+# -------- Search index benchmark --------
+def seed_rows(db_path: str, rows: int, users: int, seed: int, chunk: int = 10_000) -> tuple[dict, float, int, list[str]]:
+    # `rows` indexed rows: 1% projects, 10% notes and the rest tasks, over
+    # `users` throwaway users (no usable password). The FTS triggers index
+    # them as they go in, like the app's own writes; the time spent in the
+    # INSERTs is returned, without generating the text.
+    rng = random.Random(seed)
+    # made-up words with Zipf-like frequencies, roughly like real text
+    vocabulary = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(20_000)]
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    def text(n: int) -> str:
+        return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=n))
+
+    projects = max(1, rows // 100)
+    notes = rows // 10
+    tasks = rows - projects - notes
+    inserting = 0.0
+    con = open_connection(db_path)
+    try:
+        prefix = f"search-bench-{secrets.token_hex(4)}"
+        user_ids = [
+            con.execute("INSERT INTO user (username, password_hash) VALUES (?, '!') RETURNING id", (f"{prefix}-{u}",)).fetchone()[0]
+            for u in range(users)
+        ]
+        project_rows = [(text(4), text(12), text(40), user_ids[p % users]) for p in range(projects)]
+        started = time.perf_counter()
+        project_ids = [
+            con.execute(
+                "INSERT INTO project (title, short_description, description, status, user_id) VALUES (?, ?, ?, 'active', ?) RETURNING id",
+                row,
+            ).fetchone()[0]
+            for row in project_rows
+        ]
+        inserting += time.perf_counter() - started
+        for table, count, sql, row in (
+            ("task", tasks, "INSERT INTO task (project_id, title, desc, status) VALUES (?, ?, ?, 'open')", lambda: (text(5), text(20))),
+            ("note", notes, "INSERT INTO note (project_id, body) VALUES (?, ?)", lambda: (text(30),)),
+        ):
+            for start in range(0, count, chunk):
+                batch = [(rng.choice(project_ids), *row()) for _ in range(min(chunk, count - start))]
+                started = time.perf_counter()
+                con.executemany(sql, batch)
+                inserting += time.perf_counter() - started
+        started = time.perf_counter()
+        con.commit()
+        inserting += time.perf_counter() - started
+    finally:
+        con.close()
+    return {"project": projects, "task": tasks, "note": notes}, inserting, user_ids[0], vocabulary
+
+
+def index_bytes(con, fts: str) -> int:
+    # the FTS table's shadow tables (_data, _idx, _docsize, _config)
+    (size,) = con.execute("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name LIKE ?", (f"{fts}%",)).fetchone()
+    return size
+
+
+def bench_search_index(db_path: str, rows: int, users: int, queries: int, seed: int) -> dict:
+    counts, seeded, user_id, vocabulary = seed_rows(db_path, rows, users, seed)
+
+    con = open_connection(db_path)
+    try:
+        tables = {}
+        for table, (fts, _) in FTS_TABLES.items():
+            # 'rebuild' is what the migration runs over an existing database;
+            # 'optimize' then merges the segments into one b-tree
+            started = time.perf_counter()
+            con.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            con.commit()
+            rebuilt = time.perf_counter() - started
+            started = time.perf_counter()
+            con.execute(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")
+            con.commit()
+            tables[table] = {
+                "rows": counts[table],
+                "rebuild_s": rebuilt,
+                "rows_per_s": counts[table] / rebuilt,
+                "optimize_s": time.perf_counter() - started,
+                "index_bytes": index_bytes(con, fts),
+            }
+
+        # /search's statement over the built index, for one user's share
+        latency = {}
+        terms = {"common word": vocabulary[0], "rare word": vocabulary[-1], "two-letter prefix": vocabulary[1][:2]}
+        for name, term in terms.items():
+            samples = []
+            for _ in range(queries):
+                started = time.perf_counter()
+                search(con, user_id, term, 20, 0)
+                samples.append(time.perf_counter() - started)
+            samples.sort()
+            latency[name] = {"term": term, "p50_ms": percentile(samples, 0.50) * 1e3, "p99_ms": percentile(samples, 0.99) * 1e3}
+    finally:
+        con.close()
+
+    return {
+        "rows": sum(counts.values()),
+        "users": users,
+        "seed_with_triggers_s": seeded,
+        "seed_rows_per_s": sum(counts.values()) / seeded,
+        "rebuild_s": sum(t["rebuild_s"] for t in tables.values()),
+        "tables": tables,
+        "search": latency,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.search")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="indexed rows across projects, tasks and notes")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=50, help="searches per term")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="seed and keep this new database file instead of a temporary one")
+    args = parser.parse_args(argv)
+    with scratch_db(args.db) as db_path:
+        print(json.dumps(bench_search_index(db_path, args.rows, args.users, args.queries, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import secrets
+import time
+
+from app.db import open_connection
+from bench.common import percentile, scratch_db
+
+
+# -------- Session cache benchmark --------
+def seed_session(db_path: str) -> str:
+    # a throwaway user (no usable password) and a session token for it
+    con = open_connection(db_path)
+    try:
+        (user_id,) = con.execute(
+            "INSERT INTO user (username, password_hash) VALUES (?, '!') RETURNING id", (f"session-bench-{secrets.token_hex(4)}",)
+        ).fetchone()
+        token = secrets.token_urlsafe(32)
+        con.execute(
+            "INSERT INTO session (token, user_id, expires_at, created_at) VALUES (?, ?, '9999-12-31T00:00:00', ?)",
+            (token, user_id, datetime.utcnow().isoformat()),
+        )
+        con.commit()
+        return token
+    finally:
+        con.close()
+
+
+async def bench_session_cache(db_path: str, paths: list[str], requests: int, rounds: int) -> dict:
+    # authenticated request latency in-process with require_user's session
+    # cache on and off, in alternating rounds so drift on a busy machine hits
+    # both sides alike
+    import httpx
+
+    from app.db import count_statements
+    from app.main import app
+    from app.metrics import metrics
+    from app.sessions import session_cache
+
+    headers = {"Cookie": f"pb_session={seed_session(db_path)}"}
+    size = session_cache.max_size
+    # with metrics on the middleware installs a counter per request and this
+    # one would see nothing; it would cost both modes the same anyway
+    metrics.enabled = False
+    latencies = {(path, enabled): [] for path in paths for enabled in (False, True)}
+    statements = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path in paths:
+                for _ in range(requests // 10):  # warm-up
+                    assert (await client.get(path, headers=headers)).status_code == 200
+            for _ in range(rounds):
+                for enabled in (False, True):
+                    # max_size 0 turns the cache off; it comes back empty
+                    session_cache.clear()
+                    session_cache.max_size = size if enabled else 0
+                    for path in paths:
+                        with count_statements() as counter:
+                            for _ in range(requests):
+                                started = time.perf_counter()
+                                await client.get(path, headers=headers)
+                                latencies[(path, enabled)].append(time.perf_counter() - started)
+                        statements[(path, enabled)] = counter.statements / requests
+    session_cache.max_size = size
+
+    results = []
+    for path in paths:
+        entry = {"path": path}
+        for enabled in (False, True):
+            ordered = sorted(latencies[(path, enabled)])
+            entry["cache_on" if enabled else "cache_off"] = {
+                "requests": len(ordered),
+                "sql_statements_per_request": statements[(path, enabled)],
+                "p50_us": percentile(ordered, 0.50) * 1e6,
+                "p99_us": percentile(ordered, 0.99) * 1e6,
+                "mean_us": sum(ordered) / len(ordered) * 1e6,
+            }
+        entry["p50_speedup"] = entry["cache_off"]["p50_us"] / entry["cache_on"]["p50_us"]
+        results.append(entry)
+    return {"session_cache": session_cache.stats(), "results": results}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.sessions")
+    parser.add_argument("--paths", nargs="+", default=["/me", "/labels"], help="authenticated GETs to time")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per path, mode and round")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args(argv)
+    with scratch_db() as db_path:
+        print(json.dumps(asyncio.run(bench_session_cache(db_path, args.paths, args.requests, args.rounds)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench.common import percentile, scratch_db
+
+
+# -------- Startup benchmark --------
+async def first_request() -> dict:
+    # runs in a fresh interpreter: importing the app, the lifespan startup
+    # (migrations, pools, writer) and the first response, each timed
+    started = time.perf_counter()
+    import httpx
+
+    from app.main import app
+
+    imported = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/")
+        answered = time.perf_counter()
+    if response.status_code != 200:
+        raise RuntimeError(f"GET / returned {response.status_code}")
+    return {"import_s": imported - started, "startup_s": ready - imported, "first_request_s": answered - ready}
+
+
+def probe(db_path: str) -> dict:
+    env = {**os.environ, "DB_PATH": db_path, "DB_SHARD_DIR": os.path.join(os.path.dirname(db_path), "shards")}
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-m", "bench.startup", "--probe"], env=env, check=True, capture_output=True, text=True).stdout
+    return {**json.loads(out), "process_s": time.perf_counter() - started}
+
+
+def bench_startup(db_path: str, runs: int) -> dict:
+    # "migrated" starts against an up-to-date database, the single
+    # schema_version read every worker start should cost; "fresh" against a
+    # new file each time, paying for every migration step and the admin hash
+    samples = {"fresh": [], "migrated": []}
+    scratch = os.path.dirname(db_path)
+    for run in range(runs):
+        fresh = os.path.join(scratch, f"fresh-{run}", "bench.db")
+        os.makedirs(os.path.dirname(fresh))
+        samples["fresh"].append(probe(fresh))
+        samples["migrated"].append(probe(db_path))
+
+    results = {"runs": runs}
+    for mode, probes in samples.items():
+        results[mode] = {}
+        for field in ("import_s", "startup_s", "first_request_s", "process_s"):
+            ordered = sorted(sample[field] for sample in probes)
+            results[mode][field] = {"p50": percentile(ordered, 0.50), "max": ordered[-1]}
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.startup")
+    parser.add_argument("--runs", type=int, default=10, help="fresh processes per mode")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.probe:
+        print(json.dumps(asyncio.run(first_request())))
+        return
+    with scratch_db() as db_path:
+        print(json.dumps(bench_startup(db_path, args.runs), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+from datetime import datetime
+import argparse
+import http.client
+import json
+import secrets
+import tempfile
+import time
+
+from app.db import open_connection
+from app.transfer import next_rowid
+from bench.common import proc_status, reset_peak_rss, scratch_db, start_server, wait_until_up
+
+
+# -------- Round trip benchmark --------
+def seed_account(db_path: str, username: str, projects: int, tasks: int) -> tuple[int, str]:
+    # a user with `tasks` tasks spread over `projects` projects, a third of
+    # them labelled, one note per ten tasks, plus a session token; only ever
+    # on the scratch database, since neither the user nor the token is removed
+    con = open_connection(db_path)
+    try:
+        (user_id,) = con.execute(
+            "INSERT INTO user (username, password_hash) VALUES (?, '!') RETURNING id", (username,)
+        ).fetchone()
+        per_project = max(1, tasks // projects)
+        label_ids = [
+            con.execute("INSERT INTO label (user_id, name) VALUES (?, ?) RETURNING id", (user_id, name)).fetchone()[0]
+            for name in ("bug", "feature", "chore")
+        ]
+        for p in range(projects):
+            (project_id,) = con.execute(
+                "INSERT INTO project (title, status, user_id) VALUES (?, 'active', ?) RETURNING id",
+                (f"project {p}", user_id),
+            ).fetchone()
+            first = next_rowid(con, "task")
+            con.executemany(
+                "INSERT INTO task (project_id, title, desc, status) VALUES (?, ?, ?, ?)",
+                [
+                    (project_id, f"task {p}-{i}", "lorem ipsum dolor sit amet" if i % 2 else None, ("open", "in_progress", "done")[i % 3])
+                    for i in range(per_project)
+                ],
+            )
+            con.executemany(
+                "INSERT INTO task_label (task_id, label_id, position) VALUES (?, ?, 0)",
+                [(first + i, label_ids[i % 3]) for i in range(0, per_project, 3)],
+            )
+            con.executemany(
+                "INSERT INTO note (project_id, body) VALUES (?, ?)",
+                [(project_id, f"note {p}-{i}") for i in range(per_project // 10)],
+            )
+            con.commit()
+        token = secrets.token_urlsafe(32)
+        con.execute(
+            "INSERT INTO session (token, user_id, expires_at, created_at) VALUES (?, ?, '9999-12-31T00:00:00', ?)",
+            (token, user_id, datetime.utcnow().isoformat()),
+        )
+        con.commit()
+        return user_id, token
+    finally:
+        con.close()
+
+
+def bench_round_trip(db_path: str, projects: int, tasks: int, port: int) -> dict:
+    started = time.perf_counter()
+    suffix = secrets.token_hex(4)
+    _, source = seed_account(db_path, f"export-{suffix}", projects, tasks)
+    _, target = seed_account(db_path, f"import-{suffix}", 1, 0)
+    seed_seconds = time.perf_counter() - started
+
+    server = start_server(port)
+    try:
+        wait_until_up(port)
+        idle_rss = proc_status(server.pid, "VmHWM")
+
+        with tempfile.TemporaryFile() as dump:
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            started = time.perf_counter()
+            conn.request("GET", "/export", headers={"Cookie": f"pb_session={source}"})
+            response = conn.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"GET /export returned {response.status}")
+            while block := response.read(1 << 16):
+                dump.write(block)
+            export_seconds = time.perf_counter() - started
+            export_bytes = dump.tell()
+            export_rss = proc_status(server.pid, "VmHWM")
+            export_anon = proc_status(server.pid, "RssAnon")
+
+            per_phase = reset_peak_rss(server.pid)
+            dump.seek(0)
+
+            def body():
+                while block := dump.read(1 << 16):
+                    yield block
+
+            started = time.perf_counter()
+            conn.request(
+                "POST",
+                "/import",
+                body=body(),
+                headers={"Cookie": f"pb_session={target}", "Content-Type": "application/x-ndjson"},
+                encode_chunked=True,
+            )
+            response = conn.getresponse()
+            result = json.loads(response.read())
+            if response.status != 200:
+                raise RuntimeError(f"POST /import returned {response.status}: {result}")
+            import_seconds = time.perf_counter() - started
+            import_rss = proc_status(server.pid, "VmHWM")
+            import_anon = proc_status(server.pid, "RssAnon")
+            conn.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    mb = 1024 * 1024
+    rows = result["projects"] + result["tasks"] + result["notes"]
+    return {
+        "projects": result["projects"],
+        "tasks": result["tasks"],
+        "notes": result["notes"],
+        "complete": result["complete"],
+        "seed_seconds": seed_seconds,
+        "export_seconds": export_seconds,
+        "export_mb": export_bytes / mb,
+        "export_rows_per_second": rows / export_seconds,
+        "import_seconds": import_seconds,
+        "import_rows_per_second": rows / import_seconds,
+        "server_rss_idle_mb": idle_rss / mb if idle_rss else None,
+        "server_peak_rss_export_mb": export_rss / mb if export_rss else None,
+        # without clear_refs support this is the peak since server start
+        "server_peak_rss_import_mb": import_rss / mb if import_rss else None,
+        "import_peak_is_per_phase": per_phase,
+        "server_heap_after_export_mb": export_anon / mb if export_anon else None,
+        "server_heap_after_import_mb": import_anon / mb if import_anon else None,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.transfer")
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--projects", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", help="seed this new database file and keep it (default: a temporary one)")
+    args = parser.parse_args(argv)
+    with scratch_db(args.db) as db_path:
+        print(json.dumps(bench_round_trip(db_path, args.projects, args.tasks, args.port), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+from datetime import datetime
+import argparse
+import http.client
+import json
+import multiprocessing
+import secrets
+import time
+import os
+
+from app.db import open_connection
+from bench.common import scratch_db, start_server, wait_until_up
+
+
+# -------- Read scaling benchmark --------
+def seed_bench_data(db_path: str, tasks: int) -> tuple[str, int]:
+    # a throwaway user (no usable password) with one project and a session
+    # token; never the admin, whose token would outlive the benchmark
+    con = open_connection(db_path)
+    try:
+        (user_id,) = con.execute(
+            "INSERT INTO user (username, password_hash) VALUES (?, '!') RETURNING id", (f"read-bench-{secrets.token_hex(4)}",)
+        ).fetchone()
+        (project_id,) = con.execute(
+            "INSERT INTO project (title, status, user_id) VALUES ('read bench', 'active', ?) RETURNING id",
+            (user_id,),
+        ).fetchone()
+        con.executemany(
+            "INSERT INTO task (project_id, title, status) VALUES (?, ?, ?)",
+            [(project_id, f"task {i}", ("open", "in_progress", "done")[i % 3]) for i in range(tasks)],
+        )
+        token = secrets.token_urlsafe(32)
+        con.execute(
+            "INSERT INTO session (token, user_id, expires_at, created_at) VALUES (?, ?, '9999-12-31T00:00:00', ?)",
+            (token, user_id, datetime.utcnow().isoformat()),
+        )
+        con.commit()
+        return token, project_id
+    finally:
+        con.close()
+
+
+def hammer(port: int, path: str, cookie: str, seconds: float) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {"Cookie": f"pb_session={cookie}"}
+    done = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"GET {path} returned {response.status}")
+        done += 1
+    conn.close()
+    return done
+
+
+def bench_reads(db_path: str, worker_counts: list[int], clients: int, seconds: float, tasks: int, port: int) -> list[dict]:
+    token, project_id = seed_bench_data(db_path, tasks)
+    path = f"/getProject/{project_id}"
+
+    results = []
+    for workers in worker_counts:
+        server = start_server(port, workers)
+        try:
+            wait_until_up(port)
+            with multiprocessing.Pool(clients) as pool:
+                counts = pool.starmap(hammer, [(port, path, token, seconds)] * clients)
+        finally:
+            server.terminate()
+            server.wait()
+        total = sum(counts)
+        results.append({"workers": workers, "clients": clients, "requests": total, "requests_per_second": total / seconds})
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--tasks", type=int, default=50, help="tasks in the benchmarked project")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", help="seed this new database file and keep it (default: a temporary one)")
+    args = parser.parse_args(argv)
+    with scratch_db(args.db) as db_path:
+        results = bench_reads(db_path, args.workers, args.clients, args.seconds, args.tasks, args.port)
+    print(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
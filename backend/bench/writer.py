@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+
+from app.writer import run_write, start_writer, stop_writer, writer_stats
+from bench.common import scratch_db
+
+
+# -------- Throughput --------
+async def measure_add_task(clients: int, per_client: int) -> dict:
+    # add_task's write path through run_write with `clients` concurrent callers
+    from app.main import insert_task
+
+    def setup(con: sqlite3.Connection) -> tuple[int, int]:
+        cur = con.cursor()
+        cur.execute("SELECT id FROM user ORDER BY id LIMIT 1")
+        user_id = cur.fetchone()["id"]
+        cur.execute(
+            "INSERT INTO project (title, status, user_id) VALUES (?, 'active', ?) RETURNING id",
+            (f"write bench {clients}", user_id),
+        )
+        return user_id, cur.fetchone()["id"]
+
+    user_id, project_id = await run_write(setup)
+    latencies: list[float] = []
+
+    async def client(n: int) -> None:
+        for i in range(per_client):
+            started = time.perf_counter()
+            await run_write(insert_task, user_id, project_id, {"title": f"task {n}-{i}"})
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    def cleanup(con: sqlite3.Connection) -> None:
+        con.execute("DELETE FROM project WHERE id = ?", (project_id,))
+
+    await run_write(cleanup)
+    latencies.sort()
+    return {
+        "clients": clients,
+        "writes": len(latencies),
+        "writes_per_second": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+async def _bench(clients: list[int], writes: int) -> list[dict]:
+    from app.db import close_pool, open_pool
+
+    open_pool()
+    start_writer()
+    try:
+        results = []
+        for n in clients:
+            result = await measure_add_task(n, max(1, writes // n))
+            result["writer"] = writer_stats()
+            results.append(result)
+        return results
+    finally:
+        stop_writer()
+        close_pool()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.writer")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--writes", type=int, default=2048, help="total writes per run")
+    args = parser.parse_args(argv)
+    with scratch_db():
+        print(json.dumps(asyncio.run(_bench(args.clients, args.writes)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import secrets
+import tempfile
+
+# The app reads its settings at import time, so they are set before any test
+# module imports it: a scratch database, auth limits no test run reaches, and
+# none of the request-scoped statement counters (metrics, tracing, timing),
+# so a test's own count_statements sees every statement a request runs.
+SCRATCH = tempfile.mkdtemp(prefix="projectboard-tests-")
+os.environ.update({
+    "DB_PATH": os.path.join(SCRATCH, "test.db"),
+    "DB_SHARD_DIR": os.path.join(SCRATCH, "shards"),
+    "DEFAULT_ADMIN_USER": "admin",
+    "DEFAULT_ADMIN_PASSWORD": "Admin-pass-123!",
+    "AUTH_BURST_PER_IP": "1000",
+    "AUTH_BURST_PER_USERNAME": "1000",
+    "METRICS_ENABLED": "false",
+    "DB_TRACE": "false",
+    "SERVER_TIMING": "false",
+    "SESSION_SLIDING": "false",
+    "SESSION_CACHE_SIZE": "10000",
+    "SESSION_CACHE_TTL": "60",
+})
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+PASSWORD = "Test-pass-2024!"
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client():
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+
+async def login(client: httpx.AsyncClient) -> dict:
+    # a new account; returns the headers that carry its session, leaving the
+    # client's own cookie jar empty so accounts do not mix
+    username = f"user-{secrets.token_hex(4)}"
+    response = await client.post("/signup", json={"username": username, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    token = response.cookies["pb_session"]
+    client.cookies.clear()
+    return {"Cookie": f"pb_session={token}"}
+
+
+@pytest.fixture
+async def user(client):
+    return await login(client)
+
+
+@pytest.fixture
+async def other_user(client):
+    return await login(client)
+
+
+@pytest.fixture
+async def board(client, user) -> dict:
+    # a project of the user's with one task and one note
+    project = (await client.post("/addProject/", json={"title": "board", "status": "active"}, headers=user)).json()["id"]
+    task = (await client.post(f"/projects/{project}/tasks", json={"title": "task"}, headers=user)).json()["id"]
+    note = (await client.post(f"/projects/{project}/notes", json={"desc": "note"}, headers=user)).json()["id"]
+    return {"project": project, "task": task, "note": note}
@@ -0,0 +1,38 @@
+import pytest
+
+from app.db import count_statements, open_connection
+from app.maintenance import query_plan
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("path", ["/getProjects", "/getProjects?view=summary", "/getProject/{project}"])
+async def test_not_modified_costs_one_indexed_lookup(client, user, board, path):
+    path = path.format(**board)
+    await client.get("/me", headers=user)
+    first = await client.get(path, headers=user)
+    assert first.status_code == 200
+
+    with count_statements(record=True) as counter:
+        response = await client.get(path, headers={**user, "If-None-Match": first.headers["etag"]})
+    assert response.status_code == 304
+    assert response.headers["etag"] == first.headers["etag"]
+    assert counter.statements == 1, counter.recorded
+
+    con = open_connection()
+    try:
+        plan = query_plan(con, counter.recorded[0])
+    finally:
+        con.close()
+    assert len(plan) == 1 and plan[0].startswith("SEARCH ") and " USING " in plan[0], plan
+
+
+async def test_write_changes_the_etag(client, user, board):
+    before = await client.get(f"/getProject/{board['project']}", headers=user)
+    await client.patch(f"/projects/{board['project']}/tasks/{board['task']}", json={"status": "done"}, headers=user)
+
+    with count_statements() as counter:
+        response = await client.get(f"/getProject/{board['project']}", headers={**user, "If-None-Match": before.headers["etag"]})
+    assert response.status_code == 200
+    assert response.headers["etag"] != before.headers["etag"]
+    assert counter.statements > 1
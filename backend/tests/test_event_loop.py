@@ -0,0 +1,68 @@
+import asyncio
+import secrets
+import time
+
+import pytest
+
+from app.hashing import hash_password
+
+pytestmark = pytest.mark.anyio
+
+LOGINS = 8
+READS = 32
+TICK = 0.005
+
+
+async def worst_lag(stop: asyncio.Event) -> float:
+    # how late a short sleep wakes up: anything that blocks the loop shows
+    # up here in full
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK)
+        worst = max(worst, loop.time() - started - TICK)
+    return worst
+
+
+def hash_seconds() -> float:
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        hash_password("Lag-pass-2024!")
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def test_logins_and_reads_do_not_block_the_loop(client, user, board):
+    operations = [{"op": "create", "entity": "task", "data": {"title": f"task {i}", "labels": ["bug"]}} for i in range(100)]
+    for _ in range(3):
+        await client.post(f"/projects/{board['project']}/batch", json={"operations": operations}, headers=user)
+    username, password = f"lag-{secrets.token_hex(4)}", "Lag-pass-2024!"
+    await client.post("/signup", json={"username": username, "password": password})
+    client.cookies.clear()
+
+    async def login():
+        return (await client.post("/login", json={"username": username, "password": password})).status_code
+
+    async def read():
+        return (await client.get("/getProjects", headers=user)).status_code
+
+    # starts every hash worker process before the clock runs
+    await asyncio.gather(*(login() for _ in range(LOGINS)))
+
+    # one scrypt run inline stalls the loop for at least this long; with
+    # logins hashing in the process pool and reads on DB threads it has to
+    # stay under it
+    bound = hash_seconds()
+    stop = asyncio.Event()
+    lag = asyncio.create_task(worst_lag(stop))
+    try:
+        statuses = await asyncio.gather(*(login() for _ in range(LOGINS)), *(read() for _ in range(READS)))
+    finally:
+        stop.set()
+    worst = await lag
+    client.cookies.clear()
+
+    assert set(statuses) == {200}
+    assert worst < bound, f"event loop stalled for {worst * 1000:.1f}ms (bound {bound * 1000:.1f}ms)"
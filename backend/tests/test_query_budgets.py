@@ -0,0 +1,56 @@
+import pytest
+
+from app.db import count_statements
+from app.main import PROJECTS_ASSEMBLY
+from app.sessions import session_cache
+
+pytestmark = pytest.mark.anyio
+
+SQL_ASSEMBLY = PROJECTS_ASSEMBLY == "sql"
+
+# Upper bound on SQL statements per request with the session cache warm: the
+# write and its savepoint (or BEGIN/COMMIT without the single writer) for
+# mutations, three more when a task write sets labels; the version check and
+# the payload for reads. The python assembly path reads projects, tasks,
+# notes and labels separately; ?view=summary counts tasks and notes in two
+# statements of its own.
+BUDGETS = [
+    ("POST", "/addProject/", {"title": "new", "status": "idea"}, 3),
+    ("PATCH", "/projects/{project}", {"title": "renamed"}, 3),
+    ("DELETE", "/projects/{project}", None, 3),
+    ("POST", "/projects/{project}/tasks", {"title": "new"}, 3),
+    ("POST", "/projects/{project}/tasks", {"title": "new", "labels": ["bug", "ui"]}, 6),
+    ("PATCH", "/projects/{project}/tasks/{task}", {"status": "done"}, 3),
+    ("PATCH", "/projects/{project}/tasks/{task}", {"labels": ["chore"]}, 6),
+    ("DELETE", "/projects/{project}/tasks/{task}", None, 3),
+    ("POST", "/projects/{project}/notes", {"desc": "new"}, 3),
+    ("PATCH", "/projects/{project}/notes/{note}", {"desc": "edited"}, 3),
+    ("DELETE", "/projects/{project}/notes/{note}", None, 3),
+    ("GET", "/getProject/{project}", None, 2 if SQL_ASSEMBLY else 5),
+    ("GET", "/getProjects", None, 2 if SQL_ASSEMBLY else 5),
+    ("GET", "/getProjects?view=summary", None, 4),
+]
+
+
+@pytest.mark.parametrize(
+    ("method", "path", "body", "budget"),
+    BUDGETS,
+    ids=[f"{method} {path}{' labels' if body and 'labels' in body else ''}" for method, path, body, _ in BUDGETS],
+)
+async def test_statement_budget(client, user, board, method, path, body, budget):
+    await client.get("/me", headers=user)
+    with count_statements() as counter:
+        response = await client.request(method, path.format(**board), json=body, headers=user)
+    assert response.status_code == 200, response.text
+    assert counter.statements <= budget, f"{method} {path} ran {counter.statements} SQL statements (budget {budget})"
+
+
+async def test_session_cache_miss_adds_one_lookup(client, user):
+    await client.get("/me", headers=user)
+    with count_statements() as warm:
+        await client.get("/getProjects", headers=user)
+
+    session_cache.clear()
+    with count_statements() as cold:
+        await client.get("/getProjects", headers=user)
+    assert cold.statements == warm.statements + 1
@@ -0,0 +1,79 @@
+import secrets
+
+import pytest
+
+from app.changes import compact_once
+from app.db import EXPLAINABLE, count_statements, mask_literals, open_connection
+from app.maintenance import query_plan, reap_once, table_scans
+
+pytestmark = pytest.mark.anyio
+
+# one row per AUTOINCREMENT table and no index to use
+SCANNABLE = ("SCAN sqlite_sequence",)
+
+
+async def exercise_api(client) -> None:
+    # every endpoint the frontend and the import/export tooling call, with the
+    # label filters, pagination and summary variants of the project reads
+    username, password = f"plans-{secrets.token_hex(4)}", "Plans-pass-2024!"
+    await client.post("/signup", json={"username": username, "password": password})
+    client.cookies.clear()
+    response = await client.post("/login", json={"username": username, "password": password})
+    user = {"Cookie": f"pb_session={response.cookies['pb_session']}"}
+    client.cookies.clear()
+
+    await client.get("/me", headers=user)
+    project = (await client.post("/addProject/", json={"title": "plans", "status": "active"}, headers=user)).json()["id"]
+    await client.patch(f"/projects/{project}", json={"title": "plans, renamed"}, headers=user)
+    task = (await client.post(f"/projects/{project}/tasks", json={"title": "task", "labels": ["bug", "ui"]}, headers=user)).json()["id"]
+    await client.patch(f"/projects/{project}/tasks/{task}", json={"status": "done", "labels": ["chore"]}, headers=user)
+    note = (await client.post(f"/projects/{project}/notes", json={"desc": "note"}, headers=user)).json()["id"]
+    await client.patch(f"/projects/{project}/notes/{note}", json={"desc": "edited"}, headers=user)
+    await client.post(
+        f"/projects/{project}/batch",
+        json={"operations": [
+            {"op": "create", "entity": "task", "data": {"title": "batched", "labels": ["bug"]}},
+            {"op": "update", "entity": "task", "id": task, "data": {"title": "renamed"}},
+            {"op": "create", "entity": "note", "data": {"desc": "batched"}},
+        ]},
+        headers=user,
+    )
+    for params in ({}, {"view": "summary"}, {"label": "bug"}, {"limit": 1}, {"view": "summary", "label": "bug"}):
+        await client.get("/getProjects", params=params, headers=user)
+    await client.get(f"/getProject/{project}", headers=user)
+    await client.get(f"/getProject/{project}", params={"label": "chore"}, headers=user)
+    await client.get("/labels", headers=user)
+    await client.get("/changes", params={"since": 0}, headers=user)
+    await client.get("/search", params={"q": "batched"}, headers=user)
+    dump = (await client.get("/export", headers=user)).content
+    await client.post("/import", content=dump, headers={**user, "Content-Type": "application/x-ndjson"})
+    await client.delete(f"/projects/{project}/notes/{note}", headers=user)
+    await client.delete(f"/projects/{project}/tasks/{task}", headers=user)
+    await client.delete(f"/projects/{project}", headers=user)
+    await client.post("/logout", headers=user)
+
+
+async def test_no_table_scans(client):
+    # the statements the endpoints and background jobs really run, parameters
+    # filled in by the trace callback, each explained once
+    with count_statements(record=True) as counter:
+        await exercise_api(client)
+        await reap_once()
+        await compact_once()
+
+    statements = {}
+    for sql in counter.recorded:
+        if sql.lstrip().upper().startswith(EXPLAINABLE):
+            statements.setdefault(mask_literals(sql), sql)
+    assert len(statements) > 40
+
+    con = open_connection()
+    try:
+        scans = {
+            masked: found
+            for masked, sql in statements.items()
+            if (found := [detail for detail in table_scans(query_plan(con, sql)) if detail not in SCANNABLE])
+        }
+    finally:
+        con.close()
+    assert not scans, scans
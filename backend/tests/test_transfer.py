@@ -0,0 +1,30 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def without_ids(projects: list[dict]) -> list[dict]:
+    return [
+        {
+            **{key: value for key, value in project.items() if key != "id"},
+            **{key: [{k: v for k, v in item.items() if k != "id"} for item in project[key]] for key in ("notes", "open", "in_progress", "done")},
+        }
+        for project in projects
+    ]
+
+
+async def test_export_imports_back(client, user, other_user, board):
+    # PATCH stores an empty note body; the export of it has to import
+    response = await client.patch(f"/projects/{board['project']}/notes/{board['note']}", json={"desc": ""}, headers=user)
+    assert response.status_code == 200
+    exported = await client.get("/export", headers=user)
+    assert exported.status_code == 200
+
+    response = await client.post("/import", content=exported.content, headers=other_user)
+    assert response.status_code == 200, response.text
+    assert response.json()["complete"]
+
+    original = (await client.get("/getProjects", headers=user)).json()
+    imported = (await client.get("/getProjects", headers=other_user)).json()
+    assert without_ids(imported) == without_ids(original)
+    assert imported[0]["notes"][0]["desc"] == ""